@@ -0,0 +1,266 @@
+"""
+Benchmarks the Places client against a local stub server (see
+stubserver.py) and writes the results as JSON, so that they can be
+compared between releases:
+
+    python bench/run.py -o bench-results.json
+    python bench/run.py -o new.json --compare bench-results.json
+
+Each scenario runs in its own child process so that its peak memory
+(ru_maxrss) isn't muddled by the others or by the stub server, which
+runs in the parent. Each one runs for --ops operations or for
+--max-seconds, whichever comes first.
+"""
+import json, optparse, os, platform, resource, subprocess, sys, time
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmark the client in this tree rather than any installed one.
+# Importing pkg_resources afterwards makes the simplegeo namespace
+# package pick it up.
+sys.path.insert(0, os.path.dirname(BENCHDIR))
+import pkg_resources
+
+from stubserver import StubPlacesServer
+
+LAT, LON = 37.7749, -122.4194
+ADDRESS = '41 Decatur St, San Francisco, CA'
+
+# The scenarios whose cost depends on how many features a search returns.
+SEARCH_SCENARIOS = ['search', 'search_compact', 'search_by_ip', 'search_by_my_ip', 'search_by_address', 'iter_search', 'decode_decimal', 'decode_fast', 'decode_float']
+WRITE_SCENARIOS = ['add_feature', 'add_features', 'update_features', 'delete_features']
+SCENARIOS = SEARCH_SCENARIOS + WRITE_SCENARIOS
+
+def _percentile(sortedvals, p):
+    if not sortedvals:
+        return None
+    return sortedvals[min(len(sortedvals) - 1, int(p / 100.0 * len(sortedvals)))]
+
+def _one_at_a_time(func, ops, max_seconds):
+    """ Call func() up to ops times, and return the latency of each
+    call and the number of calls which raised APIError. """
+    from simplegeo.places import APIError
+    latencies = []
+    errors = 0
+    deadline = time.time() + max_seconds
+    while len(latencies) < ops and (not latencies or time.time() < deadline):
+        started = time.time()
+        try:
+            func()
+        except APIError:
+            errors += 1
+        latencies.append(time.time() - started)
+    return latencies, errors
+
+def _new_features(n):
+    from simplegeo.places import Feature
+    for i in range(n):
+        yield Feature((LAT, LON), properties={'name': 'Benchmark place %d' % (i,), 'tags': ['bench']})
+
+def _codec(name):
+    from simplegeo.places.codec import DecimalCodec, FastCodec
+    if name == 'decimal':
+        return DecimalCodec()
+    if name == 'fast':
+        return FastCodec()
+    if name == 'float':
+        return FastCodec(floats=True)
+    raise ValueError("No codec named %r" % (name,))
+
+def _handles(n):
+    return ['SG_%022d' % (i,) for i in range(n)]
+
+def run_scenario(scenario, port, ops, concurrency, max_seconds, codec='decimal'):
+    from simplegeo.places import Client, Feature
+    client = Client('key', 'secret', host='127.0.0.1', port=port, max_connections=concurrency, codec=_codec(codec))
+
+    latencies = None
+    errors = 0
+    extra = {}
+    if scenario.startswith('decode_'):
+        # Time only the decoding of a search response, with each codec.
+        codec = scenario[len('decode_'):]
+        decode = _codec(codec).decode
+        body = client.http.request(client._search_endpoint(LAT, LON, None, None, None))[1]
+        extra['response_bytes'] = len(body)
+        extra['features_decoded'] = len(decode(body)['features'])
+    started = time.time()
+    if scenario.startswith('decode_'):
+        latencies, errors = _one_at_a_time(lambda: decode(body), ops, max_seconds)
+    elif scenario == 'search':
+        latencies, errors = _one_at_a_time(lambda: client.search(LAT, LON, radius=5, query='coffee'), ops, max_seconds)
+    elif scenario == 'search_compact':
+        latencies, errors = _one_at_a_time(lambda: client.search(LAT, LON, radius=5, query='coffee', compact=True), ops, max_seconds)
+    elif scenario == 'search_by_ip':
+        latencies, errors = _one_at_a_time(lambda: client.search_by_ip('192.0.2.1', radius=5), ops, max_seconds)
+    elif scenario == 'search_by_my_ip':
+        latencies, errors = _one_at_a_time(lambda: client.search_by_my_ip(radius=5), ops, max_seconds)
+    elif scenario == 'search_by_address':
+        latencies, errors = _one_at_a_time(lambda: client.search_by_address(ADDRESS, radius=5), ops, max_seconds)
+    elif scenario == 'iter_search':
+        latencies, errors = _one_at_a_time(lambda: list(client.iter_search(LAT, LON, radius=5)), ops, max_seconds)
+    elif scenario == 'add_feature':
+        features = _new_features(ops)
+        latencies, errors = _one_at_a_time(lambda: client.add_feature(features.next()), ops, max_seconds)
+    elif scenario == 'add_features':
+        # add_features() doesn't time the individual requests.
+        for (feature, res) in client.add_features(_new_features(ops), concurrency=concurrency):
+            if isinstance(res, Exception):
+                errors += 1
+    elif scenario in ('update_features', 'delete_features'):
+        if scenario == 'update_features':
+            bulk = client.update_features([Feature((LAT, LON), simplegeohandle=h, properties={'name': 'Updated'}) for h in _handles(ops)], concurrency=concurrency)
+        else:
+            bulk = client.delete_features(_handles(ops), concurrency=concurrency)
+        latencies = []
+        for outcome in bulk:
+            latencies.append(outcome.seconds)
+            if not outcome.ok:
+                errors += 1
+    else:
+        raise ValueError("No scenario named %r" % (scenario,))
+    seconds = time.time() - started
+    client.http.close()
+
+    if latencies is None:
+        count = ops
+    else:
+        count = len(latencies)
+        latencies.sort()
+    # No latencies (no calls finished in time, say) means no percentiles.
+    (p50_ms, p99_ms) = (None, None)
+    if latencies:
+        (p50_ms, p99_ms) = (_percentile(latencies, 50) * 1000, _percentile(latencies, 99) * 1000)
+    res = {
+        'scenario': scenario,
+        'codec': codec,
+        'ops': count,
+        'errors': errors,
+        'seconds': seconds,
+        'ops_per_sec': count / seconds if seconds > 0 else None,
+        'p50_ms': p50_ms,
+        'p99_ms': p99_ms,
+        # kilobytes on Linux, bytes on Mac OS X
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+    if 'features_decoded' in extra and p50_ms is not None:
+        res['us_per_feature'] = res['p50_ms'] * 1000 / max(1, extra['features_decoded'])
+    res.update(extra)
+    return res
+
+def _run_child(scenario, port, options):
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', scenario,
+           '--port', str(port), '--ops', str(options.ops),
+           '--concurrency', str(options.concurrency), '--codec', options.codec,
+           '--max-seconds', str(options.max_seconds)]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    if p.returncode != 0:
+        raise SystemExit("Scenario %s failed." % (scenario,))
+    return json.loads(out)
+
+def run_all(options):
+    scenarios = options.scenarios and options.scenarios.split(',') or SCENARIOS
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise SystemExit("No scenario named %r; they are %s." % (scenario, ', '.join(SCENARIOS)))
+    sizes = [int(n) for n in options.features.split(',')]
+
+    runs = [(scenario, n) for n in sizes for scenario in SEARCH_SCENARIOS if scenario in scenarios]
+    runs += [(scenario, None) for scenario in WRITE_SCENARIOS if scenario in scenarios]
+    results = []
+    for (scenario, n) in runs:
+        server = StubPlacesServer(features=n or 1, latency=options.latency, error_rate=options.error_rate).start()
+        try:
+            res = _run_child(scenario, server.port, options)
+        finally:
+            server.stop()
+        res['features'] = n
+        results.append(res)
+        line = "%-18s %6s features: %8.1f ops/s  p50 %s ms  p99 %s ms  max_rss %d" % (
+            scenario, n if n is not None else '-', res['ops_per_sec'] or 0,
+            _fmt(res['p50_ms']), _fmt(res['p99_ms']), res['max_rss'])
+        if 'us_per_feature' in res:
+            line += "  %.2f us/feature" % (res['us_per_feature'],)
+        sys.stderr.write(line + "\n")
+
+    from simplegeo.places import __version__
+    return {
+        'client_version': str(__version__),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': {
+            'ops': options.ops,
+            'max_seconds': options.max_seconds,
+            'concurrency': options.concurrency,
+            'latency': options.latency,
+            'error_rate': options.error_rate,
+            'codec': options.codec,
+            },
+        'results': results,
+        }
+
+def _fmt(ms):
+    if ms is None:
+        return '-'
+    return '%.2f' % (ms,)
+
+def compare(new, old, tolerance):
+    """ Print how each result in new compares with the same one in
+    old, and return the list of those whose throughput dropped by more
+    than tolerance (a fraction). """
+    key = lambda r: (r['scenario'], r['features'], r.get('codec', 'decimal'))
+    oldresults = dict((key(r), r) for r in old['results'])
+    regressions = []
+    for r in new['results']:
+        o = oldresults.get(key(r))
+        if o is None or not o['ops_per_sec'] or not r['ops_per_sec']:
+            continue
+        ratio = r['ops_per_sec'] / o['ops_per_sec']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  REGRESSION'
+            regressions.append(r)
+        sys.stderr.write("%-18s %6s features: %+6.1f%% ops/s%s\n" % (r['scenario'], r['features'] if r['features'] is not None else '-', (ratio - 1) * 100, flag))
+    return regressions
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('-o', '--output', default='bench-results.json', help="where to write the results (default %default)")
+    parser.add_option('--scenarios', help="comma-separated scenarios to run (default all: %s)" % (', '.join(SCENARIOS),))
+    parser.add_option('--features', default='10,1000,10000', help="comma-separated numbers of features per search response (default %default)")
+    parser.add_option('--ops', type='int', default=200, help="operations per scenario (default %default)")
+    parser.add_option('--max-seconds', type='float', default=10.0, help="stop a scenario after this long (default %default)")
+    parser.add_option('--concurrency', type='int', default=8, help="requests in flight for the bulk scenarios (default %default)")
+    parser.add_option('--latency', type='float', default=0.0, help="seconds for the stub server to delay each response")
+    parser.add_option('--codec', default='decimal', help="the client's JSON codec: decimal, fast or float (default %default)")
+    parser.add_option('--error-rate', type='float', default=0.0, help="fraction of requests for the stub server to fail with a 503")
+    parser.add_option('--compare', metavar='BASELINE', help="compare with the results in BASELINE and exit 1 if any regressed")
+    parser.add_option('--tolerance', type='float', default=0.2, help="fractional drop in ops/s which counts as a regression (default %default)")
+    parser.add_option('--child', help=optparse.SUPPRESS_HELP)
+    parser.add_option('--port', type='int', help=optparse.SUPPRESS_HELP)
+    (options, args) = parser.parse_args(argv)
+
+    if options.child:
+        print json.dumps(run_scenario(options.child, options.port, options.ops, options.concurrency, options.max_seconds, options.codec))
+        return 0
+
+    report = run_all(options)
+    f = open(options.output, 'w')
+    try:
+        json.dump(report, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+    if options.compare:
+        f = open(options.compare)
+        try:
+            old = json.load(f)
+        finally:
+            f.close()
+        if compare(report, old, options.tolerance):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
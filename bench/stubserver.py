@@ -0,0 +1,145 @@
+"""
+A local stand-in for the Places API, for benchmarking the client
+without the network or the real server getting in the way.
+
+Every search answers with the same FeatureCollection of a configurable
+number of features, add_feature() gets a 202 with a fresh
+simplegeohandle, and update_feature() and delete_feature() get a 200.
+Each request can be delayed by a fixed latency, and a fraction of them
+can be made to fail with a 503.
+"""
+import BaseHTTPServer, SocketServer, json, random, threading, time
+
+HANDLE_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+def make_handle(rand):
+    return 'SG_' + ''.join(rand.choice(HANDLE_CHARS) for i in range(22))
+
+def make_feature_collection(n, lat=37.7749, lon=-122.4194, seed=0):
+    """ Return the JSON of a FeatureCollection of n points scattered
+    within a few kilometers of lat, lon. """
+    rand = random.Random(seed)
+    features = []
+    for i in range(n):
+        features.append({
+            'type': 'Feature',
+            'id': make_handle(rand),
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [round(lon + rand.uniform(-0.05, 0.05), 6), round(lat + rand.uniform(-0.05, 0.05), 6)],
+                },
+            'properties': {
+                'name': 'Place number %d' % (i,),
+                'address': '%d Market St' % (rand.randint(1, 3000),),
+                'city': 'San Francisco',
+                'province': 'CA',
+                'postcode': '94103',
+                'country': 'US',
+                'phone': '+1 415 555 %04d' % (rand.randint(0, 9999),),
+                'classifiers': [{'category': 'Restaurant', 'type': 'Food & Drink', 'subcategory': ''}],
+                'tags': ['coffee', 'wifi'],
+                },
+            })
+    return json.dumps({
+        'type': 'FeatureCollection',
+        'total': n,
+        'query': {'latitude': lat, 'longitude': lon},
+        'features': features,
+        })
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one write, and at once, so that the stub
+    # doesn't add Nagle and delayed-ACK stalls of its own.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.should_fail():
+            return self._reply(503, '{"message": "injected failure"}')
+
+        path = self.path.split('?', 1)[0]
+        if self.command == 'GET' and path.startswith('/1.0/places/'):
+            return self._reply(200, server.search_body)
+        if self.command == 'POST' and path == '/1.0/places':
+            return self._reply(202, json.dumps({'id': server.new_handle()}))
+        if self.command in ('POST', 'DELETE') and path.startswith('/1.0/features/'):
+            return self._reply(200, '{"status": "ok"}')
+        return self._reply(404, '{"message": "no such endpoint"}')
+
+    do_GET = do_POST = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+class StubPlacesServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves on 127.0.0.1 on an unused port (see port) from a background
+    thread once start() is called.
+    """
+    daemon_threads = True
+
+    def __init__(self, features=10, latency=0.0, error_rate=0.0, seed=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.port = self.server_address[1]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.search_body = make_feature_collection(features, seed=seed)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        self._lock.acquire()
+        try:
+            return self._random.random() < self.error_rate
+        finally:
+            self._lock.release()
+
+    def new_handle(self):
+        self._lock.acquire()
+        try:
+            return make_handle(self._random)
+        finally:
+            self._lock.release()
+
+    def handle_error(self, request, client_address):
+        pass # e.g. the client closed a keep-alive connection
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == '__main__':
+    import optparse
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option('--features', type='int', default=10)
+    parser.add_option('--latency', type='float', default=0.0, help="seconds to delay each response")
+    parser.add_option('--error-rate', type='float', default=0.0, help="fraction of requests to fail with a 503")
+    (options, args) = parser.parse_args()
+    server = StubPlacesServer(options.features, options.latency, options.error_rate)
+    print "Serving the Places API on http://127.0.0.1:%d/" % (server.port,)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
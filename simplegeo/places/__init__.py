@@ -2,11 +2,26 @@ API_VERSION = '1.0'
 
 from pyutil.assertutil import precondition
 
-import urllib
+import urllib, zlib
 
-from simplegeo.shared import APIError, Feature, SIMPLEGEOHANDLE_RSTR, is_simplegeohandle, json_decode, is_valid_ip, is_valid_lat, is_valid_lon, is_numeric
+import oauth2 as oauth
+
+from simplegeo.shared import APIError, Feature, SIMPLEGEOHANDLE_RSTR, is_simplegeohandle, json_decode, is_valid_ip, is_valid_lat, is_valid_lon, is_numeric, to_unicode
 from simplegeo.shared import Client as SGClient
 
+from simplegeo.places.bulk import BulkOperation
+from simplegeo.places.codec import DEFAULT_CODEC
+from simplegeo.places.compact import compact_features
+from simplegeo.places.concurrency import SingleFlight, imap_unordered
+from simplegeo.places.dedup import content_hash
+from simplegeo.places.multi import MultiSearchResult, is_complete, plan_coverage, same_circle, within
+from simplegeo.places.ratelimit import request_kind
+from simplegeo.places.stats import NULL_TIMER
+from simplegeo.places.streaming import iter_feature_dicts
+from simplegeo.places.tiling import BboxSearchResult, initial_tiles
+from simplegeo.places.transport import ACCEPT_ENCODING, HTTPConnectionPool
+from simplegeo.places._version import __version__
+
 endpoints = {
     'create': 'places',
     'search': 'places/%(lat)s,%(lon)s.json%(quargs)s',
@@ -15,71 +30,450 @@ endpoints = {
     'search_by_address': 'places/address.json?%(quargs)s',
     }
 
-class Client(SGClient):
-    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80):
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'DELETE')
+
+# The largest search radius (in kilometers) used by search_bbox().
+MAX_TILE_RADIUS_KM = 25
+
+# The statuses with which the server says it couldn't geocode an address.
+UNRESOLVABLE_ADDRESS_STATUSES = (400, 404)
+
+def _full_features(featuredicts):
+    return [Feature.from_dict(f) for f in featuredicts]
+
+def _result_maker(compact, as_arrays):
+    """ Return the function which turns the GeoJSON features of a
+    search response into what the search method returns. """
+    precondition(not (compact and as_arrays), "Only one of compact and as_arrays can be used.", compact=compact, as_arrays=as_arrays)
+    if as_arrays:
+        # numpy is an optional dependency, so only import it if asked.
+        from simplegeo.places.columnar import FeatureArrays
+        return FeatureArrays.from_dicts
+    if compact:
+        return compact_features
+    return _full_features
+
+def _query_location(fc):
+    """
+    Return the (lat, lon) which the server reports that it searched
+    near, in the 'query' member of a search response, or None if the
+    response doesn't say.
+    """
+    query = fc.get('query')
+    if not isinstance(query, dict):
+        return None
+    lat, lon = query.get('latitude'), query.get('longitude')
+    if not (is_valid_lat(lat) and is_valid_lon(lon)):
+        return None
+    return (lat, lon)
+
+class BaseClient(SGClient):
+    """
+    The parts of a Places client which don't do any I/O: checking the
+    arguments, building the requests, and interpreting the responses.
+    Client and simplegeo.places.txclient.AsyncClient are both built on
+    it, each with its own way of sending the requests.
+    """
+    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80, codec=None, compress_requests=None):
         SGClient.__init__(self, key, secret, api_version=api_version, host=host, port=port)
         self.endpoints.update(endpoints)
+        self.codec = codec or DEFAULT_CODEC
+        self.compress_requests = compress_requests
 
-    def add_feature(self, feature):
-        """Create a new feature, returns the simplegeohandle. """
-        endpoint = self._endpoint('create')
+    def _signed_headers(self, endpoint, method):
+        """ Return the HTTP headers, including the oauth
+        Authorization header, for a request. """
+        request = oauth.Request.from_consumer_and_token(self.consumer,
+            http_method=method, http_url=endpoint, parameters={})
+        request.sign_request(self.signature, self.consumer, None)
+        headers = request.to_header(self.realm)
+        headers['User-Agent'] = 'SimpleGeo Places Client v%s' % (__version__,)
+        return headers
+
+    def _encode_body(self, data):
+        """ Return a tuple of (the request body data, ready to send,
+        and its Content-Encoding or None). """
+        if data is None:
+            return (None, None)
+        data = to_unicode(data)
+        if self.compress_requests is None or len(data) < self.compress_requests:
+            return (data, None)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return (compressor.compress(data.encode('utf-8')) + compressor.flush(), 'gzip')
+
+    def _add_feature_request(self, feature, timer=NULL_TIMER):
         if feature.id:
             # only simplegeohandles or None should be stored in self.id
             assert is_simplegeohandle(feature.id)
             raise ValueError('A feature cannot be added to the Places database when it already has a simplegeohandle: %s' % (feature.id,))
-        jsonrec = feature.to_json()
-        resp, content = self._request(endpoint, "POST", jsonrec)
+        timer.mark('validate')
+        endpoint = self._endpoint('create')
+        jsonrec = self.codec.encode(feature.to_dict())
+        timer.mark('build_url')
+        return endpoint, jsonrec
+
+    def _add_feature_result(self, resp, content):
         if resp['status'] != "202":
             raise APIError(int(resp['status']), content, resp)
-        contentobj = json_decode(content)
+        contentobj = self.codec.decode(content)
         if not contentobj.has_key('id'):
             raise APIError(int(resp['status']), content, resp)
         handle = contentobj['id']
         assert is_simplegeohandle(handle)
         return handle
 
-    def update_feature(self, feature):
-        """Update a Places feature."""
-        endpoint = self._endpoint('feature', simplegeohandle=feature.id)
-        return self._request(endpoint, 'POST', feature.to_json())[1]
-
-    def delete_feature(self, simplegeohandle):
-        """Delete a Places feature."""
+    def _delete_feature_endpoint(self, simplegeohandle, timer=NULL_TIMER):
         precondition(is_simplegeohandle(simplegeohandle), "simplegeohandle is required to match the regex %s" % SIMPLEGEOHANDLE_RSTR, simplegeohandle=simplegeohandle)
+        timer.mark('validate')
         endpoint = self._endpoint('feature', simplegeohandle=simplegeohandle)
-        return self._request(endpoint, 'DELETE')[1]
+        timer.mark('build_url')
+        return endpoint
 
-    def search(self, lat, lon, radius=None, query=None, category=None):
-        """Search for places near a lat/lon, within a radius (in kilometers)."""
-        precondition(is_valid_lat(lat), lat)
-        precondition(is_valid_lon(lon), lon)
+    def _check_terms(self, radius, query, category):
+        """ Check the search terms which are common to all of the
+        search methods. """
         precondition(radius is None or is_numeric(radius), radius)
         precondition(query is None or isinstance(query, basestring), query)
         precondition(category is None or isinstance(category, basestring), category)
 
+    def _quargs(self, radius, query, category, **kwargs):
+        """
+        Return the search terms which are common to all of the search
+        methods (along with any extra kwargs) as a urlencoded query
+        string.
+        """
         if isinstance(query, unicode):
             query = query.encode('utf-8')
         if isinstance(category, unicode):
             category = category.encode('utf-8')
 
-        kwargs = { }
         if radius:
             kwargs['radius'] = radius
         if query:
             kwargs['q'] = query
         if category:
             kwargs['category'] = category
-        quargs = urllib.urlencode(kwargs)
+        return urllib.urlencode(kwargs)
+
+    def _search_endpoint(self, lat, lon, radius, query, category, timer=NULL_TIMER):
+        precondition(is_valid_lat(lat), lat)
+        precondition(is_valid_lon(lon), lon)
+        self._check_terms(radius, query, category)
+        timer.mark('validate')
+        quargs = self._quargs(radius, query, category)
         if quargs:
             quargs = '?'+quargs
         endpoint = self._endpoint('search', lat=lat, lon=lon, quargs=quargs)
+        timer.mark('build_url')
+        return endpoint
+
+    def _search_by_ip_endpoint(self, ipaddr, radius, query, category, timer=NULL_TIMER):
+        precondition(is_valid_ip(ipaddr), ipaddr)
+        self._check_terms(radius, query, category)
+        timer.mark('validate')
+        quargs = self._quargs(radius, query, category)
+        if quargs:
+            quargs = '?'+quargs
+        endpoint = self._endpoint('search_by_ip', ipaddr=ipaddr, quargs=quargs)
+        timer.mark('build_url')
+        return endpoint
+
+    def _search_by_my_ip_endpoint(self, radius, query, category, timer=NULL_TIMER):
+        self._check_terms(radius, query, category)
+        timer.mark('validate')
+        quargs = self._quargs(radius, query, category)
+        if quargs:
+            quargs = '?'+quargs
+        endpoint = self._endpoint('search_by_my_ip', quargs=quargs)
+        timer.mark('build_url')
+        return endpoint
+
+    def _search_by_address_endpoint(self, address, radius, query, category, timer=NULL_TIMER):
+        precondition(isinstance(address, basestring), address)
+        precondition(address != '', address)
+        self._check_terms(radius, query, category)
+        timer.mark('validate')
+        if isinstance(address, unicode):
+            address = address.encode('utf-8')
+        quargs = self._quargs(radius, query, category, address=address)
+        endpoint = self._endpoint('search_by_address', quargs=quargs)
+        timer.mark('build_url')
+        return endpoint
+
+    def _features(self, result, make=_full_features):
+        return make(self.codec.decode(result)['features'])
+
+class Client(BaseClient):
+    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80, search_cache=None, spatial_cache=None, address_cache=None, ip_cache=None, max_connections=10, idle_timeout=60, pool_timeout=None, coalesce=False, retry_policy=None, circuit_breaker=None, instrumentation=None, codec=None, store=None, rate_limiter=None, hedge_policy=None, compress_responses=True, compress_requests=None, write_behind=None, dedup_index=None):
+        """
+        A Client can be shared by many threads. Its requests are sent
+        over a pool of at most max_connections persistent connections
+        to the server (see simplegeo.places.transport), which are
+        closed after idle_timeout seconds of not being used. A request
+        which finds all of the connections in use waits for up to
+        pool_timeout seconds (forever if pool_timeout is None) for one
+        to be free. self.http.stats() reports how busy the pool is.
+
+        If compress_responses is True, the server is asked to gzip or
+        deflate its responses, and they are decompressed as they
+        arrive. If compress_requests is not None, request bodies (of
+        add_feature() and update_feature(), for example) of at least
+        that many bytes are sent gzipped.
+
+        search_cache is optional, and if given it is a
+        simplegeo.places.cache.SearchCache in which the results of
+        search() are remembered.
+
+        spatial_cache is optional, and if given it is a
+        simplegeo.places.cache.SpatialCache which is used to answer
+        search() locally when the search lies within an earlier one.
+
+        store is optional, and if given it is a
+        simplegeo.places.store.PlaceStore, a database of the results of
+        search() which is shared by every process which uses the same
+        file. It is consulted after search_cache and spatial_cache.
+
+        address_cache is optional, and if given it is a
+        simplegeo.places.cache.AddressCache in which the locations of
+        the addresses passed to search_by_address() are remembered.
 
-        result = self._request(endpoint, 'GET')[1]
+        ip_cache is optional, and if given it is a
+        simplegeo.places.cache.IPSearchCache in which the results of
+        search_by_ip() and search_by_my_ip() are remembered.
 
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
+        If coalesce is True, then when several threads make the same
+        search at the same time only one request is sent, and they all
+        get its result (see simplegeo.places.concurrency.SingleFlight).
 
-    def search_by_ip(self, ipaddr, radius=None, query=None, category=None):
+        retry_policy and circuit_breaker are optional, and if given they
+        are a simplegeo.places.retry.RetryPolicy which says how
+        requests which fail transiently are retried, and a
+        simplegeo.places.retry.CircuitBreaker which stops requests
+        from being sent while the server is failing.
+
+        rate_limiter is optional, and if given it is a
+        simplegeo.places.ratelimit.RateLimiter which limits how fast
+        requests are sent, by every thread using this Client, and slows
+        down when the server says it is being sent too many.
+
+        hedge_policy is optional, and if given it is a
+        simplegeo.places.hedge.HedgePolicy, which makes the search
+        methods send a second request when the first is slow to be
+        answered, and use whichever answer comes first.
+
+        write_behind is optional, and if given it is a
+        simplegeo.places.writebehind.WriteBehind, which buffers the
+        updates of update_feature() and sends them in the background,
+        so that several updates of a feature in quick succession are
+        sent as one. Call close() when done with the Client to send
+        whatever is still buffered.
+
+        dedup_index is optional, and if given it is a
+        simplegeo.places.dedup.DedupIndex in which the simplegeohandle
+        that add_feature() gets for each feature is remembered, so that
+        adding the same feature again (ignoring its id) returns that
+        handle without asking the server.
+
+        instrumentation is optional, and if given it is a
+        simplegeo.places.stats.Instrumentation which times every call
+        (see stats()).
+
+        codec is optional, and if given it is the JSON codec which is
+        used to decode responses and encode features (see
+        simplegeo.places.codec). The default decodes numbers exactly,
+        as Decimals; simplegeo.places.codec.FastCodec(floats=True) is
+        much faster for large responses.
+        """
+        BaseClient.__init__(self, key, secret, api_version=api_version, host=host, port=port, codec=codec, compress_requests=compress_requests)
+        self.http = HTTPConnectionPool(host, port, maxsize=max_connections, idle_timeout=idle_timeout, wait_timeout=pool_timeout, accept_encoding=compress_responses and ACCEPT_ENCODING or None)
+        self.search_cache = search_cache
+        self.spatial_cache = spatial_cache
+        self.store = store
+        self.address_cache = address_cache
+        self.ip_cache = ip_cache
+        self.singleflight = None
+        if coalesce:
+            self.singleflight = SingleFlight()
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        self.hedge_policy = hedge_policy
+        self.instrumentation = instrumentation
+        self.dedup_index = dedup_index
+        self._dedup_flight = SingleFlight()
+        self.write_behind = write_behind
+        if write_behind is not None:
+            write_behind.start(self._send_updates)
+
+    def close(self):
+        """ Send any updates which self.write_behind is holding, and
+        close the idle connections. """
+        if self.write_behind is not None:
+            self.write_behind.close()
+        self.http.close()
+
+    def stats(self):
+        """ Return a snapshot of the statistics which have been
+        collected by self.instrumentation, or None if there is none. """
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.stats()
+
+    def _timer(self, endpoint):
+        if self.instrumentation is None:
+            return NULL_TIMER
+        return self.instrumentation.timer(endpoint)
+
+    def add_feature(self, feature):
+        """
+        Create a new feature, returns the simplegeohandle. If
+        self.dedup_index already knows the handle of an identical
+        feature, that is returned instead of adding it again.
+        """
+        with self._timer('create') as timer:
+            endpoint, jsonrec = self._add_feature_request(feature, timer)
+            def _add():
+                retryable = self.retry_policy is not None and self.retry_policy.retry_add_feature
+                resp, content = self._request(endpoint, "POST", jsonrec, retryable=retryable, timer=timer)
+                return self._add_feature_result(resp, content)
+            if self.dedup_index is None:
+                return _add()
+
+            key = content_hash(feature)
+            def _add_once():
+                handle = self.dedup_index.get(key)
+                timer.mark('cache')
+                if handle is None:
+                    handle = _add()
+                    self.dedup_index.put(key, handle)
+                    timer.mark('cache')
+                return handle
+            # Identical features being added at the same time are only
+            # sent once.
+            return self._dedup_flight.do(key, _add_once)
+
+    def add_features(self, features, concurrency=8):
+        """
+        Create many new features, keeping up to concurrency requests
+        in flight at once. features can be any iterable (such as a
+        generator) and is consumed lazily.
+
+        Yields a (feature, handle_or_error) tuple for each feature as
+        its request completes, which is not necessarily in the order
+        the features were given. handle_or_error is the
+        simplegeohandle that add_feature() would have returned, or
+        the exception that it would have raised, so that one bad
+        feature doesn't stop the rest of the batch.
+        """
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        for (feature, handle, exc_info) in imap_unordered(self.add_feature, features, concurrency):
+            if exc_info is not None:
+                yield (feature, exc_info[1])
+            else:
+                yield (feature, handle)
+
+    def update_feature(self, feature):
+        """
+        Update a Places feature. If self.write_behind is not None the
+        update is only buffered, and None is returned.
+        """
+        if self.write_behind is not None:
+            precondition(is_simplegeohandle(feature.id), "simplegeohandle is required to match the regex %s" % SIMPLEGEOHANDLE_RSTR, simplegeohandle=feature.id)
+            self.write_behind.put(feature)
+            return None
+        return self._update_feature(feature)
+
+    def _update_feature(self, feature):
+        with self._timer('feature') as timer:
+            endpoint = self._endpoint('feature', simplegeohandle=feature.id)
+            jsonrec = self.codec.encode(feature.to_dict())
+            timer.mark('build_url')
+            return self._request(endpoint, 'POST', jsonrec, timer=timer)[1]
+
+    def delete_feature(self, simplegeohandle):
+        """Delete a Places feature."""
+        with self._timer('feature') as timer:
+            endpoint = self._delete_feature_endpoint(simplegeohandle, timer)
+            return self._request(endpoint, 'DELETE', timer=timer)[1]
+
+    def update_features(self, features, concurrency=8):
+        """
+        Update many Places features, concurrency at a time. Every
+        feature is required to have a simplegeohandle, which is checked
+        for the whole batch before any of them are sent.
+
+        Returns a simplegeo.places.bulk.BulkOperation. Iterate over it
+        to run it, getting an Outcome for each feature as its update
+        finishes, and then call its summary() for the totals and the
+        throughput. The updates are sent at once, even if there is a
+        self.write_behind.
+        """
+        features = list(features)
+        for feature in features:
+            precondition(is_simplegeohandle(feature.id), "simplegeohandle is required to match the regex %s" % SIMPLEGEOHANDLE_RSTR, simplegeohandle=feature.id)
+        return self._send_updates(features, concurrency)
+
+    def _send_updates(self, features, concurrency):
+        return BulkOperation(self._update_feature, features, lambda feature: feature.id, concurrency=concurrency)
+
+    def delete_features(self, simplegeohandles, concurrency=8):
+        """
+        Delete many Places features, concurrency at a time. Like
+        update_features(), every simplegeohandle is checked before any
+        of them are sent, and it returns a BulkOperation.
+        """
+        simplegeohandles = list(simplegeohandles)
+        for simplegeohandle in simplegeohandles:
+            precondition(is_simplegeohandle(simplegeohandle), "simplegeohandle is required to match the regex %s" % SIMPLEGEOHANDLE_RSTR, simplegeohandle=simplegeohandle)
+        return BulkOperation(self.delete_feature, simplegeohandles, lambda simplegeohandle: simplegeohandle, concurrency=concurrency)
+
+    def search(self, lat, lon, radius=None, query=None, category=None, compact=False, as_arrays=False):
+        """
+        Search for places near a lat/lon, within a radius (in
+        kilometers).
+
+        If compact is True, return a list of
+        simplegeo.places.compact.CompactFeature instead of Feature,
+        which are cheaper to make and smaller, and which can be
+        converted to Features with to_feature().
+
+        If as_arrays is True, return a
+        simplegeo.places.columnar.FeatureArrays, which holds the
+        results as NumPy arrays, one per column. This requires numpy.
+
+        The other search methods take compact and as_arrays too.
+        """
+        make = _result_maker(compact, as_arrays)
+        with self._timer('search') as timer:
+            endpoint = self._search_endpoint(lat, lon, radius, query, category, timer)
+            if self.search_cache is None and self.spatial_cache is None and self.store is None:
+                return self._search(endpoint, timer, make)
+
+            featuredicts = None
+            if self.search_cache is not None:
+                key = self.search_cache.key(lat, lon, radius, query, category)
+                featuredicts = self.search_cache.get(key)
+            if featuredicts is None and self.spatial_cache is not None:
+                featuredicts = self.spatial_cache.get(lat, lon, radius, query, category)
+                if featuredicts is not None and self.search_cache is not None:
+                    self.search_cache.put(key, featuredicts)
+            if featuredicts is None and self.store is not None:
+                featuredicts = self.store.get(lat, lon, radius, query, category)
+                if featuredicts is not None and self.search_cache is not None:
+                    self.search_cache.put(key, featuredicts)
+            timer.mark('cache')
+            if featuredicts is None:
+                featuredicts = self._get_json(endpoint, timer)['features']
+                if self.search_cache is not None:
+                    self.search_cache.put(key, featuredicts)
+                if self.spatial_cache is not None:
+                    self.spatial_cache.put(lat, lon, radius, query, category, featuredicts)
+                if self.store is not None:
+                    self.store.put(lat, lon, radius, query, category, featuredicts)
+                timer.mark('cache')
+            return self._construct(featuredicts, timer, make)
+
+    def search_by_ip(self, ipaddr, radius=None, query=None, category=None, compact=False, as_arrays=False):
         """
         Search for places near an IP address, within a radius (in
         kilometers).
@@ -88,34 +482,12 @@ class Client(SGClient):
         ipaddr and then does the same thing as search(), using that
         guessed latitude and longitude.
         """
-        precondition(is_valid_ip(ipaddr), ipaddr)
-        precondition(radius is None or is_numeric(radius), radius)
-        precondition(query is None or isinstance(query, basestring), query)
-        precondition(category is None or isinstance(category, basestring), category)
+        make = _result_maker(compact, as_arrays)
+        with self._timer('search_by_ip') as timer:
+            endpoint = self._search_by_ip_endpoint(ipaddr, radius, query, category, timer)
+            return self._ip_search(endpoint, ipaddr, radius, query, category, timer, make)
 
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        quargs = urllib.urlencode(kwargs)
-        if quargs:
-            quargs = '?'+quargs
-        endpoint = self._endpoint('search_by_ip', ipaddr=ipaddr, quargs=quargs)
-
-        result = self._request(endpoint, 'GET')[1]
-
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
-
-    def search_by_my_ip(self, radius=None, query=None, category=None):
+    def search_by_my_ip(self, radius=None, query=None, category=None, compact=False, as_arrays=False):
         """
         Search for places near your IP address, within a radius (in
         kilometers).
@@ -125,33 +497,12 @@ class Client(SGClient):
         HTTP proxy device between you and the server), and then does
         the same thing as search_by_ip(), using that IP address.
         """
-        precondition(radius is None or is_numeric(radius), radius)
-        precondition(query is None or isinstance(query, basestring), query)
-        precondition(category is None or isinstance(category, basestring), category)
-
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
-
-        kwargs = { }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        quargs = urllib.urlencode(kwargs)
-        if quargs:
-            quargs = '?'+quargs
-        endpoint = self._endpoint('search_by_my_ip', quargs=quargs)
-
-        result = self._request(endpoint, 'GET')[1]
+        make = _result_maker(compact, as_arrays)
+        with self._timer('search_by_my_ip') as timer:
+            endpoint = self._search_by_my_ip_endpoint(radius, query, category, timer)
+            return self._ip_search(endpoint, None, radius, query, category, timer, make)
 
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
-
-    def search_by_address(self, address, radius=None, query=None, category=None):
+    def search_by_address(self, address, radius=None, query=None, category=None, compact=False, as_arrays=False):
         """
         Search for places near the given address, within a radius (in
         kilometers).
@@ -160,30 +511,320 @@ class Client(SGClient):
         street address and then does the same thing as search(), using
         that deduced latitude and longitude.
         """
-        precondition(isinstance(address, basestring), address)
-        precondition(address != '', address)
-        precondition(radius is None or is_numeric(radius), radius)
-        precondition(query is None or isinstance(query, basestring), query)
-        precondition(category is None or isinstance(category, basestring), category)
+        make = _result_maker(compact, as_arrays)
+        with self._timer('search_by_address') as timer:
+            endpoint = self._search_by_address_endpoint(address, radius, query, category, timer)
+            if self.address_cache is None:
+                return self._search(endpoint, timer, make)
 
-        if isinstance(address, unicode):
-            address = address.encode('utf-8')
-        if isinstance(query, unicode):
-            query = query.encode('utf-8')
-        if isinstance(category, unicode):
-            category = category.encode('utf-8')
+            location = self.address_cache.get_location(address)
+            timer.mark('cache')
+            if location is not None:
+                return self.search(location[0], location[1], radius, query, category, compact, as_arrays)
+            try:
+                fc = self._get_json(endpoint, timer)
+            except APIError, e:
+                if e.code in UNRESOLVABLE_ADDRESS_STATUSES:
+                    self.address_cache.put_failure(address, e)
+                raise
+            location = _query_location(fc)
+            if location is not None:
+                self.address_cache.put_location(address, location[0], location[1])
+            timer.mark('cache')
+            return self._construct(fc['features'], timer, make)
 
-        kwargs = { 'address': address }
-        if radius:
-            kwargs['radius'] = radius
-        if query:
-            kwargs['q'] = query
-        if category:
-            kwargs['category'] = category
-        quargs = urllib.urlencode(kwargs)
-        endpoint = self._endpoint('search_by_address', quargs=quargs)
+    def search_many(self, points, radius=None, query=None, category=None, concurrency=8, compact=False, truncated_at=25):
+        """
+        Search around each of points, up to concurrency searches at a
+        time, and return a simplegeo.places.multi.MultiSearchResult of
+        the distinct features found (by simplegeohandle) along with
+        which points each one was found around.
+
+        Each point is a (lat, lon) tuple, which is searched with the
+        given radius, or a (lat, lon, radius) tuple. A point whose
+        circle lies entirely within the circle of an earlier point is
+        not searched; its features are picked out of the earlier
+        point's instead, unless that result has truncated_at or more
+        features (the most the server returns, so some may have been
+        left out), in which case it is searched after all. A point
+        which repeats an earlier one gets its results as they are.
+
+        All of the points are checked before any searches are sent.
+        If any search fails its exception is raised.
+        """
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        circles = []
+        for point in points:
+            if len(point) == 3:
+                circles.append(tuple(point))
+            else:
+                (lat, lon) = point
+                circles.append((lat, lon, radius))
+        for (lat, lon, r) in circles:
+            self._search_endpoint(lat, lon, r, query, category)
+
+        cover = plan_coverage(circles)
+        def _search(i):
+            (lat, lon, r) = circles[i]
+            return self.search(lat, lon, r, query, category, compact=compact)
+        results = self._search_each(_search, [i for (i, j) in enumerate(cover) if j is None], concurrency)
+        incomplete = [i for (i, j) in enumerate(cover) if j is not None and not same_circle(circles[i], circles[j]) and not is_complete(results[j], truncated_at)]
+        results.update(self._search_each(_search, incomplete, concurrency))
+
+        res = MultiSearchResult(searched=len(results), skipped=len(circles) - len(results))
+        for (i, (lat, lon, r)) in enumerate(circles):
+            if i in results:
+                res.add(i, results[i])
+            elif same_circle(circles[i], circles[cover[i]]):
+                res.add(i, results[cover[i]])
+            else:
+                res.add(i, within(results[cover[i]], lat, lon, r))
+        return res
+
+    def search_bbox(self, sw, ne, query=None, category=None, concurrency=8, compact=False, truncated_at=25, max_radius=MAX_TILE_RADIUS_KM, min_radius=0.05):
+        """
+        Find the places within the box with southwest corner sw and
+        northeast corner ne, each a (lat, lon) tuple, and return a
+        simplegeo.places.tiling.BboxSearchResult of the distinct
+        features (by simplegeohandle) within it.
+
+        The box is divided into a grid of tiles whose enclosing
+        circles have a radius of at most max_radius kilometers, and
+        each tile is searched, up to concurrency searches at a time.
+        A tile whose search returns truncated_at or more features (the
+        most the server returns, so some may have been left out) is
+        split into four tiles which are searched in turn, unless their
+        radius would be less than min_radius. The box must not cross
+        the antimeridian.
+        """
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        (south, west) = sw
+        (north, east) = ne
+        precondition(is_valid_lat(south) and is_valid_lat(north) and south < north, sw=sw, ne=ne)
+        precondition(is_valid_lon(west, strict=True) and is_valid_lon(east, strict=True) and west < east, sw=sw, ne=ne)
+        precondition(max_radius > 0 and min_radius > 0, max_radius=max_radius, min_radius=min_radius)
+        self._check_terms(None, query, category)
+
+        (south, west, north, east) = (float(south), float(west), float(north), float(east))
+        res = BboxSearchResult(south, west, north, east)
+        def _search(tile):
+            (lat, lon, r) = tile.circle()
+            return self.search(lat, lon, r, query, category, compact=compact)
+
+        tiles = initial_tiles(south, west, north, east, max_radius)
+        while tiles:
+            results = self._search_each(_search, tiles, concurrency)
+            res.searched += len(tiles)
+            subtiles = []
+            for tile in tiles:
+                features = results[tile]
+                res.add(features)
+                if truncated_at is None or len(features) < truncated_at:
+                    continue
+                if tile.circle()[2] / 2 < min_radius:
+                    res.saturated += 1
+                else:
+                    res.subdivided += 1
+                    subtiles.extend(tile.split())
+            tiles = subtiles
+        return res
+
+    def _search_each(self, search, items, concurrency):
+        """ Call search(item) for each of items, concurrency at a
+        time, and return a dict from item to its result. """
+        results = {}
+        for (item, features, exc_info) in imap_unordered(search, items, concurrency):
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            results[item] = features
+        return results
+
+    def _search(self, endpoint, timer=NULL_TIMER, make=_full_features):
+        return self._construct(self._get_json(endpoint, timer)['features'], timer, make)
+
+    def _construct(self, featuredicts, timer=NULL_TIMER, make=_full_features):
+        features = make(featuredicts)
+        timer.mark('construct')
+        timer.note(features=len(features))
+        return features
+
+    def _get_json(self, endpoint, timer=NULL_TIMER):
+        """
+        GET endpoint and return the decoded JSON response. If
+        self.singleflight is not None, concurrent identical GETs share
+        one request, and if self.hedge_policy is not None slow GETs
+        are hedged.
+        """
+        def _get():
+            if self.hedge_policy is None:
+                content = self._request(endpoint, 'GET', timer=timer)[1]
+            else:
+                # The requests run on other threads, so they can't be
+                # timed phase by phase.
+                headers, content = self.hedge_policy.call(lambda: self._request(endpoint, 'GET'))
+                timer.mark('network')
+                timer.note(status=int(headers['status']), response_bytes=len(content or ''))
+            res = self.codec.decode(content)
+            timer.mark('decode')
+            return res
+        if self.singleflight is None:
+            return _get()
+        return self.singleflight.do(endpoint, _get)
+
+    def _ip_search(self, endpoint, ipaddr, radius, query, category, timer=NULL_TIMER, make=_full_features):
+        if self.ip_cache is None:
+            return self._search(endpoint, timer, make)
+
+        key = self.ip_cache.key(ipaddr, radius, query, category)
+        featuredicts = self.ip_cache.get(key)
+        timer.mark('cache')
+        if featuredicts is None:
+            featuredicts = self._get_json(endpoint, timer)['features']
+            self.ip_cache.put(key, featuredicts)
+            timer.mark('cache')
+        return self._construct(featuredicts, timer, make)
+
+    def iter_search(self, lat, lon, radius=None, query=None, category=None):
+        """
+        Like search(), but returns an iterator which yields each
+        Feature as soon as it has been received, instead of a list of
+        all of them once the whole response has been received. If you
+        stop iterating early the rest of the response is not
+        downloaded.
+
+        The request goes through the rate limiter, circuit breaker and
+        retry policy as search()'s does, but only until the response
+        starts to arrive: an error while the features are being read
+        is raised by the iterator, and is not retried. The call is
+        timed by the instrumentation as 'iter_search' (and so on for
+        the other iter_search methods), from the first feature asked
+        for to the last, including the time spent between them.
+        """
+        return self._iter_features('iter_search', self._search_endpoint(lat, lon, radius, query, category))
+
+    def iter_search_by_ip(self, ipaddr, radius=None, query=None, category=None):
+        """Like search_by_ip(), but returns an iterator. See iter_search()."""
+        return self._iter_features('iter_search_by_ip', self._search_by_ip_endpoint(ipaddr, radius, query, category))
+
+    def iter_search_by_my_ip(self, radius=None, query=None, category=None):
+        """Like search_by_my_ip(), but returns an iterator. See iter_search()."""
+        return self._iter_features('iter_search_by_my_ip', self._search_by_my_ip_endpoint(radius, query, category))
+
+    def iter_search_by_address(self, address, radius=None, query=None, category=None):
+        """Like search_by_address(), but returns an iterator. See iter_search()."""
+        return self._iter_features('iter_search_by_address', self._search_by_address_endpoint(address, radius, query, category))
+
+    def _iter_features(self, name, endpoint):
+        with self._timer(name) as timer:
+            resp, chunks = self._request(endpoint, 'GET', stream=True, timer=timer)
+            n = 0
+            try:
+                for f in iter_feature_dicts(chunks, self.codec.decode):
+                    n += 1
+                    yield Feature.from_dict(f)
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                timer.mark('stream')
+                timer.note(features=n)
+
+    def _request(self, endpoint, method, data=None, retryable=None, timer=NULL_TIMER, stream=False):
+        """
+        Not used directly by code external to this lib. Performs the
+        actual request against the API, including passing the
+        credentials with oauth.  Returns a tuple of (headers as dict,
+        body as string).
+
+        If the request fails transiently it is retried according to
+        self.retry_policy, if it is retryable. retryable defaults to
+        whether method is idempotent.
+
+        Each try waits for self.rate_limiter, if there is one.
+
+        If stream is True the body is not read: the tuple is of
+        (headers as dict, iterator of body chunks), as from
+        _send_stream().
+        """
+        data, content_encoding = self._encode_body(data)
+        if retryable is None:
+            retryable = method in IDEMPOTENT_METHODS
+        kind = request_kind(method)
+        attempt = 0
+        while True:
+            # Wait for the rate limiter first: if it refuses, a half-open
+            # circuit breaker mustn't have handed its probe to a request
+            # which is never sent.
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(kind)
+                timer.mark('rate_limit_wait')
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                if stream:
+                    res = self._send_stream(endpoint, method, timer)
+                else:
+                    res = self._send(endpoint, method, data, timer, content_encoding)
+            except Exception, e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(e)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.record(kind, e)
+                if not (retryable and self.retry_policy is not None and self.retry_policy.should_retry(e, attempt)):
+                    raise
+                self.retry_policy.record_retry()
+                self.retry_policy.sleep(self.retry_policy.delay(attempt))
+                timer.mark('retry_wait')
+                attempt += 1
+                continue
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(None)
+            if self.rate_limiter is not None:
+                self.rate_limiter.record(kind, None)
+            return res
+
+    def _send(self, endpoint, method, data, timer=NULL_TIMER, content_encoding=None):
+        headers = self._signed_headers(endpoint, method)
+        if content_encoding is not None:
+            headers['Content-Encoding'] = content_encoding
+        timer.mark('sign')
+        try:
+            resp, content = self.http.request(endpoint, method, body=data, headers=headers)
+        finally:
+            timer.mark('network')
+        # Other threads may be making requests too, so only look at
+        # this request's own headers. self.headers is kept up to date
+        # for get_most_recent_http_headers().
+        self.headers = resp
+        timer.note(status=int(resp['status']), response_bytes=len(content or ''))
+
+        if resp['status'][0] not in ('2', '3'):
+            raise APIError(int(resp['status']), content, resp)
+
+        return resp, content
+
+    def _send_stream(self, endpoint, method, timer=NULL_TIMER):
+        """
+        Like _send(), but returns a tuple of (headers as dict,
+        iterator of body chunks) so that the body can be processed as
+        it arrives. If self.http has no request_stream() method (for
+        example if it is a plain httplib2.Http) then the whole body
+        is read and returned as a single chunk.
+        """
+        headers = self._signed_headers(endpoint, method)
+        timer.mark('sign')
+        request_stream = getattr(self.http, 'request_stream', None)
+        try:
+            if request_stream is None:
+                resp, content = self.http.request(endpoint, method, body=None, headers=headers)
+                chunks = iter([content])
+            else:
+                resp, chunks = request_stream(endpoint, method, headers=headers)
+        finally:
+            timer.mark('network')
+        self.headers = resp
+        timer.note(status=int(resp['status']))
 
-        result = self._request(endpoint, 'GET')[1]
+        if resp['status'][0] not in ('2', '3'):
+            raise APIError(int(resp['status']), ''.join(chunks), resp)
 
-        fc = json_decode(result)
-        return [Feature.from_dict(f) for f in fc['features']]
+        return resp, chunks
@@ -0,0 +1,82 @@
+import time
+
+from collections import namedtuple
+
+from pyutil.assertutil import precondition
+
+from simplegeo.places.concurrency import imap_unordered
+
+class Outcome(namedtuple('Outcome', ['handle', 'ok', 'result', 'error', 'seconds'])):
+    """
+    The outcome of one item of a bulk operation: the simplegeohandle
+    it was for, whether it succeeded, what the request returned if it
+    did, the exception it raised if it didn't, and how many seconds it
+    took.
+    """
+    __slots__ = ()
+
+class BulkOperation(object):
+    """
+    Runs func on each of items, concurrency at a time. Iterating over
+    a BulkOperation runs it, yielding an Outcome for each item as it
+    finishes (not necessarily in the order of items), so that one
+    failure doesn't stop the rest. summary() then reports the
+    totals and the throughput.
+    """
+    def __init__(self, func, items, handle_of, concurrency=8, clock=time.time):
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        self.func = func
+        self.items = items
+        self.handle_of = handle_of
+        self.concurrency = concurrency
+        self.clock = clock
+        self.succeeded = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+
+    def _timed(self, item):
+        started = self.clock()
+        try:
+            result = self.func(item)
+        except Exception, e:
+            return (False, e, self.clock() - started)
+        return (True, result, self.clock() - started)
+
+    def __iter__(self):
+        precondition(self.started is None, "A BulkOperation can only be run once.")
+        self.started = self.clock()
+        try:
+            for (item, (ok, result, seconds), exc_info) in imap_unordered(self._timed, self.items, self.concurrency):
+                if ok:
+                    self.succeeded += 1
+                    yield Outcome(self.handle_of(item), True, result, None, seconds)
+                else:
+                    self.failed += 1
+                    yield Outcome(self.handle_of(item), False, None, result, seconds)
+        finally:
+            self.finished = self.clock()
+
+    def run(self):
+        """ Run to completion and return the list of Outcomes. """
+        return list(self)
+
+    def summary(self):
+        """ Return a dict of the number of items which succeeded and
+        failed so far, the elapsed seconds, and the items per second. """
+        if self.started is None:
+            seconds = 0.0
+        else:
+            seconds = (self.finished or self.clock()) - self.started
+        total = self.succeeded + self.failed
+        if seconds > 0:
+            per_second = total / seconds
+        else:
+            per_second = None
+        return {
+            'total': total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'seconds': seconds,
+            'per_second': per_second,
+            }
@@ -0,0 +1,446 @@
+import math, re, threading, time, unicodedata
+
+import ipaddr
+
+from pyutil.assertutil import precondition
+
+from simplegeo.shared import APIError
+
+from simplegeo.places.geo import bounding_box, circle_contains, distance_km, point_coordinates
+
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+class _LinkedDict(object):
+    """
+    A dict which remembers the order in which its keys were inserted,
+    oldest first, with the parts of collections.OrderedDict's interface
+    which the caches use. OrderedDict is new in Python 2.7, and this
+    package supports 2.6. Each key maps to a [prev, next, key, value]
+    link of a circular doubly linked list, so that every operation
+    takes constant time.
+    """
+    def __init__(self):
+        self._map = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._map)
+
+    def __setitem__(self, key, value):
+        link = self._map.get(key)
+        if link is not None:
+            # Like OrderedDict, replacing a value keeps its place.
+            link[_VALUE] = value
+            return
+        root = self._root
+        last = root[_PREV]
+        last[_NEXT] = root[_PREV] = self._map[key] = [last, root, key, value]
+
+    def __delitem__(self, key):
+        link = self._map.pop(key)
+        link[_PREV][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREV] = link[_PREV]
+
+    def pop(self, key, *default):
+        if key not in self._map:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self._map[key][_VALUE]
+        del self[key]
+        return value
+
+    def popitem(self, last=True):
+        """ Remove and return the newest (key, value) pair, or the
+        oldest if last is False. """
+        if not self._map:
+            raise KeyError('dictionary is empty')
+        if last:
+            link = self._root[_PREV]
+        else:
+            link = self._root[_NEXT]
+        del self[link[_KEY]]
+        return (link[_KEY], link[_VALUE])
+
+    def itervalues(self):
+        root = self._root
+        link = root[_NEXT]
+        while link is not root:
+            # Fetch the next link first, so that the caller can delete
+            # the current one.
+            nextlink = link[_NEXT]
+            yield link[_VALUE]
+            link = nextlink
+
+    def clear(self):
+        self._map.clear()
+        root = self._root
+        root[:] = [root, root, None, None]
+
+class LRUCache(object):
+    """
+    A thread-safe mapping which holds at most maxsize entries,
+    evicting the least recently used one to make room for a new one,
+    and which forgets each entry ttl seconds after it was put in.
+    """
+    def __init__(self, maxsize=1024, ttl=300, clock=time.time):
+        precondition(isinstance(maxsize, (int, long)) and maxsize >= 1, maxsize)
+        precondition(ttl is None or ttl > 0, ttl)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = _LinkedDict() # key -> (expires, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            try:
+                (expires, value) = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= self.clock():
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries[key] = (expires, value)
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def put(self, key, value, ttl=None):
+        """ Add an entry, which expires after ttl seconds, or after
+        self.ttl seconds if ttl is None. """
+        if ttl is None:
+            ttl = self.ttl
+        expires = None
+        if ttl is not None:
+            expires = self.clock() + ttl
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (expires, value)
+        finally:
+            self._lock.release()
+
+    def discard(self, key):
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ Return a dict of the hit, miss, eviction and expiration
+        counters and the current size. """
+        self._lock.acquire()
+        try:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                }
+        finally:
+            self._lock.release()
+
+def _normalize_term(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return s or None
+
+class SearchCache(LRUCache):
+    """
+    An LRUCache for the results of Client.search(). Searches are
+    looked up by their lat/lon rounded to precision decimal places
+    (4 places is about 11 meters), their radius, query and category,
+    so that searches for nearly the same spot share an entry. Set
+    precision to None to not round at all.
+    """
+    def __init__(self, maxsize=1024, ttl=300, precision=4, clock=time.time):
+        LRUCache.__init__(self, maxsize=maxsize, ttl=ttl, clock=clock)
+        precondition(precision is None or isinstance(precision, (int, long)), precision)
+        self.precision = precision
+
+    def key(self, lat, lon, radius=None, query=None, category=None):
+        if self.precision is None:
+            lat, lon = str(lat), str(lon)
+        else:
+            lat, lon = round(float(lat), self.precision), round(float(lon), self.precision)
+        if radius:
+            radius = float(radius)
+        else:
+            radius = None
+        return (lat, lon, radius, _normalize_term(query), _normalize_term(category))
+
+class IPSearchCache(LRUCache):
+    """
+    An LRUCache for the results of Client.search_by_ip() and
+    Client.search_by_my_ip().
+
+    IP addresses are bucketed by network, so that searches from every
+    address in the same /ipv4_prefix (for IPv4) or /ipv6_prefix (for
+    IPv6) network share one entry. Set a prefix to 32 (or 128) to not
+    bucket at all.
+
+    The result of search_by_my_ip() depends only on the IP address of
+    this process's connection to the server, so it is kept for
+    my_ip_ttl seconds.
+    """
+    def __init__(self, maxsize=1024, ttl=300, ipv4_prefix=24, ipv6_prefix=48, my_ip_ttl=300, clock=time.time):
+        LRUCache.__init__(self, maxsize=maxsize, ttl=ttl, clock=clock)
+        precondition(0 <= ipv4_prefix <= 32, ipv4_prefix)
+        precondition(0 <= ipv6_prefix <= 128, ipv6_prefix)
+        precondition(my_ip_ttl is None or my_ip_ttl > 0, my_ip_ttl)
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.my_ip_ttl = my_ip_ttl
+
+    def key(self, ipaddress, radius=None, query=None, category=None):
+        """ Pass None for ipaddress for the key of a search_by_my_ip(). """
+        if radius:
+            radius = float(radius)
+        else:
+            radius = None
+        if ipaddress is None:
+            network = None
+        else:
+            address = ipaddr.IPAddress(ipaddress)
+            if address.version == 4:
+                prefix = self.ipv4_prefix
+            else:
+                prefix = self.ipv6_prefix
+            network = str(ipaddr.IPNetwork('%s/%d' % (address, prefix)).masked())
+        return (network, radius, _normalize_term(query), _normalize_term(category))
+
+    def put(self, key, value, ttl=None):
+        if ttl is None and key[0] is None:
+            ttl = self.my_ip_ttl
+        LRUCache.put(self, key, value, ttl=ttl)
+
+_WHITESPACE_R = re.compile(r'\s+', re.UNICODE)
+
+class AddressCache(LRUCache):
+    """
+    An LRUCache which remembers where addresses passed to
+    Client.search_by_address() are, so that searching near the same
+    address again can use the cheaper lat/lon search() instead of
+    having the server geocode the address again.
+
+    Addresses are looked up without regard to case, to runs of
+    whitespace, or to whether they were given as unicode or as utf-8
+    bytes. Addresses which the server couldn't resolve are remembered
+    for negative_ttl seconds, during which searching near them again
+    raises the same APIError without asking the server.
+    """
+    def __init__(self, maxsize=10000, ttl=24*60*60, negative_ttl=10*60, clock=time.time):
+        LRUCache.__init__(self, maxsize=maxsize, ttl=ttl, clock=clock)
+        precondition(negative_ttl is None or negative_ttl > 0, negative_ttl)
+        self.negative_ttl = negative_ttl
+
+    def key(self, address):
+        if not isinstance(address, unicode):
+            address = address.decode('utf-8', 'replace')
+        address = unicodedata.normalize('NFKC', address)
+        return _WHITESPACE_R.sub(u' ', address).strip().lower()
+
+    def get_location(self, address):
+        """ Return the (lat, lon) of address, or None if it isn't
+        known. Raises APIError if the address is known to be
+        unresolvable. """
+        res = self.get(self.key(address))
+        if isinstance(res, APIError):
+            raise APIError(res.code, res.msg, res.headers, res.description)
+        return res
+
+    def put_location(self, address, lat, lon):
+        self.put(self.key(address), (lat, lon))
+
+    def put_failure(self, address, apierror):
+        if self.negative_ttl is not None:
+            self.put(self.key(address), apierror, ttl=self.negative_ttl)
+
+class _SpatialEntry(object):
+    __slots__ = ('lat', 'lon', 'radius', 'terms', 'featuredicts', 'points', 'expires', 'cells')
+
+class SpatialCache(object):
+    """
+    Remembers the features returned by searches, indexed by location,
+    so that a later search whose circle lies entirely within the
+    circle of an earlier search with the same query and category can
+    be answered locally, by picking out the earlier search's features
+    which are within the new circle.
+
+    Only results which are known to be complete can be used like this.
+    The server returns at most a limited number of features per
+    search, so a result with truncated_at or more features is assumed
+    to be missing some and is not remembered. Searches with no radius
+    (for which the server chooses the radius) and results which
+    include anything other than Points are not remembered either.
+
+    Each result is forgotten ttl seconds after it was fetched, and the
+    oldest results are forgotten to keep the total number of features
+    remembered at or below max_features.
+
+    The index is a grid of cells cell_size degrees on a side. Each
+    remembered search is listed in every cell which its circle
+    overlaps, so the searches which could contain a new search are
+    found by looking in the cell which holds the new search's center.
+    """
+    def __init__(self, max_features=100000, ttl=300, truncated_at=25, cell_size=0.05, clock=time.time):
+        precondition(isinstance(max_features, (int, long)) and max_features >= 1, max_features)
+        precondition(ttl > 0, ttl)
+        precondition(cell_size > 0, cell_size)
+        self.max_features = max_features
+        self.ttl = ttl
+        self.truncated_at = truncated_at
+        self.cell_size = cell_size
+        self.clock = clock
+        self._entries = _LinkedDict() # id(entry) -> entry, oldest first
+        self._cells = {} # (i, j) -> set of entries
+        self._numfeatures = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(float(lat) / self.cell_size)), int(math.floor(float(lon) / self.cell_size)))
+
+    def put(self, lat, lon, radius, query, category, featuredicts):
+        """ Remember the result of a search, if it can be used to
+        answer later searches. Returns True if it was remembered. """
+        if not radius:
+            return False
+        if self.truncated_at is not None and len(featuredicts) >= self.truncated_at:
+            return False
+        if len(featuredicts) > self.max_features:
+            return False
+        points = []
+        for f in featuredicts:
+            point = point_coordinates(f)
+            if point is None:
+                return False
+            points.append((float(point[0]), float(point[1])))
+        bbox = bounding_box(lat, lon, radius)
+        if bbox is None:
+            return False
+        (south, west, north, east) = bbox
+        (i0, j0) = self._cell(south, west)
+        (i1, j1) = self._cell(north, east)
+
+        entry = _SpatialEntry()
+        entry.lat, entry.lon, entry.radius = float(lat), float(lon), float(radius)
+        entry.terms = (_normalize_term(query), _normalize_term(category))
+        entry.featuredicts = featuredicts
+        entry.points = points
+        entry.expires = self.clock() + self.ttl
+        entry.cells = [(i, j) for i in xrange(i0, i1+1) for j in xrange(j0, j1+1)]
+
+        self._lock.acquire()
+        try:
+            self._expire()
+            while self._entries and self._numfeatures + len(featuredicts) > self.max_features:
+                self._remove(self._entries.itervalues().next())
+                self.evictions += 1
+            self._entries[id(entry)] = entry
+            self._numfeatures += len(featuredicts)
+            for cell in entry.cells:
+                self._cells.setdefault(cell, set()).add(entry)
+        finally:
+            self._lock.release()
+        return True
+
+    def get(self, lat, lon, radius, query=None, category=None):
+        """ Return the list of remembered feature dicts which are
+        within the circle, or None if the circle isn't entirely within
+        a remembered search. """
+        if not radius:
+            return None
+        terms = (_normalize_term(query), _normalize_term(category))
+        self._lock.acquire()
+        try:
+            self._expire()
+            best = None
+            for entry in self._cells.get(self._cell(lat, lon), ()):
+                if entry.terms == terms and circle_contains(entry.lat, entry.lon, entry.radius, lat, lon, radius):
+                    if best is None or entry.expires > best.expires:
+                        best = entry
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        finally:
+            self._lock.release()
+
+        lat, lon, radius = float(lat), float(lon), float(radius)
+        return [f for (f, (flat, flon)) in zip(best.featuredicts, best.points) if distance_km(lat, lon, flat, flon) <= radius]
+
+    def _remove(self, entry):
+        del self._entries[id(entry)]
+        self._numfeatures -= len(entry.featuredicts)
+        for cell in entry.cells:
+            entries = self._cells[cell]
+            entries.discard(entry)
+            if not entries:
+                del self._cells[cell]
+
+    def _expire(self):
+        # Every entry has the same ttl, so the oldest entries expire first.
+        now = self.clock()
+        while self._entries:
+            entry = self._entries.itervalues().next()
+            if entry.expires > now:
+                break
+            self._remove(entry)
+            self.expirations += 1
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._cells.clear()
+            self._numfeatures = 0
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """ Return a dict of the hit, miss, eviction and expiration
+        counters and the current number of searches and features
+        remembered. """
+        self._lock.acquire()
+        try:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'searches': len(self._entries),
+                'features': self._numfeatures,
+                'max_features': self.max_features,
+                }
+        finally:
+            self._lock.release()
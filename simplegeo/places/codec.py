@@ -0,0 +1,77 @@
+"""
+The JSON codecs which a Client can use to decode responses and encode
+features. A codec has decode(text), which returns the decoded object
+or raises simplegeo.shared.DecodeError, and encode(obj), which returns
+the JSON text of obj.
+"""
+import json as stdjson
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+from decimal import Decimal
+
+from pyutil import jsonutil
+
+from simplegeo.shared import DecodeError, json_decode
+
+class DecimalCodec(object):
+    """
+    The default: decodes with simplegeo.shared.json_decode and encodes
+    with pyutil.jsonutil, which represent non-integer numbers (such as
+    coordinates) exactly, as Decimals.
+    """
+    name = 'decimal'
+
+    def decode(self, text):
+        return json_decode(text)
+
+    def encode(self, obj):
+        return jsonutil.dumps(obj)
+
+def _float_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError("%r is not JSON serializable" % (obj,))
+
+class FastCodec(object):
+    """
+    Uses simplejson's C-accelerated decoder and encoder if simplejson
+    is installed, else the standard library's json module.
+
+    With Decimals, decoding a large response costs about the same as
+    with the default codec, because making the Decimals dominates. If
+    floats is True, non-integer numbers are decoded as floats instead,
+    which is two to four times as fast, and coordinates then carry the
+    (usually invisible) rounding error of binary floating point.
+    """
+    def __init__(self, floats=False):
+        self.floats = floats
+        if floats:
+            self.name = 'float'
+        else:
+            self.name = 'fast'
+        if floats:
+            parse_float = float
+        else:
+            parse_float = Decimal
+        if simplejson is not None:
+            self._loads = simplejson.JSONDecoder(parse_float=parse_float).decode
+            self._dumps = simplejson.JSONEncoder(use_decimal=True).encode
+        else:
+            self._loads = stdjson.JSONDecoder(parse_float=parse_float).decode
+            # The standard library can't encode Decimals exactly.
+            self._dumps = stdjson.JSONEncoder(default=_float_default).encode
+
+    def decode(self, text):
+        try:
+            return self._loads(text)
+        except (ValueError, TypeError), le:
+            raise DecodeError(text, le)
+
+    def encode(self, obj):
+        return self._dumps(obj)
+
+DEFAULT_CODEC = DecimalCodec()
@@ -0,0 +1,101 @@
+"""
+Search results as columns of NumPy arrays instead of a list of
+Features, for post-processing many results at once. This needs
+numpy, which is an optional dependency ("simplegeo-places[arrays]").
+"""
+import numpy
+
+from simplegeo.places.geo import EARTH_RADIUS_KM
+
+class FeatureArrays(object):
+    """
+    The results of a search, as columns: ids is an array of the
+    simplegeohandles, lat and lon are float64 arrays of the
+    coordinates (NaN for features which aren't Points), and
+    properties is a dict from each property name to an object array
+    of its values (None for features which lack it). Row i of every
+    column is the same feature.
+    """
+    def __init__(self, ids, lat, lon, properties):
+        self.ids = ids
+        self.lat = lat
+        self.lon = lon
+        self.properties = properties
+
+    @classmethod
+    def from_dicts(cls, featuredicts):
+        """ Make a FeatureArrays from a list of GeoJSON features. """
+        n = len(featuredicts)
+        ids = numpy.empty(n, dtype=object)
+        lat = numpy.empty(n, dtype=numpy.float64)
+        lon = numpy.empty(n, dtype=numpy.float64)
+        columns = {}
+        nan = float('nan')
+        for (i, f) in enumerate(featuredicts):
+            ids[i] = f.get('id')
+            geometry = f.get('geometry') or {}
+            if geometry.get('type') == 'Point':
+                coordinates = geometry['coordinates']
+                lon[i] = float(coordinates[0])
+                lat[i] = float(coordinates[1])
+            else:
+                lat[i] = lon[i] = nan
+            for (k, v) in (f.get('properties') or {}).iteritems():
+                column = columns.get(k)
+                if column is None:
+                    column = columns[k] = numpy.empty(n, dtype=object)
+                column[i] = v
+        return cls(ids, lat, lon, columns)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, name):
+        """ Return the values of the property name, or an array of
+        None if no feature has it. """
+        column = self.properties.get(name)
+        if column is None:
+            column = numpy.empty(len(self), dtype=object)
+        return column
+
+    def distance_km(self, lat, lon):
+        """ Return an array of the great-circle distance of each
+        feature from lat, lon. """
+        lat1, lon1 = numpy.radians(float(lat)), numpy.radians(float(lon))
+        lat2, lon2 = numpy.radians(self.lat), numpy.radians(self.lon)
+        a = numpy.sin((lat2 - lat1) / 2)**2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2)**2
+        return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.minimum(1.0, numpy.sqrt(a)))
+
+    def within(self, lat, lon, radius):
+        """ Return a boolean array of which features lie within radius
+        kilometers of lat, lon. """
+        with numpy.errstate(invalid='ignore'): # NaN for non-Points
+            return self.distance_km(lat, lon) <= float(radius)
+
+    def take(self, selector):
+        """ Return a FeatureArrays of the rows picked by selector: a
+        boolean mask or an array of indices. """
+        return self.__class__(self.ids[selector], self.lat[selector], self.lon[selector],
+                              dict((k, v[selector]) for (k, v) in self.properties.iteritems()))
+
+    def nearest(self, lat, lon, n=None):
+        """ Return a FeatureArrays of the (first n) features sorted by
+        their distance from lat, lon. """
+        order = numpy.argsort(self.distance_km(lat, lon), kind='mergesort')
+        if n is not None:
+            order = order[:n]
+        return self.take(order)
+
+    def unique(self):
+        """ Return a FeatureArrays without the rows whose
+        simplegeohandle appeared in an earlier row. """
+        seen = set()
+        keep = numpy.zeros(len(self), dtype=bool)
+        for (i, handle) in enumerate(self.ids):
+            if handle is None or handle not in seen:
+                seen.add(handle)
+                keep[i] = True
+        return self.take(keep)
+
+    def __repr__(self):
+        return '<%s of %d features with properties %s>' % (self.__class__.__name__, len(self), sorted(self.properties))
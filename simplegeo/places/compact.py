@@ -0,0 +1,104 @@
+from simplegeo.shared import Feature, deep_swap
+
+# The properties whose values are strings drawn from a small
+# vocabulary, and so are repeated across the features of a response.
+_CLASSIFIER_KEYS = ('category', 'type', 'subcategory')
+
+class StringTable(object):
+    """
+    Interns strings within one response, so that equal strings (keys
+    of properties, category names) are stored once instead of once
+    per feature. Works for unicode as well as str, unlike intern().
+    """
+    def __init__(self):
+        self._strings = {}
+
+    def intern(self, s):
+        return self._strings.setdefault(s, s)
+
+    def intern_properties(self, properties):
+        intern = self.intern
+        res = {}
+        for (k, v) in properties.iteritems():
+            if k == 'classifiers' and isinstance(v, list):
+                v = [self._intern_classifier(c) for c in v]
+            elif k == 'tags' and isinstance(v, list):
+                v = [isinstance(t, basestring) and intern(t) or t for t in v]
+            res[intern(k)] = v
+        return res
+
+    def _intern_classifier(self, classifier):
+        if not isinstance(classifier, dict):
+            return classifier
+        intern = self.intern
+        res = {}
+        for (k, v) in classifier.iteritems():
+            if k in _CLASSIFIER_KEYS and isinstance(v, basestring):
+                v = intern(v)
+            res[intern(k)] = v
+        return res
+
+class CompactFeature(object):
+    """
+    A lightweight, read-only search result, returned instead of a
+    Feature by the search methods when they are called with
+    compact=True.
+
+    It has the id (simplegeohandle), coordinates (lat, lon order, a
+    tuple for a point) and geomtype of a Feature, and its properties
+    dict is only built when it is first used, with its keys and
+    category strings shared with the other results of the same
+    response. Unlike a Feature it is not validated when it is
+    created; to_feature() converts it to a (validated) Feature.
+    """
+    __slots__ = ('id', 'coordinates', 'geomtype', '_raw', '_properties', '_table')
+
+    def __init__(self, simplegeohandle, coordinates, geomtype, rawproperties, table):
+        self.id = simplegeohandle
+        self.coordinates = coordinates
+        self.geomtype = geomtype
+        self._raw = rawproperties
+        self._properties = None
+        self._table = table
+
+    @classmethod
+    def from_dict(cls, data, table=None):
+        """ data is a GeoJSON feature, as in Feature.from_dict(). """
+        if table is None:
+            table = StringTable()
+        geometry = data['geometry']
+        coordinates = geometry['coordinates']
+        if len(coordinates) == 2 and not isinstance(coordinates[0], (list, tuple)):
+            coordinates = (coordinates[1], coordinates[0])
+        else:
+            coordinates = deep_swap(coordinates)
+        return cls(data.get('id'), coordinates, table.intern(geometry['type']), data.get('properties') or {}, table)
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._properties = self._table.intern_properties(self._raw)
+            self._raw = None
+            self._table = None
+        return self._properties
+
+    def get(self, name, default=None):
+        """ Return the property name, or default if it has none. """
+        if self._properties is None:
+            return self._raw.get(name, default)
+        return self._properties.get(name, default)
+
+    def to_feature(self):
+        return Feature(self.coordinates, geomtype=self.geomtype, simplegeohandle=self.id, properties=self.properties)
+
+    def to_dict(self):
+        return self.to_feature().to_dict()
+
+    def __repr__(self):
+        return '<%s %s %s at %r>' % (self.__class__.__name__, self.id, self.geomtype, self.coordinates)
+
+def compact_features(featuredicts):
+    """ Return a list of CompactFeatures made from the GeoJSON
+    features featuredicts, sharing one StringTable. """
+    table = StringTable()
+    return [CompactFeature.from_dict(f, table) for f in featuredicts]
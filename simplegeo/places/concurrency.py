@@ -0,0 +1,130 @@
+import sys, threading, Queue
+
+from pyutil.assertutil import precondition
+
+_DONE = object()
+
+def imap_unordered(func, iterable, concurrency):
+    """
+    Call func(item) for each item of iterable on up to concurrency
+    worker threads, and yield (item, result, exc_info) tuples in the
+    order in which the calls finish. exc_info is None if func
+    returned normally, else it is the sys.exc_info() of the exception
+    that func raised, and result is None.
+
+    Items are pulled from iterable lazily, one at a time, so at most
+    concurrency calls are in flight and at most concurrency finished
+    results are waiting to be consumed. If the caller stops iterating
+    early (or closes the generator) no further items are pulled.
+    """
+    precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+
+    it = iter(iterable)
+    itlock = threading.Lock()
+    stopped = threading.Event()
+    results = Queue.Queue(maxsize=concurrency)
+
+    def _put(res):
+        # Don't block forever on a full queue if the consumer went away.
+        while not stopped.is_set():
+            try:
+                results.put(res, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def _work():
+        try:
+            while not stopped.is_set():
+                try:
+                    itlock.acquire()
+                    try:
+                        item = it.next()
+                    finally:
+                        itlock.release()
+                except StopIteration:
+                    return
+                except Exception:
+                    # The iterable itself failed; hand that to the consumer.
+                    _put((_DONE, None, sys.exc_info()))
+                    return
+                try:
+                    res = (item, func(item), None)
+                except Exception:
+                    res = (item, None, sys.exc_info())
+                _put(res)
+        finally:
+            _put((_DONE, None, None))
+
+    workers = [threading.Thread(target=_work) for i in range(concurrency)]
+    for w in workers:
+        w.daemon = True
+        w.start()
+
+    try:
+        running = len(workers)
+        while running:
+            item, result, exc_info = results.get()
+            if item is _DONE:
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                running -= 1
+                continue
+            yield item, result, exc_info
+    finally:
+        stopped.set()
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls which have the same key: while a call
+    for a key is in progress, other threads which ask for the same key
+    wait for it to finish and then get its result (or have its
+    exception raised) instead of making their own call.
+
+    Nothing is remembered once a call has finished, so this never
+    returns stale results.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, func):
+        self._lock.acquire()
+        call = self._calls.get(key)
+        if call is not None:
+            self.shared += 1
+            self._lock.release()
+            call.done.wait()
+            if call.exc_info is not None:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+        call = self._calls[key] = _Call()
+        self.calls += 1
+        self._lock.release()
+
+        try:
+            call.result = func()
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            self._lock.acquire()
+            try:
+                del self._calls[key]
+            finally:
+                self._lock.release()
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """ Return a dict of the number of calls made and the number
+        of calls which shared another's result instead. """
+        return {'calls': self.calls, 'shared': self.shared}
@@ -0,0 +1,141 @@
+"""
+Remembering which simplegeohandle each feature got when it was added,
+so that adding the same feature again doesn't create a duplicate.
+"""
+import hashlib, os, re, threading
+
+from decimal import Decimal
+
+from pyutil import jsonutil
+
+from simplegeo.shared import is_simplegeohandle
+
+_LINE_R = re.compile(r'^([0-9a-f]{40}) (\S+)$')
+
+def _canonical(obj):
+    """ Return obj with its numbers and strings put into one form, so
+    that equal features encode the same way. """
+    if isinstance(obj, dict):
+        return dict((_canonical(k), _canonical(v)) for (k, v) in obj.iteritems())
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(x) for x in obj]
+    if isinstance(obj, float):
+        obj = Decimal(repr(obj))
+    if isinstance(obj, Decimal):
+        return obj.normalize()
+    if isinstance(obj, str):
+        try:
+            return obj.decode('utf-8')
+        except UnicodeDecodeError:
+            return obj
+    return obj
+
+def content_hash(feature):
+    """
+    Return the hex SHA-1 of the canonical JSON of feature, without its
+    id: its keys sorted, no whitespace, strings as unicode and numbers
+    normalized, so that Decimal('10.040') and 10.04 hash the same.
+    """
+    d = feature.to_dict()
+    d.pop('id', None)
+    doc = jsonutil.dumps(_canonical(d), sort_keys=True, separators=(',', ':'))
+    if isinstance(doc, unicode):
+        doc = doc.encode('utf-8')
+    return hashlib.sha1(doc).hexdigest()
+
+class DedupIndex(object):
+    """
+    A thread-safe map from the content_hash() of each feature which
+    has been added to the simplegeohandle it was given.
+
+    If path is given the index is also appended to that file, one
+    "hash handle" line per feature, and loaded from it when the
+    DedupIndex is made, so that it survives restarts. Each line is
+    written with a single append, and only after the server has
+    confirmed the add, so a crash can at worst leave a torn last line,
+    which is ignored when loading. If fsync is True each line is
+    fsynced before put() returns.
+    """
+    def __init__(self, path=None, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._fd = None
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+        if path is not None:
+            torn = self._load()
+            self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0666)
+            if torn:
+                # End the torn line, so that it doesn't swallow the next.
+                os.write(self._fd, '\n')
+
+    def _load(self):
+        """ Load the file, and return True if its last line is torn. """
+        if not os.path.exists(self.path):
+            return False
+        line = ''
+        f = open(self.path, 'rb')
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    # Torn, and a torn handle can still look whole.
+                    continue
+                mo = _LINE_R.match(line.strip())
+                if mo is None or not is_simplegeohandle(mo.group(2)):
+                    continue
+                self._handles[mo.group(1)] = mo.group(2)
+                self.loaded += 1
+        finally:
+            f.close()
+        return bool(line) and not line.endswith('\n')
+
+    def get(self, key):
+        """ Return the simplegeohandle of the feature with content_hash()
+        key, or None if it hasn't been added. """
+        self._lock.acquire()
+        try:
+            handle = self._handles.get(key)
+            if handle is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return handle
+        finally:
+            self._lock.release()
+
+    def put(self, key, handle):
+        """ Record that the feature with content_hash() key was added
+        and given the simplegeohandle handle. """
+        self._lock.acquire()
+        try:
+            if self._fd is not None:
+                os.write(self._fd, '%s %s\n' % (key, handle))
+                if self.fsync:
+                    os.fsync(self._fd)
+            self._handles[key] = handle
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """ Return a dict of the numbers of hits, misses, features in
+        the index, and features loaded from the file. """
+        self._lock.acquire()
+        try:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._handles), 'loaded': self.loaded}
+        finally:
+            self._lock.release()
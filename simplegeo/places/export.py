@@ -0,0 +1,275 @@
+"""
+Exporting the places in an area to a file of newline-delimited GeoJSON
+features (NDJSON), one search at a time, such that an export which is
+interrupted can be resumed where it stopped.
+"""
+import gzip, json, os, time
+
+from pyutil.assertutil import precondition
+
+from simplegeo.places.concurrency import imap_unordered
+from simplegeo.places.tiling import initial_tiles, Tile
+
+CHECKPOINT_VERSION = 1
+
+class Export(object):
+    """
+    Searches each of a queue of work items and appends the features
+    found to the file at path, one GeoJSON feature per line, skipping
+    features (by simplegeohandle) which are already in the file. If
+    compress is True (the default when path ends in '.gz') the file is
+    gzipped.
+
+    A work item is a point, searched as by Client.search(), or a tile
+    of a box, which is split into four tiles that are added to the
+    queue if its search returns truncated_at or more features (see
+    Client.search_bbox()). Make an Export with for_bbox() or
+    for_points().
+
+    After each search finishes, its features are written to the file
+    and the file is flushed (and fsynced, if fsync is True). Then the
+    remaining queue and the length of the file are saved in the
+    checkpoint file (path + '.checkpoint' by default). Each search
+    result is held in memory whole until it has been written, so up to
+    about 2 * concurrency of them can be in memory at once: concurrency
+    searches in flight, and as many finished ones waiting to be
+    written. A search returns at most one page of features, so this
+    stays small.
+
+    If run() finds a checkpoint, it resumes from it. It cuts the file
+    back to the length recorded in the checkpoint, which discards
+    anything written after the last checkpoint, and then carries on
+    with the saved queue. A finished export leaves its checkpoint
+    behind with an empty queue, so running it again does nothing.
+
+    If progress is given it is called with a dict of counters (see
+    progress_report()) every progress_interval seconds and when the
+    export finishes.
+    """
+    def __init__(self, client, path, items, query=None, category=None, clip=None, concurrency=4, checkpoint_path=None, compress=None, fsync=True, truncated_at=25, min_radius=0.05, progress=None, progress_interval=5.0, clock=time.time):
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        self.client = client
+        self.path = path
+        self.items = items
+        self.query = query
+        self.category = category
+        self.clip = clip
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path or path + '.checkpoint'
+        if compress is None:
+            compress = path.endswith('.gz')
+        self.compress = compress
+        self.fsync = fsync
+        self.truncated_at = truncated_at
+        self.min_radius = min_radius
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.clock = clock
+
+        self.searches = 0
+        self.features = 0
+        self.duplicates = 0
+        self.subdivided = 0
+        self.saturated = 0
+        self.started = None
+        self.elapsed = 0.0 # in earlier runs, from the checkpoint
+        self._seen = set()
+
+    @classmethod
+    def for_bbox(cls, client, sw, ne, path, max_radius=25, **kwargs):
+        """ Export the places within the box with southwest corner sw
+        and northeast corner ne, each a (lat, lon) tuple, covering it
+        with tiles like Client.search_bbox() does. """
+        (south, west) = [float(x) for x in sw]
+        (north, east) = [float(x) for x in ne]
+        precondition(south < north and west < east, sw=sw, ne=ne)
+        items = [_tile_item(t) for t in initial_tiles(south, west, north, east, max_radius)]
+        return cls(client, path, items, clip=(south, west, north, east), **kwargs)
+
+    @classmethod
+    def for_points(cls, client, points, path, radius=None, **kwargs):
+        """ Export the places around each of points, each a (lat, lon)
+        tuple, within radius kilometers. """
+        items = [['point', float(lat), float(lon), radius is not None and float(radius) or None] for (lat, lon) in points]
+        return cls(client, path, items, **kwargs)
+
+    def run(self):
+        """ Run (or resume) the export to completion. Returns the
+        final progress_report(). """
+        queue = self._start()
+        self.started = self.clock()
+        last_report = self.started
+        out = open(self.path, 'ab')
+        try:
+            while queue:
+                # In-flight items stay in the queue until they are done, so
+                # that they are redone if the export is interrupted.
+                pending = list(queue)
+                for (item, features, exc_info) in imap_unordered(self._search, pending, self.concurrency):
+                    if exc_info is not None:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    self.searches += 1
+                    self._write(out, features)
+                    queue.remove(item)
+                    queue.extend(self._subitems(item, features))
+                    self._save_checkpoint(queue, out.tell())
+                    now = self.clock()
+                    if self.progress is not None and now - last_report >= self.progress_interval:
+                        last_report = now
+                        self.progress(self.progress_report())
+        finally:
+            out.close()
+        report = self.progress_report()
+        if self.progress is not None:
+            self.progress(report)
+        return report
+
+    def progress_report(self):
+        """ Return a dict of the numbers of searches done, features
+        written, duplicate features skipped, and tiles subdivided and
+        left saturated, and the seconds and rates so far, including
+        earlier runs which were resumed from. """
+        seconds = self.elapsed
+        if self.started is not None:
+            seconds += self.clock() - self.started
+        if seconds > 0:
+            (features_per_second, searches_per_second) = (self.features / seconds, self.searches / seconds)
+        else:
+            (features_per_second, searches_per_second) = (None, None)
+        return {
+            'searches': self.searches,
+            'features': self.features,
+            'duplicates': self.duplicates,
+            'subdivided': self.subdivided,
+            'saturated': self.saturated,
+            'seconds': seconds,
+            'features_per_second': features_per_second,
+            'searches_per_second': searches_per_second,
+            }
+
+    def _search(self, item):
+        if item[0] == 'tile':
+            (lat, lon, radius) = _item_tile(item).circle()
+        else:
+            (kind, lat, lon, radius) = item
+        return self.client.search(lat, lon, radius, self.query, self.category)
+
+    def _subitems(self, item, features):
+        if item[0] != 'tile' or self.truncated_at is None or len(features) < self.truncated_at:
+            return []
+        tile = _item_tile(item)
+        if tile.circle()[2] / 2 < self.min_radius:
+            self.saturated += 1
+            return []
+        self.subdivided += 1
+        return [_tile_item(t) for t in tile.split()]
+
+    def _write(self, out, features):
+        lines = []
+        for f in features:
+            if f.id is not None:
+                if f.id in self._seen:
+                    self.duplicates += 1
+                    continue
+                self._seen.add(f.id)
+            if self.clip is not None and f.geomtype == 'Point':
+                (south, west, north, east) = self.clip
+                (lat, lon) = f.coordinates[:2]
+                if not (south <= lat <= north and west <= lon <= east):
+                    continue
+            lines.append(self.client.codec.encode(f.to_dict()) + '\n')
+        self.features += len(lines)
+        if not lines:
+            return
+        data = ''.join(lines)
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if self.compress:
+            # Each batch is a complete gzip member, so that the file can
+            # be cut back to any checkpoint and still be valid.
+            gz = gzip.GzipFile(fileobj=out, mode='wb')
+            gz.write(data)
+            gz.close()
+        else:
+            out.write(data)
+        out.flush()
+        if self.fsync:
+            os.fsync(out.fileno())
+
+    def _start(self):
+        """ Load the checkpoint, if any, and return the queue of work
+        items to do. """
+        if not os.path.exists(self.checkpoint_path):
+            open(self.path, 'wb').close()
+            queue = list(self.items)
+            self._save_checkpoint(queue, 0)
+            return queue
+
+        f = open(self.checkpoint_path, 'rb')
+        try:
+            checkpoint = json.load(f)
+        finally:
+            f.close()
+        precondition(checkpoint.get('version') == CHECKPOINT_VERSION, "Unknown checkpoint version.", checkpoint.get('version'))
+        self.searches = checkpoint['searches']
+        self.duplicates = checkpoint['duplicates']
+        self.subdivided = checkpoint['subdivided']
+        self.saturated = checkpoint['saturated']
+        self.elapsed = checkpoint['seconds']
+
+        # Throw away whatever was written after the checkpoint was saved.
+        f = open(self.path, 'r+b')
+        try:
+            f.truncate(checkpoint['offset'])
+        finally:
+            f.close()
+        self._load_seen()
+        return checkpoint['queue']
+
+    def _load_seen(self):
+        if self.compress:
+            f = gzip.open(self.path, 'rb')
+        else:
+            f = open(self.path, 'rb')
+        try:
+            for line in f:
+                handle = self.client.codec.decode(line).get('id')
+                if handle is not None:
+                    self._seen.add(handle)
+                self.features += 1
+        finally:
+            f.close()
+
+    def _save_checkpoint(self, queue, offset):
+        report = self.progress_report()
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'path': self.path,
+            'offset': offset,
+            'queue': queue,
+            'searches': self.searches,
+            'duplicates': self.duplicates,
+            'subdivided': self.subdivided,
+            'saturated': self.saturated,
+            'seconds': report['seconds'],
+            }
+        # Write it to a temporary file and rename that over the old one,
+        # so that the checkpoint is never half-written.
+        tmppath = self.checkpoint_path + '.tmp'
+        f = open(tmppath, 'wb')
+        try:
+            json.dump(checkpoint, f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        os.rename(tmppath, self.checkpoint_path)
+
+def _tile_item(tile):
+    return ['tile', tile.south, tile.west, tile.north, tile.east, tile.depth]
+
+def _item_tile(item):
+    return Tile(*item[1:])
@@ -0,0 +1,49 @@
+"""
+Some spherical-earth geometry for working with search circles on the
+client side. Distances are in kilometers, like the radius argument of
+the search methods.
+"""
+
+from math import asin, cos, radians, sin, sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+
+# The number of kilometers per degree of latitude (and of longitude at the equator).
+KM_PER_DEGREE = 111.195
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """ Return the great-circle distance between two points. """
+    lat1, lon1, lat2, lon2 = radians(float(lat1)), radians(float(lon1)), radians(float(lat2)), radians(float(lon2))
+    a = sin((lat2 - lat1) / 2)**2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+def circle_contains(lat1, lon1, radius1, lat2, lon2, radius2):
+    """ Return True if the circle of radius2 around lat2,lon2 lies
+    entirely within the circle of radius1 around lat1,lon1. """
+    return distance_km(lat1, lon1, lat2, lon2) + float(radius2) <= float(radius1)
+
+def bounding_box(lat, lon, radius):
+    """
+    Return (south, west, north, east), in degrees, of a box which
+    contains the circle of radius around lat,lon, or None if that box
+    would contain a pole or cross the antimeridian.
+    """
+    lat, lon, radius = float(lat), float(lon), float(radius)
+    dlat = radius / KM_PER_DEGREE
+    south, north = lat - dlat, lat + dlat
+    if south <= -90 or north >= 90:
+        return None
+    dlon = dlat / min(cos(radians(south)), cos(radians(north)))
+    west, east = lon - dlon, lon + dlon
+    if west < -180 or east > 180:
+        return None
+    return (south, west, north, east)
+
+def point_coordinates(featuredict):
+    """ Return (lat, lon) of a GeoJSON Point feature dict, or None
+    if it is not a Point. """
+    geometry = featuredict.get('geometry') or {}
+    if geometry.get('type') != 'Point':
+        return None
+    lon, lat = geometry['coordinates'][:2]
+    return (lat, lon)
@@ -0,0 +1,180 @@
+import collections, sys, threading, time, Queue
+
+from pyutil.assertutil import precondition
+
+class _HedgedCall(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = Queue.Queue()
+        self.pending = 0
+        self.done = False
+
+class HedgePolicy(object):
+    """
+    Cuts the tail latency of idempotent requests by "hedging": if a
+    request hasn't been answered within a delay, a second identical
+    request is sent, and whichever answers first is used. The other
+    is abandoned: it runs to completion on its own thread, and its
+    answer is thrown away.
+
+    The delay is the given delay in seconds, or if that is None, the
+    percentile (by default the 95th) of the latencies of the last
+    window requests, but not less than min_delay. Until min_samples
+    latencies have been seen, no request is hedged.
+
+    Hedges are capped at a fraction max_rate of requests: each request
+    earns max_rate credits, up to burst, and each hedge spends one.
+
+    If the first answer is an exception and the other request is still
+    in flight, its answer is waited for; the exception is raised only
+    if both fail.
+    """
+    def __init__(self, delay=None, percentile=95, min_delay=0.005, max_rate=0.05, burst=10, min_samples=20, window=1000, clock=time.time):
+        precondition(delay is None or delay >= 0, delay)
+        precondition(0 < percentile < 100, percentile)
+        precondition(0 <= max_rate <= 1, max_rate)
+        precondition(burst >= 0, burst)
+        self.delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.burst = burst
+        self.min_samples = min_samples
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        # The percentile is recomputed after every _resort_every new
+        # latencies, rather than on every request.
+        self._resort_every = max(1, window // 20)
+        self._unsorted = 0
+        self._cutoff = None
+        self._credits = float(burst)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """ Return how many seconds to wait before hedging a request,
+        or None if it shouldn't be hedged at all. """
+        if self.delay is not None:
+            return self.delay
+        self._lock.acquire()
+        try:
+            if len(self._latencies) < self.min_samples:
+                return None
+            if self._cutoff is None or self._unsorted >= self._resort_every:
+                latencies = sorted(self._latencies)
+                self._cutoff = latencies[min(len(latencies) - 1, int(self.percentile / 100.0 * len(latencies)))]
+                self._unsorted = 0
+            return max(self.min_delay, self._cutoff)
+        finally:
+            self._lock.release()
+
+    def record(self, seconds):
+        """ Record the latency of a request which succeeded. """
+        self._lock.acquire()
+        try:
+            self._latencies.append(seconds)
+            self._unsorted += 1
+        finally:
+            self._lock.release()
+
+    def _take_credit(self):
+        self._lock.acquire()
+        try:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            self.hedges += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def call(self, func):
+        """ Call func() (on another thread), and again if it hasn't
+        returned within hedge_delay() seconds, and return the first
+        result. """
+        self._lock.acquire()
+        try:
+            self.requests += 1
+            self._credits = min(self.burst, self._credits + self.max_rate)
+        finally:
+            self._lock.release()
+
+        call = _HedgedCall()
+        def _attempt(n):
+            started = self.clock()
+            try:
+                res = (n, func(), None)
+            except Exception:
+                res = (n, None, sys.exc_info())
+            else:
+                self.record(self.clock() - started)
+            call.results.put(res)
+
+        def _start(n):
+            call.pending += 1
+            t = threading.Thread(target=_attempt, args=(n,))
+            t.daemon = True
+            t.start()
+
+        def _hedge():
+            call.lock.acquire()
+            try:
+                if not call.done and self._take_credit():
+                    _start(1)
+            finally:
+                call.lock.release()
+
+        call.lock.acquire()
+        try:
+            _start(0)
+        finally:
+            call.lock.release()
+        # The hedge is sent from a timer thread, so that this thread
+        # can wait for the answers without a timeout, which would make
+        # it poll.
+        delay = self.hedge_delay()
+        timer = None
+        if delay is not None:
+            timer = threading.Timer(delay, _hedge)
+            timer.daemon = True
+            timer.start()
+
+        first_exc_info = None
+        try:
+            while True:
+                (n, result, exc_info) = call.results.get()
+                call.lock.acquire()
+                try:
+                    call.pending -= 1
+                    if exc_info is None or not call.pending:
+                        call.done = True
+                finally:
+                    call.lock.release()
+                if exc_info is None:
+                    if n == 1:
+                        self._lock.acquire()
+                        try:
+                            self.hedge_wins += 1
+                        finally:
+                            self._lock.release()
+                    return result
+                if first_exc_info is None:
+                    first_exc_info = exc_info
+                if call.done:
+                    raise first_exc_info[0], first_exc_info[1], first_exc_info[2]
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def stats(self):
+        """ Return a dict of the number of requests, how many of them
+        were hedged, how many of those the hedge answered first, and
+        the current hedge delay. """
+        delay = self.hedge_delay()
+        self._lock.acquire()
+        try:
+            return {'requests': self.requests, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins, 'delay': delay}
+        finally:
+            self._lock.release()
@@ -0,0 +1,121 @@
+"""
+Support for Client.search_many(), which searches around many points
+at once.
+"""
+import math
+
+from simplegeo.places.geo import bounding_box, circle_contains, distance_km
+
+def plan_coverage(circles, cell_size=0.05):
+    """
+    circles is a list of (lat, lon, radius). Return a list which for
+    each circle is None if it needs to be searched, or else the index
+    of an earlier circle which needs to be searched and which contains
+    it entirely, so that its results can be picked out of that one's.
+
+    Circles with no radius (for which the server chooses the radius)
+    can only be covered by an identical circle.
+    """
+    def _cell(lat, lon):
+        return (int(math.floor(float(lat) / cell_size)), int(math.floor(float(lon) / cell_size)))
+
+    cover = []
+    same = {}  # _circle_key() -> index of the searched circle
+    cells = {} # (i, j) -> indices of the searched circles which overlap that cell
+    for (i, (lat, lon, radius)) in enumerate(circles):
+        key = _circle_key((lat, lon, radius))
+        j = same.get(key)
+        if j is None and radius:
+            for j in cells.get(_cell(lat, lon), ()):
+                jlat, jlon, jradius = circles[j]
+                if circle_contains(jlat, jlon, jradius, lat, lon, radius):
+                    break
+            else:
+                j = None
+        cover.append(j)
+        if j is not None:
+            continue
+
+        same[key] = i
+        bbox = radius and bounding_box(lat, lon, radius)
+        if bbox:
+            (south, west, north, east) = bbox
+            (si, wj) = _cell(south, west)
+            (ni, ej) = _cell(north, east)
+            for ci in range(si, ni + 1):
+                for cj in range(wj, ej + 1):
+                    cells.setdefault((ci, cj), []).append(i)
+    return cover
+
+def _circle_key(circle):
+    (lat, lon, radius) = circle
+    return (float(lat), float(lon), radius is not None and float(radius) or None)
+
+def same_circle(a, b):
+    """ Return True if the (lat, lon, radius) circles a and b are the
+    same search, so that one's results are exactly the other's. """
+    return _circle_key(a) == _circle_key(b)
+
+def is_complete(features, truncated_at):
+    """ Return True if the result of a search can be used to answer
+    the searches it contains: if it has fewer than truncated_at
+    features (so that none were left out) and they are all Points. """
+    if truncated_at is not None and len(features) >= truncated_at:
+        return False
+    for f in features:
+        if f.geomtype != 'Point':
+            return False
+    return True
+
+def within(features, lat, lon, radius):
+    """ Return the features (all Points) within the circle. """
+    return [f for f in features if distance_km(lat, lon, f.coordinates[0], f.coordinates[1]) <= float(radius)]
+
+class MultiSearchResult(object):
+    """
+    The merged results of Client.search_many(). Iterating over it
+    yields (feature, points) for each distinct feature (by
+    simplegeohandle), in the order in which they were first found,
+    where points is the list of the indices of the points whose
+    circles the feature was found in.
+
+    searched is the number of searches which were sent, and skipped is
+    the number of points which were answered from the results of
+    another point's search instead.
+    """
+    def __init__(self, searched=0, skipped=0):
+        self.features = []
+        self.points = []
+        self._index = {} # simplegeohandle -> index into self.features
+        self.searched = searched
+        self.skipped = skipped
+
+    def add(self, point, features):
+        """ Record that features were found around the point with
+        index point. """
+        for f in features:
+            i = None
+            if f.id is not None:
+                i = self._index.get(f.id)
+            if i is None:
+                i = len(self.features)
+                if f.id is not None:
+                    self._index[f.id] = i
+                self.features.append(f)
+                self.points.append([])
+            if not self.points[i] or self.points[i][-1] != point:
+                self.points[i].append(point)
+
+    def points_for(self, feature):
+        """ Return the indices of the points whose circles feature was
+        found in. """
+        i = self._index.get(feature.id)
+        if i is None:
+            return []
+        return self.points[i]
+
+    def __iter__(self):
+        return iter(zip(self.features, self.points))
+
+    def __len__(self):
+        return len(self.features)
@@ -0,0 +1,227 @@
+import threading, time
+
+from pyutil.assertutil import precondition
+
+from simplegeo.shared import APIError
+
+# The HTTP statuses with which the server says we are sending too many
+# requests.
+THROTTLE_STATUSES = (429, 503)
+
+SEARCH = 'search'
+WRITE = 'write'
+
+def request_kind(method):
+    """ Return which of a RateLimiter's buckets a request with the
+    given HTTP method draws from: GETs are searches (and lookups), and
+    everything else is a write. """
+    if method in ('GET', 'HEAD'):
+        return SEARCH
+    return WRITE
+
+class RateLimitExceeded(APIError):
+    """ The request was not sent because it would exceed the rate
+    limit. """
+    def __init__(self, kind, retry_in):
+        APIError.__init__(self, None, "Not sending the request because it would exceed the %s rate limit." % (kind,), None, "A request can be sent in %0.2f seconds." % (retry_in,))
+        self.kind = kind
+        self.retry_in = retry_in
+
+class TokenBucket(object):
+    """
+    Holds up to burst tokens, and gains rate tokens per second. The
+    rate can be cut below max_rate, after which it climbs back to
+    max_rate by max_rate / recovery_time per second.
+
+    Not thread-safe; RateLimiter locks around it.
+    """
+    def __init__(self, rate, burst, recovery_time, now):
+        precondition(rate > 0, rate)
+        precondition(burst >= 1, burst)
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst
+        self.recovery_time = recovery_time
+        self.tokens = float(burst)
+        self.last = now
+        self.paused_until = now
+
+    def refill(self, now):
+        elapsed = max(0.0, now - self.last)
+        self.last = now
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / self.recovery_time * elapsed)
+        self.tokens = min(self.burst, self.tokens + self.rate * elapsed)
+
+    def wait(self, now):
+        """ Return how many seconds until a token is free. """
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+class RateLimiter(object):
+    """
+    Limits the rate at which a Client (and all of the threads using
+    it) sends requests, with a token bucket for searches and another
+    for writes (see request_kind()). Each allows search_rate or
+    write_rate requests per second on average, in bursts of at most
+    burst (by default, one second's worth).
+
+    When the server answers with one of throttle_statuses, the rate
+    of that bucket is multiplied by decrease (but not below min_rate),
+    at most once every cooldown seconds, so that a burst of throttled
+    responses to requests which were already in flight only counts
+    once. The rate then recovers linearly to its maximum over
+    recovery_time seconds. If the response has a Retry-After header
+    giving a number of seconds, no requests are sent from that bucket
+    until then.
+
+    If block is True, acquire() waits until the request may be sent,
+    unless that would take more than max_wait seconds; otherwise, or
+    if block is False, it raises RateLimitExceeded at once.
+    would_exceed() and try_acquire() answer without waiting.
+    """
+    def __init__(self, search_rate=10.0, write_rate=5.0, burst=None, block=True, max_wait=None, min_rate=0.1, decrease=0.5, cooldown=1.0, recovery_time=30.0, throttle_statuses=THROTTLE_STATUSES, clock=time.time, sleep=time.sleep):
+        precondition(0 < min_rate <= min(search_rate, write_rate), min_rate=min_rate, search_rate=search_rate, write_rate=write_rate)
+        precondition(0 < decrease < 1, decrease)
+        precondition(recovery_time > 0, recovery_time)
+        self.block = block
+        self.max_wait = max_wait
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.throttle_statuses = throttle_statuses
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        now = clock()
+        self._buckets = {
+            SEARCH: TokenBucket(search_rate, burst or max(1, search_rate), recovery_time, now),
+            WRITE: TokenBucket(write_rate, burst or max(1, write_rate), recovery_time, now),
+            }
+        self._last_cut = dict((kind, None) for kind in self._buckets)
+        self.waited = 0.0
+        self.rejected = 0
+        self.throttled = 0
+
+    def _take(self, kind, max_wait):
+        """ Return a tuple of (whether a token was taken, how many
+        seconds until a request of kind may be sent). A token is taken
+        if that is within max_wait seconds (None meaning forever), even
+        if it leaves the bucket in debt. """
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            bucket = self._buckets[kind]
+            bucket.refill(now)
+            wait = bucket.wait(now)
+            if max_wait is None or wait <= max_wait:
+                bucket.tokens -= 1
+                return (True, wait)
+            self.rejected += 1
+            return (False, wait)
+        finally:
+            self._lock.release()
+
+    def would_exceed(self, kind):
+        """ Return True if a request of kind can't be sent right now. """
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            bucket = self._buckets[kind]
+            bucket.refill(now)
+            return bucket.wait(now) > 0
+        finally:
+            self._lock.release()
+
+    def try_acquire(self, kind):
+        """ Take a token and return True if a request of kind can be
+        sent right now, else return False. """
+        return self._take(kind, 0)[0]
+
+    def acquire(self, kind, block=None):
+        """ Wait until a request of kind may be sent, and return how
+        many seconds that took. If block (by default self.block) is
+        False, or the wait would be longer than self.max_wait, raise
+        RateLimitExceeded instead of waiting. """
+        if block is None:
+            block = self.block
+        if block:
+            max_wait = self.max_wait
+        else:
+            max_wait = 0
+        # The token is taken now, even if it isn't there yet, so that
+        # waiting threads queue up behind one another instead of all
+        # waking at once.
+        (taken, wait) = self._take(kind, max_wait)
+        if not taken:
+            raise RateLimitExceeded(kind, wait)
+        if wait > 0:
+            self.sleep(wait)
+            self._lock.acquire()
+            try:
+                self.waited += wait
+            finally:
+                self._lock.release()
+        return wait
+
+    def record(self, kind, e):
+        """ Record the outcome of a request of kind which raised e, or
+        which succeeded if e is None. """
+        if not (isinstance(e, APIError) and e.code in self.throttle_statuses):
+            return
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            self.throttled += 1
+            bucket = self._buckets[kind]
+            bucket.refill(now)
+            last = self._last_cut[kind]
+            if last is None or now - last >= self.cooldown:
+                self._last_cut[kind] = now
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                bucket.tokens = min(bucket.tokens, 0.0)
+            retry_after = _retry_after(e.headers)
+            if retry_after is not None:
+                bucket.paused_until = max(bucket.paused_until, now + retry_after)
+        finally:
+            self._lock.release()
+
+    def rates(self):
+        """ Return a dict of the current rate of each kind of request. """
+        self._lock.acquire()
+        try:
+            now = self.clock()
+            res = {}
+            for (kind, bucket) in self._buckets.iteritems():
+                bucket.refill(now)
+                res[kind] = bucket.rate
+            return res
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """ Return a dict of the current rates, the seconds spent
+        waiting, the number of requests rejected and the number of
+        throttled responses. """
+        res = {'rates': self.rates()}
+        self._lock.acquire()
+        try:
+            res.update({'waited': self.waited, 'rejected': self.rejected, 'throttled': self.throttled})
+        finally:
+            self._lock.release()
+        return res
+
+def _retry_after(headers):
+    """ Return the seconds in the Retry-After header of headers, or
+    None if it hasn't one in that form (it could also be a date). """
+    if not headers:
+        return None
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,165 @@
+import httplib, random, socket, threading, time
+
+from pyutil.assertutil import precondition
+
+from simplegeo.shared import APIError, DecodeError
+
+# The HTTP statuses which mean that the server is (we hope
+# temporarily) unable to answer, rather than that the request was bad.
+TRANSIENT_STATUSES = (500, 502, 503, 504)
+
+def is_transient_failure(e, statuses=TRANSIENT_STATUSES):
+    """ Return True if the exception e, raised by a request, means
+    the server or the network failed, such that the same request
+    might succeed if it were tried again. """
+    if isinstance(e, DecodeError):
+        return False
+    if isinstance(e, APIError):
+        return e.code in statuses
+    return isinstance(e, (socket.error, httplib.HTTPException))
+
+class RetryPolicy(object):
+    """
+    How a Client retries requests which fail transiently (see
+    is_transient_failure()).
+
+    A request is tried at most max_attempts times. Before retry number
+    n (counting from 0) it waits for a random time between 0 and
+    min(max_delay, base_delay * 2**n) seconds ("full jitter"), or for
+    exactly that long if jitter is False.
+
+    Only idempotent requests (GET and DELETE, which is to say the
+    search methods, get_feature() and delete_feature()) are retried,
+    plus add_feature() if retry_add_feature is True. Retrying
+    add_feature() can create a duplicate if the first attempt
+    succeeded but its response was lost, unless the feature has a
+    record_id.
+    """
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=5.0, jitter=True, retry_statuses=TRANSIENT_STATUSES, retry_add_feature=False, sleep=time.sleep, random=random.random):
+        precondition(isinstance(max_attempts, (int, long)) and max_attempts >= 1, max_attempts)
+        precondition(base_delay >= 0, base_delay)
+        precondition(max_delay >= 0, max_delay)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+        self.retry_add_feature = retry_add_feature
+        self.sleep = sleep
+        self.random = random
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def delay(self, attempt):
+        """ Return how long to wait before retry number attempt. """
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        if self.jitter:
+            delay = self.random() * delay
+        return delay
+
+    def should_retry(self, e, attempt):
+        """ Return True if a request which raised e on try number
+        attempt (counting from 0) should be tried again. """
+        return attempt + 1 < self.max_attempts and is_transient_failure(e, self.retry_statuses)
+
+    def record_retry(self):
+        self._lock.acquire()
+        try:
+            self.retries += 1
+        finally:
+            self._lock.release()
+
+class CircuitOpenError(APIError):
+    """ The request was not sent because the circuit breaker is open. """
+    def __init__(self, retry_in):
+        APIError.__init__(self, None, "Not sending the request because the server has been failing.", None, "The circuit breaker will let a request through in %0.1f seconds." % (retry_in,))
+        self.retry_in = retry_in
+
+class CircuitBreaker(object):
+    """
+    Stops a Client from sending requests to a server which is failing.
+
+    The breaker starts closed, letting requests through. After
+    failure_threshold transient failures in a row (see
+    is_transient_failure()) it opens, and for reset_timeout seconds
+    every request fails at once with CircuitOpenError instead of
+    being sent. After that it is half-open: it lets one request
+    through as a probe, and closes again if the probe succeeds, or
+    opens for another reset_timeout seconds if it fails. A request
+    which fails in a way that says nothing about the server's health
+    (a 404, say, or a timeout waiting for a pooled connection) leaves
+    the state as it is, but lets another probe through.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.time):
+        precondition(isinstance(failure_threshold, (int, long)) and failure_threshold >= 1, failure_threshold)
+        precondition(reset_timeout > 0, reset_timeout)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    def before_call(self):
+        """ Raise CircuitOpenError if a request must not be sent now. """
+        self._lock.acquire()
+        try:
+            if self.state == self.CLOSED:
+                return
+            now = self.clock()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(max(0.0, self.opened_at + self.reset_timeout - now))
+        finally:
+            self._lock.release()
+
+    def record_success(self):
+        self._lock.acquire()
+        try:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+        finally:
+            self._lock.release()
+
+    def record_failure(self):
+        self._lock.acquire()
+        try:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+            self._probing = False
+        finally:
+            self._lock.release()
+
+    def record_other(self):
+        self._lock.acquire()
+        try:
+            self._probing = False
+        finally:
+            self._lock.release()
+
+    def record(self, e):
+        """ Record the outcome of a request which raised e, or which
+        succeeded if e is None. """
+        if e is None:
+            self.record_success()
+        elif is_transient_failure(e):
+            self.record_failure()
+        else:
+            self.record_other()
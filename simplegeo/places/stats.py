@@ -0,0 +1,214 @@
+import bisect, threading, time
+
+# Upper bounds of the histogram buckets: from 1 microsecond to about
+# two minutes for durations, and powers of two for sizes and counts.
+SECONDS_BOUNDS = [1e-6 * 2**i for i in range(28)]
+COUNT_BOUNDS = [2**i for i in range(32)]
+
+class Histogram(object):
+    """
+    Counts values in buckets with the given upper bounds, and keeps
+    their exact count, sum, min and max. Percentiles are estimated as
+    the upper bound of the bucket which holds them.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for (i, n) in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i == len(self.bounds):
+                    return self.max
+                return min(self.bounds[i], self.max)
+        return self.max
+
+    def snapshot(self):
+        if self.count:
+            mean = float(self.total) / self.count
+        else:
+            mean = None
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': mean,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            }
+
+class _NullTimer(object):
+    """ Used when instrumentation is turned off; does nothing. """
+    def mark(self, phase):
+        pass
+
+    def note(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+class CallTimer(object):
+    """
+    Times one call of a Client method. mark(phase) adds the time
+    since the previous mark (or since the call started) to phase, and
+    note() records facts about the response. The call is recorded when
+    the with block which it is the context manager of exits.
+    """
+    def __init__(self, instrumentation, endpoint):
+        self.instrumentation = instrumentation
+        self.endpoint = endpoint
+        self.clock = instrumentation.clock
+        self.started = self.last = self.clock()
+        self.phases = {}
+        self.status = None
+        self.response_bytes = None
+        self.features = None
+        self.error = None
+
+    def mark(self, phase):
+        now = self.clock()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        self.last = now
+
+    def note(self, status=None, response_bytes=None, features=None):
+        if status is not None:
+            self.status = status
+        if response_bytes is not None:
+            self.response_bytes = (self.response_bytes or 0) + response_bytes
+        if features is not None:
+            self.features = features
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A generator which is closed before it is finished, like an
+        # iter_search() which is stopped early, hasn't failed.
+        if exc is not None and not issubclass(exc_type, GeneratorExit):
+            self.error = exc_type.__name__
+            code = getattr(exc, 'code', None)
+            if code is not None:
+                self.status = code
+        self.instrumentation.record(self)
+        return False
+
+class Instrumentation(object):
+    """
+    Collects per-endpoint histograms of how long each phase of each
+    Client call took, and of the response sizes and the number of
+    features returned, plus counts of the HTTP statuses.
+
+    The phases are 'validate' (checking the arguments), 'build_url',
+    'rate_limit_wait', 'sign' (oauth), 'network' (sending the request
+    and reading the response), 'retry_wait', 'cache' (looking in the
+    caches), 'decode' (json) and 'construct' (building the Features).
+
+    If hook is given it is called with a dict describing each call as
+    it finishes, for exporting to a metrics system. It is called on
+    the thread which made the call, so it should be quick.
+    """
+    def __init__(self, hook=None, clock=time.time):
+        self.hook = hook
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def timer(self, endpoint):
+        return CallTimer(self, endpoint)
+
+    def record(self, timer):
+        seconds = timer.clock() - timer.started
+        self._lock.acquire()
+        try:
+            s = self._endpoints.get(timer.endpoint)
+            if s is None:
+                s = self._endpoints[timer.endpoint] = {
+                    'calls': 0,
+                    'errors': 0,
+                    'statuses': {},
+                    'seconds': Histogram(SECONDS_BOUNDS),
+                    'phases': {},
+                    'response_bytes': Histogram(COUNT_BOUNDS),
+                    'features': Histogram(COUNT_BOUNDS),
+                    }
+            s['calls'] += 1
+            if timer.error is not None:
+                s['errors'] += 1
+            if timer.status is not None:
+                s['statuses'][timer.status] = s['statuses'].get(timer.status, 0) + 1
+            s['seconds'].add(seconds)
+            for (phase, phaseseconds) in timer.phases.iteritems():
+                h = s['phases'].get(phase)
+                if h is None:
+                    h = s['phases'][phase] = Histogram(SECONDS_BOUNDS)
+                h.add(phaseseconds)
+            if timer.response_bytes is not None:
+                s['response_bytes'].add(timer.response_bytes)
+            if timer.features is not None:
+                s['features'].add(timer.features)
+        finally:
+            self._lock.release()
+
+        if self.hook is not None:
+            self.hook({
+                'endpoint': timer.endpoint,
+                'seconds': seconds,
+                'phases': timer.phases,
+                'status': timer.status,
+                'response_bytes': timer.response_bytes,
+                'features': timer.features,
+                'error': timer.error,
+                })
+
+    def stats(self):
+        """ Return a snapshot of the statistics, as a dict from
+        endpoint name to a dict of its counters and histograms. """
+        self._lock.acquire()
+        try:
+            res = {}
+            for (endpoint, s) in self._endpoints.iteritems():
+                res[endpoint] = {
+                    'calls': s['calls'],
+                    'errors': s['errors'],
+                    'statuses': dict(s['statuses']),
+                    'seconds': s['seconds'].snapshot(),
+                    'phases': dict((phase, h.snapshot()) for (phase, h) in s['phases'].iteritems()),
+                    'response_bytes': s['response_bytes'].snapshot(),
+                    'features': s['features'].snapshot(),
+                    }
+            return res
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._endpoints = {}
+        finally:
+            self._lock.release()
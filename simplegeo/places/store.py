@@ -0,0 +1,260 @@
+"""
+A persistent store of search results in an SQLite database, which
+every process on a host can share.
+"""
+import math, os, sqlite3, threading, time
+
+from pyutil import jsonutil
+
+from pyutil.assertutil import precondition
+
+from simplegeo.places.cache import SearchCache, _normalize_term
+from simplegeo.places.codec import DEFAULT_CODEC
+from simplegeo.places.geo import bounding_box, circle_contains, distance_km, point_coordinates
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    handle TEXT PRIMARY KEY,
+    lat REAL,
+    lon REAL,
+    json TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS features_expires ON features (expires);
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    radius REAL,
+    terms TEXT NOT NULL,
+    handles TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_expires ON searches (expires);
+CREATE TABLE IF NOT EXISTS search_cells (
+    i INTEGER NOT NULL,
+    j INTEGER NOT NULL,
+    search INTEGER NOT NULL REFERENCES searches (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS search_cells_ij ON search_cells (i, j);
+CREATE INDEX IF NOT EXISTS search_cells_search ON search_cells (search);
+"""
+
+class PlaceStore(object):
+    """
+    Remembers the results of Client.search() in the SQLite database
+    at path, so that every Client (in any process) which uses the same
+    file shares them. Each feature is stored once, by its
+    simplegeohandle, however many searches returned it.
+
+    A search is answered from the store if the same search (with its
+    lat/lon rounded to precision decimal places, as in SearchCache)
+    was stored less than ttl seconds ago. If local_first is True, a
+    search is also answered from the store when its circle lies within
+    the circle of a stored search with the same query and category,
+    by picking out that search's features which are within the new
+    circle, as in SpatialCache. That is only done with results known
+    to be complete: fewer than truncated_at features, all Points.
+    Stored searches are indexed by the cells of a grid cell_size
+    degrees on a side.
+
+    Results which have expired are deleted every purge_every puts (and
+    by purge()). Features are stored as JSON written with codec, which
+    should be the same as the Client's.
+
+    If the database fails (it is locked for longer than timeout
+    seconds, say, or the disk is full), get() and put() count the error
+    and carry on as if the store didn't have the result, or couldn't
+    store it, so that searches go to the server instead of failing.
+    """
+    def __init__(self, path, ttl=300, local_first=False, truncated_at=25, cell_size=0.05, precision=4, purge_every=100, timeout=10.0, codec=None, clock=time.time):
+        precondition(ttl > 0, ttl)
+        precondition(cell_size > 0, cell_size)
+        self.path = path
+        self.ttl = ttl
+        self.local_first = local_first
+        self.truncated_at = truncated_at
+        self.cell_size = cell_size
+        self.purge_every = purge_every
+        self.timeout = timeout
+        self.codec = codec or DEFAULT_CODEC
+        self.clock = clock
+        self._keys = SearchCache(precision=precision)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.covered_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._connect().close() # create the schema now
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads, nor
+        # inherited across a fork.
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = self._local.conn = self._connect()
+            self._local.pid = pid
+        return conn
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(float(lat) / self.cell_size)), int(math.floor(float(lon) / self.cell_size)))
+
+    def _key(self, lat, lon, radius, query, category):
+        return jsonutil.dumps(self._keys.key(lat, lon, radius, query, category))
+
+    def _count(self, attr):
+        self._lock.acquire()
+        try:
+            setattr(self, attr, getattr(self, attr) + 1)
+        finally:
+            self._lock.release()
+
+    def get(self, lat, lon, radius, query=None, category=None):
+        """ Return the list of stored feature dicts which answer the
+        search, or None if the store can't answer it. """
+        try:
+            return self._get(lat, lon, radius, query, category)
+        except sqlite3.Error:
+            self._count('errors')
+            return None
+
+    def _get(self, lat, lon, radius, query, category):
+        conn = self._conn()
+        now = self.clock()
+        row = conn.execute('SELECT handles FROM searches WHERE key = ? AND expires > ?', (self._key(lat, lon, radius, query, category), now)).fetchone()
+        if row is not None:
+            featuredicts = self._features(conn, jsonutil.loads(row[0]))
+            if featuredicts is not None:
+                self._count('hits')
+                return featuredicts
+
+        if self.local_first and radius:
+            terms = jsonutil.dumps((_normalize_term(query), _normalize_term(category)))
+            (i, j) = self._cell(lat, lon)
+            rows = conn.execute('SELECT s.lat, s.lon, s.radius, s.handles FROM search_cells c JOIN searches s ON s.id = c.search'
+                                ' WHERE c.i = ? AND c.j = ? AND s.terms = ? AND s.complete = 1 AND s.expires > ?'
+                                ' ORDER BY s.expires DESC', (i, j, terms, now)).fetchall()
+            for (slat, slon, sradius, handles) in rows:
+                if circle_contains(slat, slon, sradius, lat, lon, radius):
+                    featuredicts = self._features(conn, jsonutil.loads(handles))
+                    if featuredicts is None:
+                        continue
+                    self._count('covered_hits')
+                    (lat, lon, radius) = (float(lat), float(lon), float(radius))
+                    return [f for f in featuredicts if distance_km(lat, lon, *point_coordinates(f)) <= radius]
+
+        self._count('misses')
+        return None
+
+    def _features(self, conn, handles):
+        """ Return the feature dicts with the given handles, in order,
+        or None if any of them is missing. """
+        if not handles:
+            return []
+        found = {}
+        # SQLite limits the number of parameters per statement.
+        for start in range(0, len(handles), 500):
+            batch = handles[start:start+500]
+            for (handle, doc) in conn.execute('SELECT handle, json FROM features WHERE handle IN (%s)' % (','.join('?' * len(batch)),), batch):
+                found[handle] = doc
+        if len(found) < len(set(handles)):
+            return None
+        # Decode bytes, as responses are, so that the strings come out the same.
+        return [self.codec.decode(found[h].encode('utf-8')) for h in handles]
+
+    def put(self, lat, lon, radius, query, category, featuredicts):
+        """ Store the result of a search. Returns False if it couldn't
+        be stored, because a feature had no simplegeohandle or the
+        database failed. """
+        try:
+            return self._put(lat, lon, radius, query, category, featuredicts)
+        except sqlite3.Error:
+            self._count('errors')
+            return False
+
+    def _put(self, lat, lon, radius, query, category, featuredicts):
+        handles = []
+        rows = []
+        complete = bool(radius) and (self.truncated_at is None or len(featuredicts) < self.truncated_at)
+        for f in featuredicts:
+            handle = f.get('id')
+            if handle is None:
+                return False
+            point = point_coordinates(f)
+            if point is None:
+                complete = False
+                point = (None, None)
+            else:
+                point = (float(point[0]), float(point[1]))
+            handles.append(handle)
+            rows.append((handle, point[0], point[1], self.codec.encode(f)))
+        bbox = complete and bounding_box(lat, lon, radius)
+        if not bbox:
+            complete = False
+
+        expires = self.clock() + self.ttl
+        conn = self._conn()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO features (handle, lat, lon, json, expires) VALUES (?, ?, ?, ?, ?)',
+                             [row + (expires,) for row in rows])
+            conn.execute('DELETE FROM searches WHERE key = ?', (self._key(lat, lon, radius, query, category),))
+            cur = conn.execute('INSERT INTO searches (key, lat, lon, radius, terms, handles, complete, expires) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (self._key(lat, lon, radius, query, category), float(lat), float(lon), radius and float(radius) or None,
+                                jsonutil.dumps((_normalize_term(query), _normalize_term(category))), jsonutil.dumps(handles), int(complete), expires))
+            if complete:
+                (south, west, north, east) = bbox
+                (i0, j0) = self._cell(south, west)
+                (i1, j1) = self._cell(north, east)
+                conn.executemany('INSERT INTO search_cells (i, j, search) VALUES (?, ?, ?)',
+                                 [(i, j, cur.lastrowid) for i in xrange(i0, i1+1) for j in xrange(j0, j1+1)])
+
+        self._lock.acquire()
+        try:
+            self._puts += 1
+            purge = self.purge_every and self._puts % self.purge_every == 0
+        finally:
+            self._lock.release()
+        if purge:
+            self.purge()
+        return True
+
+    def purge(self):
+        """ Delete the searches and features which have expired. """
+        now = self.clock()
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM searches WHERE expires <= ?', (now,))
+            conn.execute('DELETE FROM features WHERE expires <= ?', (now,))
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM searches')
+            conn.execute('DELETE FROM features')
+
+    def stats(self):
+        """ Return a dict of this process's hit, miss and error
+        counters and the numbers of searches and features in the
+        store. """
+        conn = self._conn()
+        return {
+            'hits': self.hits,
+            'covered_hits': self.covered_hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'searches': conn.execute('SELECT COUNT(*) FROM searches').fetchone()[0],
+            'features': conn.execute('SELECT COUNT(*) FROM features').fetchone()[0],
+            }
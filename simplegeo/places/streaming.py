@@ -0,0 +1,124 @@
+import re
+
+from simplegeo.shared import DecodeError, json_decode
+
+_STRUCTURE_R = re.compile(r'[{}\[\]":,]')
+_STRING_R = re.compile(r'["\\]')
+
+class FeatureScanner(object):
+    """
+    Incrementally picks the elements of the top-level "features"
+    array out of a GeoJSON FeatureCollection which is arriving in
+    chunks, without holding more than one feature's worth of the
+    text in memory at a time.
+
+    feed() takes the next chunk of the JSON text and returns a list
+    of the JSON texts of the features which were completed by that
+    chunk. Call close() after the last chunk to check that the text
+    was complete.
+    """
+    def __init__(self, key='features'):
+        self.key = key
+        self.buf = ''
+        self.pos = 0        # how far into self.buf we have scanned
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_key = None
+        self.in_array = False  # inside the array we are looking for
+        self.elem_start = None # offset in self.buf of the current element
+        self.seen_array = False
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done:
+            return []
+        self.buf += chunk
+        found = []
+        buf = self.buf
+        pos = self.pos
+        end = len(buf)
+        while pos < end:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                    pos += 1
+                    continue
+                mo = _STRING_R.search(buf, pos)
+                if mo is None:
+                    pos = end
+                    break
+                pos = mo.start()
+                if buf[pos] == '\\':
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = buf[self.string_start:pos]
+                pos += 1
+                continue
+
+            mo = _STRUCTURE_R.search(buf, pos)
+            if mo is None:
+                pos = end
+                break
+            pos = mo.start()
+            c = buf[pos]
+            if c == '"':
+                self.in_string = True
+                self.string_start = pos + 1
+            elif c in '{[':
+                if self.in_array and self.depth == 2:
+                    self.elem_start = pos
+                elif c == '[' and self.depth == 1 and self.last_key == self.key:
+                    self.in_array = True
+                    self.seen_array = True
+                self.depth += 1
+            elif c in '}]':
+                self.depth -= 1
+                if self.depth < 0:
+                    raise DecodeError(buf, ValueError("unbalanced %r at offset %d" % (c, pos)))
+                if self.in_array and self.depth == 2:
+                    found.append(buf[self.elem_start:pos+1])
+                    self.elem_start = None
+                elif self.in_array and self.depth == 1:
+                    self.in_array = False
+                elif self.depth == 0:
+                    self.done = True
+                    pos += 1
+                    break
+            elif c == ',' and self.depth == 1:
+                self.last_key = None
+            pos += 1
+
+        # Throw away the text that we are finished with.
+        if self.elem_start is not None:
+            keep = self.elem_start
+        elif self.in_string:
+            keep = self.string_start - 1
+        else:
+            keep = pos
+        self.buf = buf[keep:]
+        self.pos = pos - keep
+        if self.elem_start is not None:
+            self.elem_start -= keep
+        if self.in_string:
+            self.string_start -= keep
+        return found
+
+    def close(self):
+        if not self.done or not self.seen_array:
+            raise DecodeError(self.buf, ValueError("incomplete FeatureCollection, or one which has no %r array" % (self.key,)))
+
+def iter_feature_dicts(chunks, decode=json_decode):
+    """
+    Yield the decoded features of a GeoJSON FeatureCollection whose
+    JSON text is given by the iterable chunks, each one as soon as
+    it has been received, decoded with decode.
+    """
+    scanner = FeatureScanner()
+    for chunk in chunks:
+        for jsonstr in scanner.feed(chunk):
+            yield decode(jsonstr)
+    scanner.close()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from decimal import Decimal as D
+
+from simplegeo.shared import APIError
+from simplegeo.places.cache import AddressCache, IPSearchCache, LRUCache, SearchCache, SpatialCache, _LinkedDict
+from simplegeo.places.geo import circle_contains, distance_km
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+class LinkedDictTest(unittest.TestCase):
+    def test_order(self):
+        d = _LinkedDict()
+        for k in 'abcd':
+            d[k] = k.upper()
+        d['b'] = 'B2' # keeps its place
+        self.failUnlessEqual(d.pop('c'), 'C')
+        self.failUnlessEqual(d.pop('c', None), None)
+        self.failUnlessRaises(KeyError, d.pop, 'c')
+        self.failUnlessEqual(list(d.itervalues()), ['A', 'B2', 'D'])
+        self.failUnlessEqual(d.popitem(last=False), ('a', 'A'))
+        self.failUnlessEqual(d.popitem(), ('d', 'D'))
+        self.failUnlessEqual(len(d), 1)
+        d.clear()
+        self.failIf(d)
+        self.failUnlessRaises(KeyError, d.popitem)
+        d['e'] = 'E'
+        self.failUnlessEqual(list(d.itervalues()), ['E'])
+
+class LRUCacheTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        c = LRUCache(maxsize=2, ttl=None)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.failUnlessEqual(c.get('a'), 1) # now 'b' is least recently used
+        c.put('c', 3)
+        self.failUnlessEqual(c.get('b'), None)
+        self.failUnlessEqual(c.get('a'), 1)
+        self.failUnlessEqual(c.get('c'), 3)
+        stats = c.stats()
+        self.failUnlessEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (3, 1, 1, 2))
+
+    def test_ttl(self):
+        clock = FakeClock()
+        c = LRUCache(maxsize=10, ttl=60, clock=clock)
+        c.put('a', 1)
+        c.put('b', 2, ttl=300)
+        clock.now += 59
+        self.failUnlessEqual(c.get('a'), 1)
+        clock.now += 1
+        self.failUnlessEqual(c.get('a'), None)
+        self.failUnlessEqual(c.get('b'), 2)
+        self.failUnlessEqual(c.stats()['expirations'], 1)
+        self.failUnlessEqual(len(c), 1)
+
+class SearchCacheTest(unittest.TestCase):
+    def test_key(self):
+        c = SearchCache(precision=3)
+        self.failUnlessEqual(c.key(D('37.80161'), -122.47831, 1, u'm❤nkey', 'animal'),
+                             c.key(37.8016, D('-122.4783'), D('1.0'), u'm❤nkey'.encode('utf-8'), u'animal'))
+        self.failIfEqual(c.key(37.8016, -122.4783, 1), c.key(37.8026, -122.4783, 1))
+        self.failIfEqual(c.key(37.8016, -122.4783, 1), c.key(37.8016, -122.4783, 2))
+        self.failIfEqual(c.key(37.8016, -122.4783, query='a'), c.key(37.8016, -122.4783, category='a'))
+        self.failUnlessEqual(c.key(37.8016, -122.4783, query=''), c.key(37.8016, -122.4783))
+
+        c = SearchCache(precision=None)
+        self.failIfEqual(c.key(D('37.80161'), -122.4783), c.key(D('37.8016'), -122.4783))
+
+def point(lat, lon, handle='SG_abcdefghijkmlnopqrstuv'):
+    return {'type': 'Feature', 'id': handle, 'geometry': {'type': 'Point', 'coordinates': [lon, lat]}, 'properties': {}}
+
+class GeoTest(unittest.TestCase):
+    def test_distance(self):
+        # San Francisco to Oakland is about 13 km.
+        d = distance_km(D('37.7749'), D('-122.4194'), 37.8044, -122.2712)
+        self.failUnless(13 < d < 14, d)
+        self.failUnlessEqual(distance_km(10, 20, 10, 20), 0)
+        self.failUnless(circle_contains(37.7749, -122.4194, 5, 37.78, -122.42, 1))
+        self.failIf(circle_contains(37.7749, -122.4194, 5, 37.78, -122.42, 4.9))
+
+class SpatialCacheTest(unittest.TestCase):
+    def test_contained_search(self):
+        clock = FakeClock()
+        c = SpatialCache(ttl=60, truncated_at=25, clock=clock)
+        near = point(37.7749, -122.4194)
+        far = point(37.80, -122.4194) # about 2.8 km north
+        self.failUnless(c.put(37.7749, -122.4194, 5, 'coffee', None, [near, far]))
+
+        self.failUnlessEqual(c.get(37.7749, -122.4194, 1, 'coffee'), [near])
+        self.failUnlessEqual(c.get(37.78, -122.4194, 3, u'coffee'), [near, far])
+        self.failUnlessEqual(c.get(37.7749, -122.4194, 1, 'tea'), None) # different query
+        self.failUnlessEqual(c.get(37.7749, -122.4194, 6, 'coffee'), None) # not contained
+        self.failUnlessEqual(c.get(37.7749, -122.40, 5, 'coffee'), None) # not contained
+        self.failUnlessEqual(c.stats()['hits'], 2)
+
+        clock.now += 60
+        self.failUnlessEqual(c.get(37.7749, -122.4194, 1, 'coffee'), None)
+        self.failUnlessEqual(c.stats()['expirations'], 1)
+        self.failUnlessEqual(c.stats()['features'], 0)
+
+    def test_not_remembered(self):
+        c = SpatialCache(truncated_at=3)
+        self.failIf(c.put(37.7749, -122.4194, 5, None, None, [point(37.7749, -122.4194)] * 3)) # maybe truncated
+        self.failIf(c.put(37.7749, -122.4194, None, None, None, [])) # server's default radius
+        polygon = {'type': 'Feature', 'id': None, 'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [0, 1], [1, 1], [0, 0]]]}, 'properties': {}}
+        self.failIf(c.put(37.7749, -122.4194, 5, None, None, [polygon]))
+        self.failIf(c.put(37.7749, 179.99, 5, None, None, [])) # crosses the antimeridian
+        self.failUnlessEqual(c.stats()['searches'], 0)
+
+    def test_max_features(self):
+        c = SpatialCache(max_features=3)
+        c.put(37.7749, -122.4194, 5, None, None, [point(37.7749, -122.4194)] * 2)
+        c.put(40.7128, -74.0060, 5, None, None, [point(40.7128, -74.0060)] * 2)
+        self.failUnlessEqual(c.stats()['evictions'], 1)
+        self.failUnlessEqual(c.stats()['features'], 2)
+        self.failUnlessEqual(c.get(37.7749, -122.4194, 1), None)
+        self.failUnlessEqual(len(c.get(40.7128, -74.0060, 1)), 2)
+
+class AddressCacheTest(unittest.TestCase):
+    def test_normalize(self):
+        c = AddressCache()
+        c.put_location(u'41 Decatur St, San Francisco, CA', D('37.7726'), D('-122.4064'))
+        self.failUnlessEqual(c.get_location('  41 decatur st,\tSAN FRANCISCO, CA '), (D('37.7726'), D('-122.4064')))
+        c.put_location(u'1 Caf\xe9 Pl', 1, 2)
+        self.failUnlessEqual(c.get_location('1 CAF\xc3\x89 PL'), (1, 2))
+        self.failUnlessEqual(c.get_location(u'1 Cafe\u0301 Pl'), (1, 2)) # decomposed e-acute
+        self.failUnlessEqual(c.get_location('2 Decatur St'), None)
+
+    def test_negative(self):
+        clock = FakeClock()
+        c = AddressCache(negative_ttl=60, clock=clock)
+        c.put_failure('nowhere at all', APIError(404, 'not found', {'status': '404'}))
+        try:
+            c.get_location('Nowhere  at all')
+        except APIError, e:
+            self.failUnlessEqual(e.code, 404)
+            self.failUnlessEqual(e.msg, 'not found')
+        else:
+            self.fail("APIError was not raised")
+        clock.now += 60
+        self.failUnlessEqual(c.get_location('nowhere at all'), None)
+
+class IPSearchCacheTest(unittest.TestCase):
+    def test_key(self):
+        c = IPSearchCache(ipv4_prefix=24, ipv6_prefix=48)
+        self.failUnlessEqual(c.key('192.0.32.10', 1, 'coffee'), c.key('192.0.32.200', D('1'), u'coffee'))
+        self.failIfEqual(c.key('192.0.32.10', 1, 'coffee'), c.key('192.0.33.10', 1, 'coffee'))
+        self.failIfEqual(c.key('192.0.32.10', 1, 'coffee'), c.key('192.0.32.10', 2, 'coffee'))
+        self.failUnlessEqual(c.key('2001:db8:1:2::5'), c.key('2001:db8:1:ffff::1'))
+        self.failIfEqual(c.key('2001:db8:1:2::5'), c.key('2001:db8:2:2::5'))
+
+        c = IPSearchCache(ipv4_prefix=32)
+        self.failIfEqual(c.key('192.0.32.10'), c.key('192.0.32.11'))
+
+    def test_my_ip_ttl(self):
+        clock = FakeClock()
+        c = IPSearchCache(ttl=300, my_ip_ttl=60, clock=clock)
+        c.put(c.key(None), 'mine')
+        c.put(c.key('192.0.32.10'), 'theirs')
+        clock.now += 60
+        self.failUnlessEqual(c.get(c.key(None)), None)
+        self.failUnlessEqual(c.get(c.key('192.0.32.10')), 'theirs')
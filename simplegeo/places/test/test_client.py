@@ -650,3 +650,638 @@ class ClientTest(unittest.TestCase):
         self.assertEqual(mockhttp.method_calls[0][0], 'request')
         self.assertEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/%s/features/%s.json' % (API_VERSION, handle))
         self.assertEqual(mockhttp.method_calls[0][1][1], 'GET')
+
+    def test_add_features(self):
+        handles = ['SG_abcdefghijklmnopqrstu%s' % (c,) for c in 'vwxyz']
+        def mockrequest(*args, **kwargs):
+            bodyobj = json.loads(kwargs['body'])
+            i = bodyobj['properties']['record_id']
+            if i == '3':
+                return ({'status': '500', 'content-type': 'application/json', }, '{"message": "help my web server is confuzzled"}')
+            return ({'status': '202', 'content-type': 'application/json', }, json.dumps({'id': handles[int(i)]}))
+
+        mockhttp = mock.Mock()
+        mockhttp.request = mockrequest
+        self.client.http = mockhttp
+
+        def gen():
+            for i in range(5):
+                yield Feature((D('37.8016'), D('-122.4783')), properties={'record_id': str(i)})
+            # This one already has a simplegeohandle, so it cannot be added.
+            yield Feature((D('37.8016'), D('-122.4783')), simplegeohandle=handles[0], properties={'record_id': 'x'})
+
+        res = dict((f.properties['record_id'], r) for (f, r) in self.client.add_features(gen(), concurrency=3))
+        self.failUnlessEqual(len(res), 6)
+        for i in ('0', '1', '2', '4'):
+            self.failUnlessEqual(res[i], handles[int(i)])
+        self.failUnless(isinstance(res['3'], APIError), res['3'])
+        self.failUnlessEqual(res['3'].code, 500)
+        self.failUnless(isinstance(res['x'], ValueError), res['x'])
+
+    def test_iter_search(self):
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys", 'category': "monkey dealership"})
+        rec2 = Feature((D('11.03'), D('10.05')), simplegeohandle='SG_abcdefghijkmlnopqrstuw', properties={'name': "Monkey Food 'R' Us", 'category': "pet food store"})
+        body = json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict(), rec2.to_dict()]})
+        chunks_read = []
+        def chunks():
+            for i in range(0, len(body), 10):
+                chunks_read.append(i)
+                yield body[i:i+10]
+
+        mockhttp = mock.Mock()
+        mockhttp.request_stream.return_value = ({'status': '200', 'content-type': 'application/json', }, chunks())
+        self.client.http = mockhttp
+
+        self.failUnlessRaises(AssertionError, self.client.iter_search, -91, 100)
+
+        res = self.client.iter_search(D('11.03'), D('10.04'), query='monkeys')
+        first = res.next()
+        self.failUnless(isinstance(first, Feature), first)
+        self.failUnlessEqual(first.id, rec1.id)
+        res.close()
+        self.failUnless(len(chunks_read) < len(body) / 10, chunks_read)
+
+        self.assertEqual(mockhttp.method_calls[0][0], 'request_stream')
+        self.assertEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/%s/places/11.03,10.04.json?q=monkeys' % (API_VERSION,))
+        self.assertEqual(mockhttp.method_calls[0][1][1], 'GET')
+
+        mockhttp.request_stream.return_value = ({'status': '200', 'content-type': 'application/json', }, chunks())
+        res = list(self.client.iter_search_by_address('41 Decatur St, San Francisco, CA'))
+        self.failUnlessEqual([f.id for f in res], [rec1.id, rec2.id])
+
+    def test_iter_search_error(self):
+        mockhttp = mock.Mock()
+        mockhttp.request_stream.return_value = ({'status': '500', 'content-type': 'application/json', }, iter(['{"message": "help my web server is confuzzled"}']))
+        self.client.http = mockhttp
+
+        try:
+            list(self.client.iter_search_by_ip('192.0.32.10'))
+        except APIError, e:
+            self.failUnlessEqual(e.code, 500)
+            self.failUnlessEqual(e.msg, '{"message": "help my web server is confuzzled"}')
+        else:
+            self.fail("APIError was not raised")
+
+    def test_iter_search_policies(self):
+        from simplegeo.places.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+        from simplegeo.places.stats import Instrumentation
+        sleeps = []
+        records = []
+        self.client.retry_policy = RetryPolicy(max_attempts=3, sleep=sleeps.append)
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=2)
+        self.client.instrumentation = Instrumentation(hook=records.append)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        body = json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]})
+        responses = [
+            ({'status': '503', 'content-type': 'application/json', }, iter(['{"message": "busy"}'])),
+            ({'status': '200', 'content-type': 'application/json', }, iter([body])),
+            ]
+        mockhttp = mock.Mock()
+        mockhttp.request_stream.side_effect = lambda *args, **kwargs: responses.pop(0)
+        self.client.http = mockhttp
+
+        self.failUnlessEqual([f.id for f in self.client.iter_search(D('11.03'), D('10.04'))], [rec1.id])
+        self.failUnlessEqual(len(sleeps), 1)
+        self.failUnlessEqual((records[0]['endpoint'], records[0]['status'], records[0]['features'], records[0]['error']), ('iter_search', 200, 1, None))
+
+        mockhttp.request_stream.side_effect = None
+        mockhttp.request_stream.return_value = ({'status': '500', 'content-type': 'application/json', }, iter(['{"message": "help"}']))
+        self.client.retry_policy = None
+        self.failUnlessRaises(APIError, list, self.client.iter_search_by_ip('192.0.32.10'))
+        self.failUnlessRaises(APIError, list, self.client.iter_search_by_ip('192.0.32.10'))
+        self.failUnlessRaises(CircuitOpenError, list, self.client.iter_search_by_ip('192.0.32.10'))
+        self.failUnlessEqual(len(mockhttp.method_calls), 4)
+        self.failUnlessEqual((records[1]['endpoint'], records[1]['status'], records[1]['error']), ('iter_search_by_ip', 500, 'APIError'))
+
+        # Stopping early isn't an error.
+        self.client.circuit_breaker = None
+        mockhttp.request_stream.return_value = ({'status': '200', 'content-type': 'application/json', }, iter([body[:-20], body[-20:]]))
+        res = self.client.iter_search(D('11.03'), D('10.04'))
+        res.next()
+        res.close()
+        self.failUnlessEqual((records[-1]['endpoint'], records[-1]['features'], records[-1]['error']), ('iter_search', 1, None))
+
+    def test_search_cache(self):
+        from simplegeo.places.cache import SearchCache
+        self.client.search_cache = SearchCache(maxsize=10, ttl=60)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys", 'category': "monkey dealership"})
+
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        self.client.http = mockhttp
+
+        res = self.client.search(D('11.03'), D('10.04'), radius=1, query='monkeys')
+        res[0].properties['name'] = 'changed by the caller'
+        res2 = self.client.search(D('11.03001'), D('10.04'), radius=1, query=u'monkeys')
+        self.failUnlessEqual(len(mockhttp.method_calls), 1)
+        self.failUnlessEqual(res2[0].id, rec1.id)
+        self.failUnlessEqual(res2[0].properties['name'], "Bob's House Of Monkeys")
+
+        self.client.search(D('11.03'), D('10.04'), radius=2, query='monkeys')
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+        stats = self.client.search_cache.stats()
+        self.failUnlessEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_spatial_cache(self):
+        from simplegeo.places.cache import SpatialCache
+        self.client.spatial_cache = SpatialCache()
+        rec1 = Feature((D('37.7749'), D('-122.4194')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        rec2 = Feature((D('37.80'), D('-122.4194')), simplegeohandle='SG_abcdefghijkmlnopqrstuw')
+
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict(), rec2.to_dict()]}))
+        self.client.http = mockhttp
+
+        res = self.client.search(D('37.7749'), D('-122.4194'), radius=5, category='cafe')
+        self.failUnlessEqual(len(res), 2)
+        res = self.client.search(D('37.7749'), D('-122.4194'), radius=1, category='cafe')
+        self.failUnlessEqual([f.id for f in res], [rec1.id])
+        self.failUnlessEqual(len(mockhttp.method_calls), 1)
+        self.client.search(D('37.7749'), D('-122.4194'), radius=1, category='bar')
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+
+    def test_address_cache(self):
+        from simplegeo.places.cache import AddressCache
+        self.client.address_cache = AddressCache()
+        rec1 = Feature((D('37.7726'), D('-122.4064')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        fc = {'type': "FeatureColllection", 'features': [rec1.to_dict()], 'query': {'latitude': D('37.7726'), 'longitude': D('-122.4064')}}
+
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps(fc))
+        self.client.http = mockhttp
+
+        addr = '41 Decatur St, San Francisco, CA'
+        res = self.client.search_by_address(addr, radius=1)
+        self.failUnlessEqual([f.id for f in res], [rec1.id])
+        res = self.client.search_by_address(u'41 DECATUR ST,  San Francisco, CA', radius=1)
+        self.failUnlessEqual([f.id for f in res], [rec1.id])
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+        self.assertEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/%s/places/address.json?radius=1&address=%s' % (API_VERSION, urllib.quote_plus(addr)))
+        self.assertEqual(mockhttp.method_calls[1][1][0], 'http://api.simplegeo.com:80/%s/places/37.7726,-122.4064.json?radius=1' % (API_VERSION,))
+
+        mockhttp.request.return_value = ({'status': '404', 'content-type': 'application/json', }, '{"message": "no such address"}')
+        self.failUnlessRaises(APIError, self.client.search_by_address, 'nowhere at all')
+        self.failUnlessRaises(APIError, self.client.search_by_address, 'Nowhere at all')
+        self.failUnlessEqual(len(mockhttp.method_calls), 3)
+
+    def test_ip_cache(self):
+        from simplegeo.places.cache import IPSearchCache
+        self.client.ip_cache = IPSearchCache()
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        self.client.http = mockhttp
+
+        res = self.client.search_by_ip('192.0.32.10', radius=1)
+        self.failUnlessEqual([f.id for f in res], [rec1.id])
+        res = self.client.search_by_ip('192.0.32.11', radius=1)
+        self.failUnlessEqual([f.id for f in res], [rec1.id])
+        self.failUnlessEqual(len(mockhttp.method_calls), 1)
+
+        self.client.search_by_my_ip(radius=1)
+        self.client.search_by_my_ip(radius=1)
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+        self.assertEqual(mockhttp.method_calls[1][1][0], 'http://api.simplegeo.com:80/%s/places/ip.json?radius=1' % (API_VERSION,))
+
+    def test_coalesce(self):
+        import threading, time
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, API_VERSION, API_HOST, API_PORT, coalesce=True)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        calls = []
+        def mockrequest(*args, **kwargs):
+            calls.append(args)
+            time.sleep(0.1)
+            return ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        mockhttp = mock.Mock()
+        mockhttp.request = mockrequest
+        client.http = mockhttp
+
+        results = []
+        def go():
+            results.append(client.search(D('11.03'), D('10.04'), radius=1))
+        threads = [threading.Thread(target=go) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failUnlessEqual(len(calls), 1)
+        self.failUnlessEqual(len(results), 4)
+        self.failUnless(all(r[0].id == rec1.id for r in results), results)
+        # Each caller gets its own Features.
+        self.failIf(results[0][0] is results[1][0])
+
+    def test_update_features(self):
+        handles = ['SG_abcdefghijklmnopqrstu%s' % (c,) for c in 'vwxyz']
+        def mockrequest(*args, **kwargs):
+            if args[0].endswith('%s.json' % (handles[2],)):
+                return ({'status': '500', 'content-type': 'application/json', }, '{"message": "help my web server is confuzzled"}')
+            return ({'status': '202', 'content-type': 'application/json', }, '{"token": "this is your polling token"}')
+        mockhttp = mock.Mock()
+        mockhttp.request = mockrequest
+        self.client.http = mockhttp
+
+        features = [Feature((D('11.03'), D('10.04')), simplegeohandle=h) for h in handles]
+        # A feature without a simplegeohandle fails the whole batch before anything is sent.
+        self.failUnlessRaises(AssertionError, self.client.update_features, features + [Feature((D('11.03'), D('10.04')))])
+
+        op = self.client.update_features(features, concurrency=2)
+        outcomes = dict((o.handle, o) for o in op)
+        self.failUnlessEqual(len(outcomes), 5)
+        self.failIf(outcomes[handles[2]].ok)
+        self.failUnlessEqual(outcomes[handles[2]].error.code, 500)
+        self.failUnless(outcomes[handles[0]].ok)
+        self.failUnlessEqual(outcomes[handles[0]].result, '{"token": "this is your polling token"}')
+        self.failUnless(outcomes[handles[0]].seconds >= 0)
+        summary = op.summary()
+        self.failUnlessEqual((summary['total'], summary['succeeded'], summary['failed']), (5, 4, 1))
+
+    def test_delete_features(self):
+        handles = ['SG_abcdefghijklmnopqrstu%s' % (c,) for c in 'vwxyz']
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, "whatever the response body is")
+        self.client.http = mockhttp
+
+        self.failUnlessRaises(AssertionError, self.client.delete_features, handles + ['bogus'])
+        self.failUnlessEqual(len(mockhttp.method_calls), 0)
+
+        outcomes = self.client.delete_features(iter(handles)).run()
+        self.failUnlessEqual(sorted(o.handle for o in outcomes), handles)
+        self.failUnless(all(o.ok for o in outcomes))
+        self.failUnless(all(c[1][1] == 'DELETE' for c in mockhttp.method_calls))
+
+    def test_retry(self):
+        from simplegeo.places.retry import RetryPolicy
+        sleeps = []
+        self.client.retry_policy = RetryPolicy(max_attempts=3, sleep=sleeps.append)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        responses = [
+            ({'status': '503', 'content-type': 'application/json', }, '{"message": "busy"}'),
+            ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]})),
+            ]
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = lambda *args, **kwargs: responses.pop(0)
+        self.client.http = mockhttp
+
+        res = self.client.search(D('11.03'), D('10.04'))
+        self.failUnlessEqual([f.id for f in res], [rec1.id])
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+        self.failUnlessEqual(len(sleeps), 1)
+
+        # add_feature() is not retried unless retry_add_feature is set.
+        mockhttp.request.side_effect = None
+        mockhttp.request.return_value = ({'status': '503', 'content-type': 'application/json', }, '{"message": "busy"}')
+        self.failUnlessRaises(APIError, self.client.add_feature, Feature((D('11.03'), D('10.04'))))
+        self.failUnlessEqual(len(mockhttp.method_calls), 3)
+
+        self.client.retry_policy.retry_add_feature = True
+        self.failUnlessRaises(APIError, self.client.add_feature, Feature((D('11.03'), D('10.04'))))
+        self.failUnlessEqual(len(mockhttp.method_calls), 6)
+
+    def test_circuit_breaker(self):
+        from simplegeo.places.retry import CircuitBreaker, CircuitOpenError
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=2)
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '500', 'content-type': 'application/json', }, '{"message": "help my web server is confuzzled"}')
+        self.client.http = mockhttp
+
+        self.failUnlessRaises(APIError, self.client.search, D('11.03'), D('10.04'))
+        self.failUnlessRaises(APIError, self.client.search, D('11.03'), D('10.04'))
+        self.failUnlessRaises(CircuitOpenError, self.client.search, D('11.03'), D('10.04'))
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+
+    def test_instrumentation(self):
+        from simplegeo.places.stats import Instrumentation
+        self.failUnlessEqual(self.client.stats(), None)
+        records = []
+        self.client.instrumentation = Instrumentation(hook=records.append)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        body = json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]})
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, body)
+        self.client.http = mockhttp
+
+        self.client.search(D('11.03'), D('10.04'), query='coffee')
+        self.failUnlessEqual(len(records), 1)
+        self.failUnlessEqual((records[0]['endpoint'], records[0]['status'], records[0]['response_bytes'], records[0]['features'], records[0]['error']), ('search', 200, len(body), 1, None))
+        self.failUnlessEqual(set(records[0]['phases']), set(['validate', 'build_url', 'sign', 'network', 'decode', 'construct']))
+
+        mockhttp.request.return_value = ({'status': '404', 'content-type': 'application/json', }, '{"message": "not found"}')
+        self.failUnlessRaises(APIError, self.client.delete_feature, 'SG_abcdefghijkmlnopqrstuv')
+        self.failUnlessEqual((records[1]['endpoint'], records[1]['status'], records[1]['error']), ('feature', 404, 'APIError'))
+
+        stats = self.client.stats()
+        self.failUnlessEqual(stats['search']['calls'], 1)
+        self.failUnlessEqual(stats['feature']['errors'], 1)
+
+    def test_search_compact(self):
+        from simplegeo.places.compact import CompactFeature
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys"})
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        self.client.http = mockhttp
+
+        for res in (self.client.search(D('11.03'), D('10.04'), compact=True),
+                    self.client.search_by_ip('192.0.2.1', compact=True),
+                    self.client.search_by_my_ip(compact=True),
+                    self.client.search_by_address('41 Decatur St, San Francisco, CA', compact=True)):
+            self.failUnlessEqual(len(res), 1)
+            self.failUnless(isinstance(res[0], CompactFeature))
+            self.failUnlessEqual(res[0].id, rec1.id)
+            self.failUnlessEqual(res[0].get('name'), "Bob's House Of Monkeys")
+            self.failUnlessEqual(res[0].to_feature().to_dict(), rec1.to_dict())
+
+    def test_search_as_arrays(self):
+        try:
+            from simplegeo.places.columnar import FeatureArrays
+        except ImportError:
+            return # numpy is not installed
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys"})
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        self.client.http = mockhttp
+
+        for res in (self.client.search(D('11.03'), D('10.04'), as_arrays=True),
+                    self.client.search_by_ip('192.0.2.1', as_arrays=True),
+                    self.client.search_by_my_ip(as_arrays=True),
+                    self.client.search_by_address('41 Decatur St, San Francisco, CA', as_arrays=True)):
+            self.failUnless(isinstance(res, FeatureArrays))
+            self.failUnlessEqual(list(res.ids), [rec1.id])
+            self.failUnlessEqual(list(res.lat), [11.03])
+            self.failUnlessEqual(list(res.column('name')), ["Bob's House Of Monkeys"])
+
+        self.failUnlessRaises(AssertionError, self.client.search, D('11.03'), D('10.04'), compact=True, as_arrays=True)
+
+    def test_codec(self):
+        from simplegeo.places.codec import FastCodec
+        self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, API_VERSION, API_HOST, API_PORT, codec=FastCodec(floats=True))
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys"})
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        self.client.http = mockhttp
+
+        res = self.client.search(D('11.03'), D('10.04'))
+        self.failUnlessEqual(res[0].coordinates, (11.03, 10.04))
+        self.failUnless(isinstance(res[0].coordinates[0], float))
+
+        self.client.update_feature(rec1)
+        body = mockhttp.request.call_args[1]['body']
+        self.failUnlessEqual(json.loads(body)['geometry']['coordinates'], [D('10.04'), D('11.03')])
+
+    def test_search_many(self):
+        near = Feature((D('37.7760'), D('-122.4194')), simplegeohandle='SG_aaaaaaaaaaaaaaaaaaaaaa')
+        far = Feature((D('37.7900'), D('-122.4194')), simplegeohandle='SG_bbbbbbbbbbbbbbbbbbbbbb')
+        oakland = Feature((D('37.8044'), D('-122.2712')), simplegeohandle='SG_cccccccccccccccccccccc')
+        def mockrequest(uri, method, body=None, headers=None):
+            if '/37.8044,' in uri:
+                features = [oakland]
+            else:
+                features = [near, far]
+            return ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [f.to_dict() for f in features]}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = mockrequest
+        self.client.http = mockhttp
+
+        points = [(D('37.7749'), D('-122.4194')), (D('37.8044'), D('-122.2712')), (D('37.7760'), D('-122.4194'), 0.5)]
+        res = self.client.search_many(points, radius=5, concurrency=2)
+        self.failUnlessEqual((res.searched, res.skipped), (2, 1))
+        self.failUnlessEqual(mockhttp.request.call_count, 2)
+        self.failUnlessEqual(sorted((f.id, points) for (f, points) in res), [(near.id, [0, 2]), (far.id, [0]), (oakland.id, [1])])
+
+        # If the covering search was truncated the covered point is searched too.
+        mockhttp.request.reset_mock()
+        res = self.client.search_many(points, radius=5, truncated_at=2)
+        self.failUnlessEqual((res.searched, res.skipped), (3, 0))
+        self.failUnlessEqual(res.points_for(far), [0, 2])
+
+        # A repeated point without a radius is answered with the first
+        # one's results as they are, even if they may be truncated.
+        mockhttp.request.reset_mock()
+        res = self.client.search_many([(D('37.7749'), D('-122.4194')), (D('37.7749'), D('-122.4194'))], truncated_at=2)
+        self.failUnlessEqual((res.searched, res.skipped), (1, 1))
+        self.failUnlessEqual(mockhttp.request.call_count, 1)
+        self.failUnlessEqual(sorted((f.id, points) for (f, points) in res), [(near.id, [0, 1]), (far.id, [0, 1])])
+
+        self.failUnlessRaises(AssertionError, self.client.search_many, [(D('97.0'), D('0'))], radius=5)
+
+    def test_search_bbox(self):
+        import re
+        from simplegeo.places.geo import distance_km
+        # A fake server with 100 places in a 10 by 10 grid which
+        # returns at most 25 of them per search.
+        places = []
+        for i in range(10):
+            for j in range(10):
+                handle = 'SG_%022d' % (i * 10 + j,)
+                places.append(Feature((D('37.70') + D('0.01') * i, D('-122.50') + D('0.01') * j), simplegeohandle=handle))
+        def mockrequest(uri, method, body=None, headers=None):
+            mo = re.search(r'/places/([-0-9.]+),([-0-9.]+)\.json\?.*radius=([0-9.]+)', uri)
+            lat, lon, radius = float(mo.group(1)), float(mo.group(2)), float(mo.group(3))
+            features = [f for f in places if distance_km(lat, lon, f.coordinates[0], f.coordinates[1]) <= radius][:25]
+            return ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [f.to_dict() for f in features]}))
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = mockrequest
+        self.client.http = mockhttp
+
+        res = self.client.search_bbox((D('37.695'), D('-122.505')), (D('37.765'), D('-122.435')), concurrency=4)
+        expected = set(f.id for f in places if f.coordinates[0] < D('37.765') and f.coordinates[1] < D('-122.435'))
+        self.failUnlessEqual(len(expected), 49)
+        self.failUnlessEqual(set(f.id for f in res), expected)
+        self.failUnlessEqual(len(res), 49)
+        self.failUnless(res.subdivided >= 1, res.subdivided)
+        self.failUnlessEqual(res.saturated, 0)
+        self.failUnlessEqual(res.searched, mockhttp.request.call_count)
+
+        self.failUnlessRaises(AssertionError, self.client.search_bbox, (D('37.765'), D('-122.505')), (D('37.695'), D('-122.435')))
+
+    def test_store(self):
+        import shutil, tempfile
+        from simplegeo.places.store import PlaceStore
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = tmpdir + '/places.sqlite'
+            rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys"})
+            mockhttp = mock.Mock()
+            mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+            self.client.http = mockhttp
+            self.client.store = PlaceStore(path, local_first=True)
+            self.failUnlessEqual([f.to_dict() for f in self.client.search(D('11.03'), D('10.04'), radius=2)], [rec1.to_dict()])
+
+            # Another worker's client, sharing the same file.
+            other = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, API_VERSION, API_HOST, API_PORT, store=PlaceStore(path, local_first=True))
+            other.http = mockhttp
+            self.failUnlessEqual([f.to_dict() for f in other.search(D('11.03'), D('10.04'), radius=2)], [rec1.to_dict()])
+            self.failUnlessEqual([f.id for f in other.search(D('11.031'), D('10.04'), radius=1)], [rec1.id])
+            self.failUnlessEqual(len(mockhttp.method_calls), 1)
+
+            # A broken database sends the search to the server instead.
+            import sqlite3
+            conn = sqlite3.connect(path)
+            conn.executescript('DROP TABLE search_cells; DROP TABLE searches;')
+            conn.close()
+            self.failUnlessEqual([f.id for f in other.search(D('11.03'), D('10.04'), radius=2)], [rec1.id])
+            self.failUnlessEqual(len(mockhttp.method_calls), 2)
+            self.failUnlessEqual(other.store.errors, 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_rate_limiter(self):
+        from simplegeo.places.ratelimit import RateLimiter, RateLimitExceeded
+        from simplegeo.places.retry import RetryPolicy
+        now = [1000.0]
+        def sleep(seconds):
+            now[0] += seconds
+        self.client.rate_limiter = RateLimiter(search_rate=2, write_rate=1, recovery_time=3600, clock=lambda: now[0], sleep=sleep)
+        self.client.retry_policy = RetryPolicy(max_attempts=2, sleep=sleep, jitter=False)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        responses = [
+            ({'status': '503', 'content-type': 'application/json', }, '{"message": "busy"}'),
+            ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]})),
+            ]
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = lambda *args, **kwargs: responses.pop(0)
+        self.client.http = mockhttp
+
+        # The 503 halves the search rate, and the retry waits for it.
+        self.failUnlessEqual([f.id for f in self.client.search(D('11.03'), D('10.04'))], [rec1.id])
+        self.failUnlessEqual(self.client.rate_limiter.stats()['throttled'], 1)
+        self.failUnlessAlmostEqual(self.client.rate_limiter.stats()['waited'], 0.9, places=3)
+        self.failUnlessEqual(len(mockhttp.method_calls), 2)
+
+        self.client.rate_limiter.block = False
+        mockhttp.request.side_effect = None
+        mockhttp.request.return_value = ({'status': '202', 'location': 'http://api.simplegeo.com:80/1.0/places/SG_abcdefghijkmlnopqrstuv.json'}, '{"id": "SG_abcdefghijkmlnopqrstuv"}')
+        self.client.add_feature(Feature((D('11.03'), D('10.04'))))
+        self.failUnlessRaises(RateLimitExceeded, self.client.add_feature, Feature((D('11.03'), D('10.04'))))
+        self.failUnlessEqual(len(mockhttp.method_calls), 3)
+
+    def test_hedge(self):
+        import threading
+        from simplegeo.places.hedge import HedgePolicy
+        self.client.hedge_policy = HedgePolicy(delay=0.01)
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        body = json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]})
+        release = threading.Event()
+        calls = []
+        def request(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                release.wait(5)
+            return ({'status': '200', 'content-type': 'application/json', }, body)
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.http = mockhttp
+        try:
+            self.failUnlessEqual([f.id for f in self.client.search(D('11.03'), D('10.04'))], [rec1.id])
+        finally:
+            release.set()
+        self.failUnlessEqual(len(calls), 2)
+        self.failUnlessEqual(calls[0], calls[1])
+        self.failUnlessEqual(self.client.hedge_policy.hedge_wins, 1)
+
+    def test_compress_requests(self):
+        import zlib
+        handle = 'SG_abcdefghijklmnopqrstuv'
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '202', 'location': 'http://api.simplegeo.com:80/%s/places/%s.json' % (API_VERSION, handle)}, json.dumps({'id': handle}))
+        self.client.http = mockhttp
+        feature = Feature((D('11.03'), D('10.04')), properties={'name': "Bob's House Of Monkeys"})
+
+        self.client.add_feature(feature)
+        kwargs = mockhttp.request.call_args[1]
+        self.failIf('Content-Encoding' in kwargs['headers'])
+
+        self.client.compress_requests = 10
+        self.client.add_feature(feature)
+        kwargs = mockhttp.request.call_args[1]
+        self.failUnlessEqual(kwargs['headers']['Content-Encoding'], 'gzip')
+        self.failUnlessEqual(json.loads(zlib.decompress(kwargs['body'], 16 + zlib.MAX_WBITS)), json.loads(feature.to_json()))
+
+    def test_write_behind(self):
+        from simplegeo.places.writebehind import WriteBehind
+        handle = 'SG_abcdefghijklmnopqrstuv'
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, '{"status": "OK"}')
+        client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, API_VERSION, API_HOST, API_PORT, write_behind=WriteBehind(delay=60))
+        client.http = mockhttp
+        for name in ('one', 'two', 'three'):
+            self.failUnlessEqual(client.update_feature(Feature((D('11.03'), D('10.04')), simplegeohandle=handle, properties={'name': name})), None)
+        self.failUnlessRaises(AssertionError, client.update_feature, Feature((D('11.03'), D('10.04'))))
+        self.failUnlessEqual(len(mockhttp.method_calls), 0)
+
+        client.close()
+        self.failUnlessEqual(len(mockhttp.method_calls), 2) # the update, and closing the pool
+        kwargs = mockhttp.request.call_args[1]
+        self.failUnlessEqual(json.loads(kwargs['body'])['properties']['name'], 'three')
+        self.failUnlessEqual(client.write_behind.stats()['saved'], 2)
+
+    def test_dedup_index(self):
+        from simplegeo.places.dedup import DedupIndex
+        handle = 'SG_abcdefghijklmnopqrstuv'
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '202', 'location': 'http://api.simplegeo.com:80/%s/places/%s.json' % (API_VERSION, handle)}, json.dumps({'id': handle}))
+        self.client.http = mockhttp
+        self.client.dedup_index = DedupIndex()
+
+        self.failUnlessEqual(self.client.add_feature(Feature((D('11.03'), D('10.04')), properties={'name': "Bob's House Of Monkeys"})), handle)
+        self.failUnlessEqual(self.client.add_feature(Feature((D('11.03'), D('10.04')), properties={'name': "Bob's House Of Monkeys"})), handle)
+        self.failUnlessEqual(len(mockhttp.method_calls), 1)
+
+        # A failed add isn't remembered.
+        mockhttp.request.return_value = ({'status': '500', 'content-type': 'application/json', }, '{"message": "help my web server is confuzzled"}')
+        self.failUnlessRaises(APIError, self.client.add_feature, Feature((D('11.03'), D('10.05'))))
+        self.failUnlessRaises(APIError, self.client.add_feature, Feature((D('11.03'), D('10.05'))))
+        self.failUnlessEqual(len(mockhttp.method_calls), 3)
+        self.failUnlessEqual(len(self.client.dedup_index), 1)
+
+    def test_concurrent_statuses(self):
+        import time
+        # Each request must be judged by its own response, however the
+        # threads interleave.
+        def request(endpoint, method, body=None, headers=None):
+            name = json.loads(body)['properties']['name']
+            time.sleep(0.001)
+            if int(name) % 2:
+                return ({'status': '500', 'content-type': 'application/json', }, '{"message": "oops"}')
+            return ({'status': '202', }, json.dumps({'id': 'SG_%022d' % (int(name),)}))
+        def clock():
+            # Give the other threads a chance between the phases.
+            time.sleep(0.0005)
+            return time.time()
+        from simplegeo.places.stats import Instrumentation
+        self.client.instrumentation = Instrumentation(clock=clock)
+        mockhttp = mock.Mock()
+        mockhttp.request.side_effect = request
+        self.client.http = mockhttp
+        features = [Feature((D('11.03'), D('10.04')), properties={'name': str(i)}) for i in range(200)]
+        for (feature, res) in self.client.add_features(features, concurrency=16):
+            i = int(feature.properties['name'])
+            if i % 2:
+                self.failUnless(isinstance(res, APIError), (i, res))
+            else:
+                self.failUnlessEqual(res, 'SG_%022d' % (i,))
+
+    def test_rate_limiter_and_circuit_breaker(self):
+        from simplegeo.places.ratelimit import RateLimiter, RateLimitExceeded
+        from simplegeo.places.retry import CircuitBreaker
+        now = [1000.0]
+        self.client.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=lambda: now[0])
+        self.client.rate_limiter = RateLimiter(search_rate=1, write_rate=1, block=False, clock=lambda: now[0])
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv')
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '500', 'content-type': 'application/json', }, '{"message": "help my web server is confuzzled"}')
+        self.client.http = mockhttp
+        self.failUnlessRaises(APIError, self.client.search, D('11.03'), D('10.04'))
+        self.failUnlessEqual(self.client.circuit_breaker.state, CircuitBreaker.OPEN)
+
+        # The breaker is due to let a probe through, but the limiter
+        # refuses the request first.
+        now[0] += 30
+        self.client.rate_limiter.record('search', APIError(429, 'slow down', {'status': '429', 'retry-after': '1'}))
+        self.failUnlessRaises(RateLimitExceeded, self.client.search, D('11.03'), D('10.04'))
+
+        # The probe wasn't used up, so the next request gets it.
+        now[0] += 60
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]}))
+        self.failUnlessEqual([f.id for f in self.client.search(D('11.03'), D('10.04'))], [rec1.id])
+        self.failUnlessEqual(self.client.circuit_breaker.state, CircuitBreaker.CLOSED)
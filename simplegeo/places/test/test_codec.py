@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from decimal import Decimal as D
+
+from simplegeo.shared import DecodeError, Feature
+from simplegeo.places.codec import DecimalCodec, FastCodec
+
+FC = '{"type": "FeatureCollection", "features": [{"type": "Feature", "id": "SG_abcdefghijkmlnopqrstuv", "geometry": {"type": "Point", "coordinates": [10.04, 11.03]}, "properties": {"name": "Bob\'s", "rank": 3}}]}'
+
+class CodecTest(unittest.TestCase):
+    def test_decimal(self):
+        for codec in (DecimalCodec(), FastCodec()):
+            fc = codec.decode(FC)
+            self.failUnlessEqual(fc['features'][0]['geometry']['coordinates'], [D('10.04'), D('11.03')])
+            self.failUnless(isinstance(fc['features'][0]['geometry']['coordinates'][0], D))
+            self.failUnlessEqual(fc['features'][0]['properties'], {'name': "Bob's", 'rank': 3})
+
+    def test_floats(self):
+        fc = FastCodec(floats=True).decode(FC)
+        self.failUnlessEqual(fc['features'][0]['geometry']['coordinates'], [10.04, 11.03])
+        self.failUnless(isinstance(fc['features'][0]['geometry']['coordinates'][0], float))
+        feature = Feature.from_dict(fc['features'][0])
+        self.failUnlessEqual(feature.coordinates, (11.03, 10.04))
+
+    def test_encode(self):
+        feature = Feature((D('11.03'), D('10.04')), properties={'name': u'Bob’s'})
+        for codec in (DecimalCodec(), FastCodec(), FastCodec(floats=True)):
+            obj = codec.decode(codec.encode(feature.to_dict()))
+            self.failUnlessEqual([float(x) for x in obj['geometry']['coordinates']], [10.04, 11.03])
+            self.failUnlessEqual(obj['properties']['name'], u'Bob’s')
+
+    def test_decode_error(self):
+        for codec in (DecimalCodec(), FastCodec(), FastCodec(floats=True)):
+            self.failUnlessRaises(DecodeError, codec.decode, '{"type": ')
+
+    def test_json_decode_reexported(self):
+        # Older code imports json_decode from simplegeo.places.
+        from simplegeo.places import json_decode
+        self.failUnlessEqual(json_decode(FC)['features'][0]['properties']['rank'], 3)
@@ -0,0 +1,57 @@
+import unittest
+
+from decimal import Decimal as D
+
+from simplegeo.shared import Feature
+
+try:
+    import numpy
+    from simplegeo.places.columnar import FeatureArrays
+except ImportError:
+    FeatureArrays = None
+
+def _featuredicts():
+    return [
+        Feature((D('37.7749'), D('-122.4194')), simplegeohandle='SG_aaaaaaaaaaaaaaaaaaaaaa', properties={'name': 'City Hall', 'phone': '+1 415 555 0000'}).to_dict(),
+        Feature((D('37.8044'), D('-122.2712')), simplegeohandle='SG_bbbbbbbbbbbbbbbbbbbbbb', properties={'name': 'Oakland'}).to_dict(),
+        Feature([[(D('10.0'), D('1.0')), (D('11.0'), D('1.0')), (D('11.0'), D('2.0')), (D('10.0'), D('1.0'))]], geomtype='Polygon', simplegeohandle='SG_cccccccccccccccccccccc').to_dict(),
+        Feature((D('37.7749'), D('-122.4194')), simplegeohandle='SG_aaaaaaaaaaaaaaaaaaaaaa', properties={'name': 'City Hall again'}).to_dict(),
+        ]
+
+class FeatureArraysTest(unittest.TestCase):
+    def test_from_dicts(self):
+        fa = FeatureArrays.from_dicts(_featuredicts())
+        self.failUnlessEqual(len(fa), 4)
+        self.failUnlessEqual(list(fa.ids), ['SG_aaaaaaaaaaaaaaaaaaaaaa', 'SG_bbbbbbbbbbbbbbbbbbbbbb', 'SG_cccccccccccccccccccccc', 'SG_aaaaaaaaaaaaaaaaaaaaaa'])
+        self.failUnlessEqual(fa.lat.dtype, numpy.float64)
+        self.failUnlessAlmostEqual(fa.lat[1], 37.8044)
+        self.failUnlessAlmostEqual(fa.lon[1], -122.2712)
+        self.failUnless(numpy.isnan(fa.lat[2]) and numpy.isnan(fa.lon[2]))
+        self.failUnlessEqual(list(fa.column('name')), ['City Hall', 'Oakland', None, 'City Hall again'])
+        self.failUnlessEqual(list(fa.column('phone')), ['+1 415 555 0000', None, None, None])
+        self.failUnlessEqual(list(fa.column('fax')), [None] * 4)
+
+    def test_empty(self):
+        fa = FeatureArrays.from_dicts([])
+        self.failUnlessEqual(len(fa), 0)
+        self.failUnlessEqual(len(fa.nearest(0, 0)), 0)
+
+    def test_distance(self):
+        fa = FeatureArrays.from_dicts(_featuredicts())
+        d = fa.distance_km(37.7749, -122.4194)
+        self.failUnlessAlmostEqual(d[0], 0.0)
+        self.failUnless(12 < d[1] < 14, d[1])
+        self.failUnlessEqual(list(fa.within(37.7749, -122.4194, 5)), [True, False, False, True])
+
+        nearest = fa.nearest(37.8044, -122.2712, n=2)
+        self.failUnlessEqual(list(nearest.ids), ['SG_bbbbbbbbbbbbbbbbbbbbbb', 'SG_aaaaaaaaaaaaaaaaaaaaaa'])
+        self.failUnlessEqual(list(nearest.column('name')), ['Oakland', 'City Hall'])
+
+    def test_unique(self):
+        fa = FeatureArrays.from_dicts(_featuredicts()).unique()
+        self.failUnlessEqual(len(fa), 3)
+        self.failUnlessEqual(list(fa.column('name')), ['City Hall', 'Oakland', None])
+
+if FeatureArrays is None:
+    # numpy is not installed. (unittest.skipIf is new in Python 2.7.)
+    del FeatureArraysTest
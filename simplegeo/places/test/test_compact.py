@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from decimal import Decimal as D
+
+from simplegeo.shared import Feature
+from simplegeo.places.compact import CompactFeature, StringTable, compact_features
+
+def _featuredict(handle, lat, lon, name, category):
+    return Feature((lat, lon), simplegeohandle=handle, properties={
+        'name': name,
+        'classifiers': [{'category': category, 'type': u'Food & Drink', 'subcategory': u''}],
+        'tags': [u'coffee'],
+        }).to_dict()
+
+class CompactFeatureTest(unittest.TestCase):
+    def test_from_dict(self):
+        fd = _featuredict('SG_abcdefghijkmlnopqrstuv', D('11.03'), D('10.04'), u'Joe’s', u'Restaurant')
+        f = CompactFeature.from_dict(fd)
+        self.failUnlessEqual(f.id, 'SG_abcdefghijkmlnopqrstuv')
+        self.failUnlessEqual(f.coordinates, (D('11.03'), D('10.04')))
+        self.failUnlessEqual(f.geomtype, 'Point')
+        self.failUnlessEqual(f.get('name'), u'Joe’s')
+        self.failUnlessEqual(f.get('phone', 'none'), 'none')
+        self.failUnlessEqual(f.properties['classifiers'][0]['category'], u'Restaurant')
+        self.failUnlessEqual(f.get('name'), u'Joe’s')
+        self.failUnlessRaises(AttributeError, setattr, f, 'foo', 1)
+
+    def test_to_feature(self):
+        fd = _featuredict('SG_abcdefghijkmlnopqrstuv', D('11.03'), D('10.04'), u'Joe', u'Restaurant')
+        feature = CompactFeature.from_dict(fd).to_feature()
+        self.failUnless(isinstance(feature, Feature))
+        self.failUnlessEqual(feature.to_dict(), Feature.from_dict(fd).to_dict())
+
+    def test_polygon(self):
+        coords = [[(D('10.0'), D('1.0')), (D('11.0'), D('1.0')), (D('11.0'), D('2.0')), (D('10.0'), D('1.0'))]]
+        fd = Feature(coords, geomtype='Polygon').to_dict()
+        f = CompactFeature.from_dict(fd)
+        self.failUnlessEqual(f.to_feature().to_dict(), Feature.from_dict(fd).to_dict())
+
+    def test_interning(self):
+        fds = [_featuredict('SG_abcdefghijkmlnopqrst%02d' % (i,), D('11.03'), D('10.04'), u'Place %d' % (i,), u''.join([u'Resta', u'urant'])) for i in range(3)]
+        # Make the keys and categories equal but distinct objects, as
+        # they are when they come from the json decoder.
+        for fd in fds:
+            fd['properties'] = dict((''.join(list(k)), v) for (k, v) in fd['properties'].iteritems())
+        a, b, c = compact_features(fds)
+        keys = lambda f: dict((k, k) for k in f.properties)
+        self.failUnless(keys(a)['classifiers'] is keys(b)['classifiers'])
+        self.failUnless(a.properties['classifiers'][0]['category'] is c.properties['classifiers'][0]['category'])
+        self.failIf(a.properties['name'] is b.properties['name'])
+
+    def test_string_table(self):
+        t = StringTable()
+        s1 = u''.join([u'a', u'b'])
+        s2 = u''.join([u'a', u'b'])
+        self.failIf(s1 is s2)
+        self.failUnless(t.intern(s1) is t.intern(s2))
@@ -0,0 +1,92 @@
+import threading, time, unittest
+
+from simplegeo.places.concurrency import SingleFlight, imap_unordered
+
+class ImapUnorderedTest(unittest.TestCase):
+    def test_results_and_errors(self):
+        def f(x):
+            if x == 3:
+                raise ValueError(x)
+            return x * 2
+        res = list(imap_unordered(f, range(10), 4))
+        self.failUnlessEqual(len(res), 10)
+        for (item, result, exc_info) in res:
+            if item == 3:
+                self.failUnless(isinstance(exc_info[1], ValueError), exc_info)
+            else:
+                self.failUnlessEqual(exc_info, None)
+                self.failUnlessEqual(result, item * 2)
+
+    def test_bounded_in_flight(self):
+        lock = threading.Lock()
+        counts = {'now': 0, 'max': 0}
+        def f(x):
+            lock.acquire()
+            counts['now'] += 1
+            counts['max'] = max(counts['max'], counts['now'])
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            counts['now'] -= 1
+            lock.release()
+        list(imap_unordered(f, range(20), 3))
+        self.failUnless(counts['max'] <= 3, counts)
+
+    def test_lazy_and_early_stop(self):
+        pulled = []
+        def gen():
+            for i in range(1000):
+                pulled.append(i)
+                yield i
+        g = imap_unordered(lambda x: x, gen(), 2)
+        g.next()
+        g.close()
+        time.sleep(0.2)
+        self.failUnless(len(pulled) < 10, len(pulled))
+
+    def test_iterable_error(self):
+        def gen():
+            yield 1
+            raise KeyError('boom')
+        self.failUnlessRaises(KeyError, list, imap_unordered(lambda x: x, gen(), 2))
+
+class SingleFlightTest(unittest.TestCase):
+    def _run(self, func, n=5):
+        sf = SingleFlight()
+        results = []
+        def go():
+            try:
+                results.append(sf.do('key', func))
+            except Exception, e:
+                results.append(e)
+        threads = [threading.Thread(target=go) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return sf, results
+
+    def test_shared_result(self):
+        calls = []
+        def f():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'result'
+        sf, results = self._run(f)
+        self.failUnlessEqual(results, ['result'] * 5)
+        self.failUnlessEqual(len(calls), 1)
+        self.failUnlessEqual(sf.stats(), {'calls': 1, 'shared': 4})
+
+    def test_shared_exception(self):
+        def f():
+            time.sleep(0.1)
+            raise ValueError('nope')
+        sf, results = self._run(f)
+        self.failUnlessEqual(len(results), 5)
+        self.failUnless(all(r is results[0] for r in results), results)
+        self.failUnless(isinstance(results[0], ValueError))
+
+    def test_not_remembered(self):
+        sf = SingleFlight()
+        self.failUnlessEqual(sf.do('key', lambda: 1), 1)
+        self.failUnlessEqual(sf.do('key', lambda: 2), 2)
@@ -0,0 +1,70 @@
+import os, shutil, tempfile, unittest
+
+from decimal import Decimal as D
+
+from simplegeo.places import Feature
+from simplegeo.places.dedup import DedupIndex, content_hash
+
+HANDLE1 = 'SG_abcdefghijklmnopqrstuv'
+HANDLE2 = 'SG_bcdefghijklmnopqrstuvw'
+
+class ContentHashTest(unittest.TestCase):
+    def test_canonical(self):
+        f = Feature((D('11.03'), D('10.04')), properties={'name': 'Monkeys', 'tags': ['a', 'b']})
+        same = Feature((11.03, D('10.040')), properties={'tags': ['a', 'b'], 'name': u'Monkeys'})
+        self.failUnlessEqual(content_hash(f), content_hash(same))
+        # The id doesn't count.
+        self.failUnlessEqual(content_hash(f), content_hash(Feature((D('11.03'), D('10.04')), simplegeohandle=HANDLE1, properties={'name': 'Monkeys', 'tags': ['a', 'b']})))
+        self.failIfEqual(content_hash(f), content_hash(Feature((D('11.03'), D('10.05')), properties={'name': 'Monkeys', 'tags': ['a', 'b']})))
+        self.failIfEqual(content_hash(f), content_hash(Feature((D('11.03'), D('10.04')), properties={'name': 'Monkeys', 'tags': ['b', 'a']})))
+
+class DedupIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'added.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_memory(self):
+        index = DedupIndex()
+        self.failUnlessEqual(index.get('a' * 40), None)
+        index.put('a' * 40, HANDLE1)
+        self.failUnlessEqual(index.get('a' * 40), HANDLE1)
+        self.failUnlessEqual(index.stats(), {'hits': 1, 'misses': 1, 'entries': 1, 'loaded': 0})
+
+    def test_persistent(self):
+        index = DedupIndex(self.path)
+        index.put('a' * 40, HANDLE1)
+        index.close()
+
+        # A torn line, as a crash in the middle of a write could leave.
+        f = open(self.path, 'ab')
+        f.write('b' * 40 + ' SG_bcdef')
+        f.close()
+
+        index = DedupIndex(self.path, fsync=True)
+        self.failUnlessEqual(index.get('a' * 40), HANDLE1)
+        self.failUnlessEqual(index.get('b' * 40), None)
+        index.put('c' * 40, HANDLE2)
+        index.close()
+
+        index = DedupIndex(self.path)
+        self.failUnlessEqual((index.get('a' * 40), index.get('c' * 40)), (HANDLE1, HANDLE2))
+        self.failUnlessEqual(index.stats()['loaded'], 2)
+        index.close()
+
+    def test_torn_handle(self):
+        # A handle with a suffix, cut short by a crash, still looks
+        # like a handle.
+        handle = 'SG_4bgzicKFmP89tQFGLGZYy0_47.046962_-122.937467@1290636830'
+        f = open(self.path, 'wb')
+        f.write('a' * 40 + ' ' + handle + '\n')
+        f.write('b' * 40 + ' ' + handle[:-4])
+        f.close()
+
+        index = DedupIndex(self.path)
+        self.failUnlessEqual(index.get('a' * 40), handle)
+        self.failUnlessEqual(index.get('b' * 40), None)
+        self.failUnlessEqual(index.stats()['loaded'], 1)
+        index.close()
@@ -0,0 +1,113 @@
+import gzip, os, re, shutil, tempfile, unittest
+from pyutil import jsonutil as json
+
+from decimal import Decimal as D
+
+import mock
+
+from simplegeo.shared import APIError, Feature
+from simplegeo.places import Client
+from simplegeo.places.export import Export
+from simplegeo.places.geo import distance_km
+
+# A fake server with 100 places in a 10 by 10 grid which returns at
+# most 25 of them per search.
+PLACES = []
+for i in range(10):
+    for j in range(10):
+        PLACES.append(Feature((D('37.70') + D('0.01') * i, D('-122.50') + D('0.01') * j), simplegeohandle='SG_%022d' % (i * 10 + j,)))
+
+def _fake_server(fail_after=None):
+    calls = []
+    def mockrequest(uri, method, body=None, headers=None):
+        calls.append(uri)
+        if fail_after is not None and len(calls) > fail_after:
+            return ({'status': '500', 'content-type': 'application/json', }, '{"message": "help my web server is confuzzled"}')
+        mo = re.search(r'/places/([-0-9.]+),([-0-9.]+)\.json\?.*radius=([0-9.]+)', uri)
+        lat, lon, radius = float(mo.group(1)), float(mo.group(2)), float(mo.group(3))
+        features = [f for f in PLACES if distance_km(lat, lon, f.coordinates[0], f.coordinates[1]) <= radius][:25]
+        return ({'status': '200', 'content-type': 'application/json', }, json.dumps({'type': "FeatureColllection", 'features': [f.to_dict() for f in features]}))
+    mockhttp = mock.Mock()
+    mockhttp.request.side_effect = mockrequest
+    return mockhttp
+
+def _client(fail_after=None):
+    client = Client('MY_OAUTH_KEY', 'MY_SECRET_KEY')
+    client.http = _fake_server(fail_after)
+    return client
+
+def _handles(path):
+    if path.endswith('.gz'):
+        f = gzip.open(path, 'rb')
+    else:
+        f = open(path, 'rb')
+    try:
+        return [json.loads(line)['id'] for line in f]
+    finally:
+        f.close()
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_points(self):
+        path = os.path.join(self.tmpdir, 'places.ndjson')
+        points = [(D('37.70'), D('-122.50')), (D('37.701'), D('-122.50')), (D('37.79'), D('-122.41'))]
+        reports = []
+        export = Export.for_points(_client(), points, path, radius=1.2, progress=reports.append)
+        report = export.run()
+        handles = _handles(path)
+        self.failUnlessEqual(len(handles), len(set(handles)))
+        self.failUnless(report['duplicates'] > 0, report)
+        self.failUnlessEqual((report['searches'], report['features']), (3, len(handles)))
+        self.failUnlessEqual(reports[-1], report)
+        checkpoint = json.load(open(export.checkpoint_path))
+        self.failUnlessEqual((checkpoint['queue'], checkpoint['offset']), ([], os.path.getsize(path)))
+
+        # Running a finished export again does nothing.
+        client = _client()
+        Export.for_points(client, points, path, radius=1.2).run()
+        self.failUnlessEqual(client.http.request.call_count, 0)
+        self.failUnlessEqual(_handles(path), handles)
+
+    def _test_resume(self, path):
+        sw, ne = (D('37.695'), D('-122.505')), (D('37.765'), D('-122.435'))
+        expected = set(f.id for f in PLACES if f.coordinates[0] < D('37.765') and f.coordinates[1] < D('-122.435'))
+
+        export = Export.for_bbox(_client(fail_after=3), sw, ne, path, concurrency=1)
+        self.failUnlessRaises(APIError, export.run)
+        self.failUnlessEqual(export.searches, 3)
+        partial = _handles(path)
+
+        client = _client()
+        report = Export.for_bbox(client, sw, ne, path, concurrency=2).run()
+        handles = _handles(path)
+        self.failUnlessEqual(handles[:len(partial)], partial)
+        self.failUnlessEqual(len(handles), len(set(handles)))
+        self.failUnlessEqual(set(handles), expected)
+        self.failUnlessEqual(report['features'], len(expected))
+        self.failUnlessEqual(report['searches'], 3 + client.http.request.call_count)
+        self.failUnless(report['subdivided'] >= 1, report)
+
+    def test_resume(self):
+        self._test_resume(os.path.join(self.tmpdir, 'places.ndjson'))
+
+    def test_resume_gzip(self):
+        self._test_resume(os.path.join(self.tmpdir, 'places.ndjson.gz'))
+
+    def test_discards_after_checkpoint(self):
+        path = os.path.join(self.tmpdir, 'places.ndjson')
+        export = Export.for_points(_client(fail_after=1), [(D('37.70'), D('-122.50')), (D('37.75'), D('-122.45'))], path, radius=0.5)
+        self.failUnlessRaises(APIError, export.run)
+        written = _handles(path)
+        # As if the process died while writing.
+        f = open(path, 'ab')
+        f.write('{"type": "Feature", "id": "SG_hal')
+        f.close()
+        Export.for_points(_client(), [(D('37.70'), D('-122.50')), (D('37.75'), D('-122.45'))], path, radius=0.5).run()
+        handles = _handles(path)
+        self.failUnlessEqual(handles[:len(written)], written)
+        self.failUnless(len(handles) > len(written))
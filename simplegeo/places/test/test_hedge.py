@@ -0,0 +1,73 @@
+import threading, unittest
+
+from simplegeo.places.hedge import HedgePolicy
+
+class HedgePolicyTest(unittest.TestCase):
+    def test_fast_answer_isnt_hedged(self):
+        p = HedgePolicy(delay=5)
+        self.failUnlessEqual(p.call(lambda: 'answer'), 'answer')
+        self.failUnlessEqual((p.requests, p.hedges, p.hedge_wins), (1, 0, 0))
+
+    def test_hedge_wins(self):
+        p = HedgePolicy(delay=0.01)
+        release = threading.Event()
+        calls = []
+        def func():
+            calls.append(None)
+            if len(calls) == 1:
+                # The first request is stuck until the test is done.
+                release.wait(5)
+                return 'slow'
+            return 'fast'
+        try:
+            self.failUnlessEqual(p.call(func), 'fast')
+        finally:
+            release.set()
+        self.failUnlessEqual((p.requests, p.hedges, p.hedge_wins), (1, 1, 1))
+
+    def test_failure_waits_for_the_other(self):
+        p = HedgePolicy(delay=0.01)
+        hedged = threading.Event()
+        calls = []
+        def func():
+            calls.append(None)
+            if len(calls) == 1:
+                hedged.wait(5)
+                raise ValueError("first")
+            hedged.set()
+            return 'second'
+        self.failUnlessEqual(p.call(func), 'second')
+
+        def fail():
+            raise ValueError("nope")
+        self.failUnlessRaises(ValueError, p.call, fail)
+
+    def test_rate_cap(self):
+        p = HedgePolicy(delay=0, max_rate=0.5, burst=1)
+        release = threading.Event()
+        def func():
+            release.wait(5)
+            return 'answer'
+        def call():
+            t = threading.Timer(0.05, release.set)
+            t.start()
+            try:
+                return p.call(func)
+            finally:
+                t.join()
+                release.clear()
+        for i in range(4):
+            self.failUnlessEqual(call(), 'answer')
+        # One from the burst, and one more every other request.
+        self.failUnlessEqual((p.requests, p.hedges), (4, 2))
+
+    def test_percentile_delay(self):
+        p = HedgePolicy(percentile=95, min_samples=10, min_delay=0.005)
+        self.failUnlessEqual(p.hedge_delay(), None)
+        for i in range(1, 101):
+            p.record(i / 1000.0)
+        self.failUnlessEqual(p.hedge_delay(), 0.096)
+        self.failUnlessEqual(p.stats()['delay'], 0.096)
+        p = HedgePolicy(min_samples=1, min_delay=0.005)
+        p.record(0.001)
+        self.failUnlessEqual(p.hedge_delay(), 0.005)
@@ -0,0 +1,46 @@
+import unittest
+
+from decimal import Decimal as D
+
+from simplegeo.shared import Feature
+from simplegeo.places.multi import MultiSearchResult, is_complete, plan_coverage, within
+
+class PlanCoverageTest(unittest.TestCase):
+    def test_plan(self):
+        circles = [
+            (37.7749, -122.4194, 5),
+            (37.7760, -122.4194, 1),   # within the first
+            (37.7749, -122.4194, 5),   # the same as the first
+            (37.8044, -122.2712, 1),   # elsewhere
+            (37.7749, -122.3900, 3),   # overlaps the first but isn't within it
+            (37.8044, -122.2712, None),
+            (37.8044, -122.2712, None),
+            ]
+        self.failUnlessEqual(plan_coverage(circles), [None, 0, 0, None, None, None, 5])
+
+    def test_pole(self):
+        # Circles near the poles aren't indexed, so they cover nothing
+        # but themselves.
+        self.failUnlessEqual(plan_coverage([(89.99, 0, 10), (89.99, 0, 1), (89.99, 0, 10)]), [None, None, 0])
+
+class MultiSearchResultTest(unittest.TestCase):
+    def test_merge(self):
+        a = Feature((D('37.7749'), D('-122.4194')), simplegeohandle='SG_aaaaaaaaaaaaaaaaaaaaaa')
+        b = Feature((D('37.8044'), D('-122.2712')), simplegeohandle='SG_bbbbbbbbbbbbbbbbbbbbbb')
+        res = MultiSearchResult()
+        res.add(0, [a])
+        res.add(1, [b, a])
+        res.add(2, [b])
+        self.failUnlessEqual([(f.id, points) for (f, points) in res], [(a.id, [0, 1]), (b.id, [1, 2])])
+        self.failUnlessEqual(res.points_for(b), [1, 2])
+        self.failUnlessEqual(len(res), 2)
+
+    def test_within_and_complete(self):
+        a = Feature((D('37.7749'), D('-122.4194')), simplegeohandle='SG_aaaaaaaaaaaaaaaaaaaaaa')
+        b = Feature((D('37.8044'), D('-122.2712')), simplegeohandle='SG_bbbbbbbbbbbbbbbbbbbbbb')
+        self.failUnlessEqual(within([a, b], 37.7750, -122.4190, 1), [a])
+        self.failUnless(is_complete([a, b], 25))
+        self.failIf(is_complete([a, b], 2))
+        self.failUnless(is_complete([a, b], None))
+        polygon = Feature([[(D('10.0'), D('1.0')), (D('11.0'), D('1.0')), (D('11.0'), D('2.0')), (D('10.0'), D('1.0'))]], geomtype='Polygon')
+        self.failIf(is_complete([a, polygon], 25))
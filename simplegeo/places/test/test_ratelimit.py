@@ -0,0 +1,96 @@
+import unittest
+
+from simplegeo.shared import APIError
+from simplegeo.places.ratelimit import RateLimiter, RateLimitExceeded, SEARCH, WRITE, request_kind
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+    def sleep(self, seconds):
+        self.now += seconds
+
+class RateLimiterTest(unittest.TestCase):
+    def test_kind(self):
+        self.failUnlessEqual(request_kind('GET'), SEARCH)
+        self.failUnlessEqual(request_kind('POST'), WRITE)
+        self.failUnlessEqual(request_kind('DELETE'), WRITE)
+
+    def test_block(self):
+        clock = FakeClock()
+        limiter = RateLimiter(search_rate=2, write_rate=1, clock=clock, sleep=clock.sleep)
+        # A burst of one second's worth goes through at once...
+        self.failUnlessEqual([limiter.acquire(SEARCH) for i in range(2)], [0.0, 0.0])
+        # ...and then each request waits its turn.
+        self.failUnlessEqual(limiter.acquire(SEARCH), 0.5)
+        self.failUnlessEqual(limiter.acquire(SEARCH), 0.5)
+        self.failUnlessEqual(limiter.stats()['waited'], 1.0)
+        # The buckets are separate.
+        self.failUnlessEqual(limiter.acquire(WRITE), 0.0)
+
+    def test_would_exceed(self):
+        clock = FakeClock()
+        limiter = RateLimiter(search_rate=1, write_rate=1, block=False, clock=clock)
+        self.failIf(limiter.would_exceed(SEARCH))
+        self.failUnless(limiter.try_acquire(SEARCH))
+        self.failUnless(limiter.would_exceed(SEARCH))
+        self.failIf(limiter.try_acquire(SEARCH))
+        try:
+            limiter.acquire(SEARCH)
+        except RateLimitExceeded, e:
+            self.failUnlessEqual((e.kind, e.retry_in), (SEARCH, 1.0))
+        else:
+            self.fail("acquire() didn't raise RateLimitExceeded")
+        clock.now += 1
+        self.failUnlessEqual(limiter.acquire(SEARCH), 0.0)
+        self.failUnlessEqual(limiter.stats()['rejected'], 2)
+
+    def test_max_wait(self):
+        clock = FakeClock()
+        limiter = RateLimiter(search_rate=1, write_rate=1, max_wait=0.5, clock=clock, sleep=clock.sleep)
+        limiter.acquire(SEARCH)
+        self.failUnlessRaises(RateLimitExceeded, limiter.acquire, SEARCH)
+        clock.now += 0.5
+        self.failUnlessEqual(limiter.acquire(SEARCH), 0.5)
+
+    def test_adapt(self):
+        clock = FakeClock()
+        limiter = RateLimiter(search_rate=8, write_rate=4, cooldown=1.0, recovery_time=8.0, clock=clock, sleep=clock.sleep)
+        busy = APIError(503, 'busy', {'status': '503'})
+        limiter.record(SEARCH, busy)
+        # Throttled responses to requests already in flight are only
+        # counted once.
+        limiter.record(SEARCH, busy)
+        limiter.record(SEARCH, None)
+        limiter.record(SEARCH, APIError(404, 'not found', {'status': '404'}))
+        self.failUnlessEqual(limiter.rates(), {SEARCH: 4.0, WRITE: 4.0})
+        self.failUnlessEqual(limiter.stats()['throttled'], 2)
+        # The bucket was emptied.
+        self.failUnlessEqual(limiter.acquire(SEARCH), 0.25)
+
+        clock.now += 0.75
+        limiter.record(SEARCH, APIError(429, 'slow down', {'status': '429'}))
+        # It had recovered to 5 in the meantime.
+        self.failUnlessEqual(limiter.rates()[SEARCH], 2.5)
+
+        # It recovers by a rate of 1 every second.
+        clock.now += 3
+        self.failUnlessEqual(limiter.rates()[SEARCH], 5.5)
+        clock.now += 10
+        self.failUnlessEqual(limiter.rates()[SEARCH], 8.0)
+
+    def test_min_rate(self):
+        clock = FakeClock()
+        limiter = RateLimiter(search_rate=1, write_rate=1, min_rate=0.5, cooldown=0, clock=clock)
+        for i in range(3):
+            limiter.record(WRITE, APIError(503, 'busy', {'status': '503'}))
+        self.failUnlessEqual(limiter.rates()[WRITE], 0.5)
+
+    def test_retry_after(self):
+        clock = FakeClock()
+        limiter = RateLimiter(search_rate=10, write_rate=10, clock=clock, sleep=clock.sleep)
+        limiter.record(WRITE, APIError(429, 'slow down', {'status': '429', 'retry-after': '3'}))
+        self.failUnlessEqual(limiter.acquire(WRITE), 3.0)
+        # A date is ignored.
+        limiter.record(WRITE, APIError(429, 'slow down', {'status': '429', 'retry-after': 'Fri, 31 Dec 1999 23:59:59 GMT'}))
@@ -0,0 +1,81 @@
+import socket, unittest
+
+from simplegeo.shared import APIError, DecodeError
+from simplegeo.places.retry import CircuitBreaker, CircuitOpenError, RetryPolicy, is_transient_failure
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_transient(self):
+        self.failUnless(is_transient_failure(APIError(503, 'busy', {'status': '503'})))
+        self.failUnless(is_transient_failure(socket.error(104, 'Connection reset by peer')))
+        self.failIf(is_transient_failure(APIError(404, 'not found', {'status': '404'})))
+        self.failIf(is_transient_failure(DecodeError('some crap', ValueError())))
+        self.failIf(is_transient_failure(ValueError()))
+
+    def test_delay(self):
+        p = RetryPolicy(base_delay=0.1, max_delay=0.5, jitter=False)
+        self.failUnlessEqual([p.delay(i) for i in range(4)], [0.1, 0.2, 0.4, 0.5])
+        p = RetryPolicy(base_delay=0.1, max_delay=0.5, random=lambda: 0.5)
+        self.failUnlessEqual(p.delay(1), 0.1)
+
+    def test_should_retry(self):
+        p = RetryPolicy(max_attempts=3)
+        e = APIError(500, 'oops', {'status': '500'})
+        self.failUnless(p.should_retry(e, 0))
+        self.failUnless(p.should_retry(e, 1))
+        self.failIf(p.should_retry(e, 2))
+        self.failIf(p.should_retry(APIError(400, 'bad', {'status': '400'}), 0))
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_trip_and_recover(self):
+        clock = FakeClock()
+        b = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        b.before_call()
+        b.record_failure()
+        b.before_call()
+        b.record_failure()
+        self.failUnlessEqual(b.state, CircuitBreaker.OPEN)
+        self.failUnlessRaises(CircuitOpenError, b.before_call)
+
+        clock.now += 30
+        b.before_call() # the probe
+        self.failUnlessEqual(b.state, CircuitBreaker.HALF_OPEN)
+        self.failUnlessRaises(CircuitOpenError, b.before_call) # only one probe at a time
+        b.record_failure()
+        self.failUnlessEqual(b.state, CircuitBreaker.OPEN)
+        self.failUnlessRaises(CircuitOpenError, b.before_call)
+
+        clock.now += 30
+        b.before_call()
+        b.record_success()
+        self.failUnlessEqual(b.state, CircuitBreaker.CLOSED)
+        b.before_call()
+        self.failUnlessEqual((b.trips, b.rejected), (2, 3))
+
+    def test_non_transient_errors_dont_trip(self):
+        b = CircuitBreaker(failure_threshold=1)
+        b.record(APIError(404, 'not found', {'status': '404'}))
+        b.before_call()
+        b.record(APIError(502, 'bad gateway', {'status': '502'}))
+        self.failUnlessRaises(CircuitOpenError, b.before_call)
+
+    def test_non_transient_errors_dont_close(self):
+        clock = FakeClock()
+        b = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+        b.record(APIError(503, 'busy', {'status': '503'}))
+        b.record(APIError(404, 'not found', {'status': '404'}))
+        b.record(APIError(503, 'busy', {'status': '503'}))
+        self.failUnlessEqual(b.state, CircuitBreaker.OPEN)
+
+        clock.now += 30
+        b.before_call()
+        b.record(APIError(404, 'not found', {'status': '404'}))
+        self.failUnlessEqual(b.state, CircuitBreaker.HALF_OPEN)
+        b.before_call() # another probe
+        b.record(None)
+        self.failUnlessEqual(b.state, CircuitBreaker.CLOSED)
@@ -0,0 +1,58 @@
+import unittest
+
+from simplegeo.places.stats import COUNT_BOUNDS, Histogram, Instrumentation
+
+class HistogramTest(unittest.TestCase):
+    def test_empty(self):
+        h = Histogram(COUNT_BOUNDS)
+        self.failUnlessEqual(h.percentile(50), None)
+        self.failUnlessEqual(h.snapshot()['mean'], None)
+
+    def test_percentiles(self):
+        h = Histogram(COUNT_BOUNDS)
+        for i in range(1, 101):
+            h.add(i)
+        snap = h.snapshot()
+        self.failUnlessEqual((snap['count'], snap['sum'], snap['min'], snap['max']), (100, 5050, 1, 100))
+        self.failUnlessEqual(snap['mean'], 50.5)
+        self.failUnlessEqual(snap['p50'], 64)
+        self.failUnlessEqual(snap['p99'], 100)
+
+class InstrumentationTest(unittest.TestCase):
+    def test_phases(self):
+        now = [100.0]
+        records = []
+        inst = Instrumentation(hook=records.append, clock=lambda: now[0])
+        with inst.timer('search') as timer:
+            now[0] += 0.5
+            timer.mark('validate')
+            now[0] += 2.0
+            timer.mark('network')
+            timer.note(status=200, response_bytes=1000, features=3)
+
+        self.failUnlessEqual(records, [{
+            'endpoint': 'search',
+            'seconds': 2.5,
+            'phases': {'validate': 0.5, 'network': 2.0},
+            'status': 200,
+            'response_bytes': 1000,
+            'features': 3,
+            'error': None,
+            }])
+        stats = inst.stats()['search']
+        self.failUnlessEqual((stats['calls'], stats['errors'], stats['statuses']), (1, 0, {200: 1}))
+        self.failUnlessEqual(stats['phases']['network']['sum'], 2.0)
+        self.failUnlessEqual(stats['features']['max'], 3)
+
+    def test_error(self):
+        inst = Instrumentation()
+        class Boom(Exception):
+            code = 503
+        def go():
+            with inst.timer('feature'):
+                raise Boom()
+        self.failUnlessRaises(Boom, go)
+        stats = inst.stats()['feature']
+        self.failUnlessEqual((stats['calls'], stats['errors'], stats['statuses']), (1, 1, {503: 1}))
+        inst.reset()
+        self.failUnlessEqual(inst.stats(), {})
@@ -0,0 +1,74 @@
+import os, shutil, tempfile, unittest
+from pyutil import jsonutil as json
+
+from decimal import Decimal as D
+
+from simplegeo.shared import Feature
+from simplegeo.places.store import PlaceStore
+
+def _fd(handle, lat, lon, name='x'):
+    # as it would come from the server
+    return json.loads(Feature((D(lat), D(lon)), simplegeohandle='SG_%s' % (handle * 22,), properties={'name': name}).to_json())
+
+class PlaceStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'places.sqlite')
+        self.now = [1000.0]
+        self.clock = lambda: self.now[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_exact(self):
+        store = PlaceStore(self.path, ttl=60, clock=self.clock)
+        fds = [_fd('a', '37.7749', '-122.4194', u'Caf\xe9'), _fd('b', '37.7750', '-122.4195')]
+        self.failUnless(store.put(D('37.7749'), D('-122.4194'), 1, 'coffee', None, fds))
+        self.failUnlessEqual(store.get(D('37.77491'), D('-122.41941'), 1, 'coffee', None), fds)
+        self.failUnlessEqual(store.get(D('37.7749'), D('-122.4194'), 1, 'tea', None), None)
+        self.failUnlessEqual(store.get(D('37.7749'), D('-122.4194'), 0.5, 'coffee', None), None) # not local_first
+
+        # Another PlaceStore on the same file (as in another process) sees it.
+        other = PlaceStore(self.path, ttl=60, clock=self.clock)
+        self.failUnlessEqual(other.get(D('37.7749'), D('-122.4194'), 1, 'coffee', None), fds)
+        self.failUnlessEqual((store.stats()['hits'], store.stats()['misses'], store.stats()['searches'], store.stats()['features']), (1, 2, 1, 2))
+
+        self.now[0] += 61
+        self.failUnlessEqual(store.get(D('37.7749'), D('-122.4194'), 1, 'coffee', None), None)
+        store.purge()
+        self.failUnlessEqual((store.stats()['searches'], store.stats()['features']), (0, 0))
+
+    def test_local_first(self):
+        store = PlaceStore(self.path, ttl=60, local_first=True, truncated_at=3, clock=self.clock)
+        near = _fd('a', '37.7749', '-122.4194')
+        far = _fd('b', '37.7900', '-122.4194')
+        store.put(D('37.7749'), D('-122.4194'), 5, None, None, [near, far])
+        self.failUnlessEqual(store.get(D('37.7750'), D('-122.4194'), 1), [near])
+        self.failUnlessEqual(store.get(D('37.7750'), D('-122.4194'), 1, 'coffee'), None)
+        self.failUnlessEqual(store.get(D('37.8500'), D('-122.4194'), 1), None)
+        self.failUnlessEqual(store.stats()['covered_hits'], 1)
+
+        # A result which may be truncated doesn't cover anything.
+        store.clear()
+        store.put(D('37.7749'), D('-122.4194'), 5, None, None, [near, far, _fd('c', '37.7751', '-122.4194')])
+        self.failUnlessEqual(store.get(D('37.7750'), D('-122.4194'), 1), None)
+
+    def test_replace_and_share_features(self):
+        store = PlaceStore(self.path, ttl=60, clock=self.clock)
+        store.put(D('37.7749'), D('-122.4194'), 1, None, None, [_fd('a', '37.7749', '-122.4194', 'old')])
+        store.put(D('37.7749'), D('-122.4194'), 2, None, None, [_fd('a', '37.7749', '-122.4194', 'new')])
+        self.failUnlessEqual(store.get(D('37.7749'), D('-122.4194'), 1)[0]['properties']['name'], 'new')
+        self.failUnlessEqual(store.stats()['features'], 1)
+        self.failIf(store.put(D('37.7749'), D('-122.4194'), 3, None, None, [Feature((D('1'), D('2'))).to_dict()]))
+
+    def test_errors(self):
+        import sqlite3
+        store = PlaceStore(self.path, ttl=60, clock=self.clock)
+        fds = [_fd('a', '37.7749', '-122.4194')]
+        self.failUnlessEqual(store.get(D('37.7749'), D('-122.4194'), 1), None)
+        conn = sqlite3.connect(self.path)
+        conn.executescript('DROP TABLE search_cells; DROP TABLE searches;')
+        conn.close()
+        self.failIf(store.put(D('37.7749'), D('-122.4194'), 1, None, None, fds))
+        self.failUnlessEqual(store.get(D('37.7749'), D('-122.4194'), 1), None)
+        self.failUnlessEqual(store.errors, 2)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from pyutil import jsonutil as json
+
+from decimal import Decimal as D
+
+from simplegeo.shared import DecodeError
+from simplegeo.places.streaming import FeatureScanner, iter_feature_dicts
+
+FEATURES = [
+    {'type': 'Feature', 'id': 'SG_abcdefghijkmlnopqrstuv', 'geometry': {'type': 'Point', 'coordinates': [D('10.04'), D('11.03')]}, 'properties': {'name': u"B❤b's \"House\" {of} [Monkeys]", 'features': []}},
+    {'type': 'Feature', 'id': 'SG_abcdefghijkmlnopqrstuw', 'geometry': {'type': 'Point', 'coordinates': [D('10.05'), D('11.03')]}, 'properties': {'name': 'back\\slash'}},
+    ]
+
+class FeatureScannerTest(unittest.TestCase):
+    def test_every_split(self):
+        jsonstr = json.dumps({'type': 'FeatureCollection', 'total': 2, 'features': FEATURES, 'after': {'features': [1, 2]}})
+        for i in range(len(jsonstr)):
+            res = list(iter_feature_dicts([jsonstr[:i], jsonstr[i:]]))
+            self.failUnlessEqual(res, FEATURES, i)
+
+    def test_one_byte_at_a_time(self):
+        jsonstr = json.dumps({'features': FEATURES, 'type': 'FeatureCollection'})
+        scanner = FeatureScanner()
+        found = []
+        for c in jsonstr:
+            found.extend(scanner.feed(c))
+            # Never hold more than the current feature.
+            self.failUnless(len(scanner.buf) <= max(len(json.dumps(f)) for f in FEATURES) + 2, scanner.buf)
+        scanner.close()
+        self.failUnlessEqual([json.loads(f) for f in found], FEATURES)
+
+    def test_empty(self):
+        self.failUnlessEqual(list(iter_feature_dicts(['{"type": "FeatureCollection", "features": []}'])), [])
+
+    def test_incomplete(self):
+        jsonstr = json.dumps({'type': 'FeatureCollection', 'features': FEATURES})
+        self.failUnlessRaises(DecodeError, list, iter_feature_dicts([jsonstr[:-10]]))
+        self.failUnlessRaises(DecodeError, list, iter_feature_dicts(['{"type": "FeatureCollection"}']))
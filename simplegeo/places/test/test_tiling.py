@@ -0,0 +1,39 @@
+import unittest
+
+from decimal import Decimal as D
+
+from simplegeo.shared import Feature
+from simplegeo.places.geo import distance_km
+from simplegeo.places.tiling import BboxSearchResult, Tile, half_diagonal_km, initial_tiles
+
+class TileTest(unittest.TestCase):
+    def test_circle_contains_tile(self):
+        tile = Tile(37.70, -122.52, 37.82, -122.35)
+        (lat, lon, radius) = tile.circle()
+        for (clat, clon) in [(37.70, -122.52), (37.70, -122.35), (37.82, -122.52), (37.82, -122.35)]:
+            self.failUnless(distance_km(lat, lon, clat, clon) <= radius, (clat, clon, radius))
+
+    def test_split(self):
+        quarters = Tile(0.0, 0.0, 2.0, 4.0).split()
+        self.failUnlessEqual([(t.south, t.west, t.north, t.east, t.depth) for t in quarters],
+                             [(0.0, 0.0, 1.0, 2.0, 1), (0.0, 2.0, 1.0, 4.0, 1), (1.0, 0.0, 2.0, 2.0, 1), (1.0, 2.0, 2.0, 4.0, 1)])
+
+    def test_initial_tiles(self):
+        tiles = initial_tiles(37.0, -123.0, 38.0, -122.0, 25)
+        for t in tiles:
+            self.failUnless(t.circle()[2] <= 25)
+        self.failUnlessAlmostEqual(sum((t.north - t.south) * (t.east - t.west) for t in tiles), 1.0)
+        self.failUnlessEqual(len(initial_tiles(37.0, -123.0, 37.01, -122.99, 25)), 1)
+
+    def test_half_diagonal_at_equator(self):
+        # Across the equator the widest part of the box is at 0 degrees.
+        self.failUnlessAlmostEqual(half_diagonal_km(-1.0, 0.0, 1.0, 1.0), half_diagonal_km(0.0, 0.0, 2.0, 1.0))
+
+class BboxSearchResultTest(unittest.TestCase):
+    def test_clip_and_dedupe(self):
+        inside = Feature((D('37.5'), D('-122.5')), simplegeohandle='SG_aaaaaaaaaaaaaaaaaaaaaa')
+        outside = Feature((D('38.5'), D('-122.5')), simplegeohandle='SG_bbbbbbbbbbbbbbbbbbbbbb')
+        res = BboxSearchResult(37.0, -123.0, 38.0, -122.0)
+        res.add([inside, outside])
+        res.add([inside])
+        self.failUnlessEqual([f.id for f in res], [inside.id])
@@ -0,0 +1,169 @@
+import BaseHTTPServer, SocketServer, httplib, threading, time, unittest, zlib
+
+from simplegeo.places.transport import DecompressionError, HTTPConnectionPool, PoolTimeout
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _drop(self):
+        """ Hang up without answering, as a server which closes an idle
+        connection just as a request arrives does. """
+        self.server.dropped.append((self.command, self.path))
+        self.close_connection = 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.startswith('/drop'):
+            return self._drop()
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith('/drop'):
+            return self._drop()
+        if self.path.startswith('/slow'):
+            time.sleep(0.2)
+        body = 'x' * 100000 if self.path.startswith('/big') else 'hello %s' % (self.path,)
+        encoding = None
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            if self.path.startswith('/big/gzip'):
+                (encoding, wbits) = ('gzip', 16 + zlib.MAX_WBITS)
+            elif self.path.startswith('/big/deflate'):
+                (encoding, wbits) = ('deflate', zlib.MAX_WBITS)
+            elif self.path.startswith('/big/rawdeflate'):
+                (encoding, wbits) = ('deflate', -zlib.MAX_WBITS)
+            elif self.path.startswith('/big/broken'):
+                (encoding, wbits) = ('gzip', None)
+        if encoding is not None:
+            if wbits is None:
+                body = body[:1000]
+            else:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+                body = compressor.compress(body) + compressor.flush()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args):
+        BaseHTTPServer.HTTPServer.__init__(self, *args)
+        self.dropped = []
+
+    def handle_error(self, request, client_address):
+        pass # e.g. the client closed a keep-alive connection
+
+class HTTPConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.port = self.server.server_address[1]
+        self.uri = 'http://127.0.0.1:%d' % (self.port,)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=2)
+        for i in range(5):
+            resp, content = pool.request(self.uri + '/a?b=%d' % (i,))
+            self.failUnlessEqual(resp['status'], '200')
+            self.failUnlessEqual(resp['content-type'], 'text/plain')
+            self.failUnlessEqual(content, 'hello /a?b=%d' % (i,))
+        stats = pool.stats()
+        self.failUnlessEqual((stats['created'], stats['reused'], stats['in_use'], stats['idle']), (1, 4, 0, 1))
+        pool.close()
+
+    def test_bounded(self):
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=2)
+        results = []
+        def go():
+            results.append(pool.request(self.uri + '/slow')[1])
+        threads = [threading.Thread(target=go) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.failUnlessEqual(results, ['hello /slow'] * 6)
+        stats = pool.stats()
+        self.failUnlessEqual(stats['created'], 2)
+        self.failUnless(stats['waits'] >= 1, stats)
+
+    def test_wait_timeout(self):
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=1, wait_timeout=0.05)
+        t = threading.Thread(target=pool.request, args=(self.uri + '/slow',))
+        t.start()
+        time.sleep(0.05)
+        self.failUnlessRaises(PoolTimeout, pool.request, self.uri + '/a')
+        t.join()
+        self.failUnlessEqual(pool.stats()['timeouts'], 1)
+
+    def test_idle_timeout(self):
+        now = [1000.0]
+        pool = HTTPConnectionPool('127.0.0.1', self.port, idle_timeout=60, clock=lambda: now[0])
+        pool.request(self.uri + '/a')
+        now[0] += 61
+        pool.request(self.uri + '/a')
+        stats = pool.stats()
+        self.failUnlessEqual((stats['created'], stats['discarded']), (2, 1))
+
+    def test_stream(self):
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=1)
+        resp, chunks = pool.request_stream(self.uri + '/big', chunk_size=1000)
+        self.failUnlessEqual(pool.stats()['in_use'], 1)
+        self.failUnlessEqual(''.join(chunks), 'x' * 100000)
+        self.failUnlessEqual(pool.stats()['idle'], 1)
+
+        # Stopping early closes the connection instead of reusing it.
+        resp, chunks = pool.request_stream(self.uri + '/big', chunk_size=1000)
+        chunks.next()
+        chunks.close()
+        stats = pool.stats()
+        self.failUnlessEqual((stats['in_use'], stats['idle']), (0, 0))
+        self.failUnlessEqual(pool.request(self.uri + '/a')[1], 'hello /a')
+
+    def test_compressed(self):
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=1)
+        for encoding in ('gzip', 'deflate', 'rawdeflate'):
+            resp, content = pool.request(self.uri + '/big/' + encoding)
+            self.failUnlessEqual(content, 'x' * 100000)
+            self.failIf('content-encoding' in resp, resp)
+            self.failUnless(int(resp['content-length']) < 1000, resp)
+
+            resp, chunks = pool.request_stream(self.uri + '/big/' + encoding, chunk_size=10)
+            chunks = list(chunks)
+            self.failUnless(len(chunks) > 1, chunks)
+            self.failUnlessEqual(''.join(chunks), 'x' * 100000)
+        self.failUnlessEqual(pool.stats()['created'], 1)
+
+        self.failUnlessRaises(DecompressionError, pool.request, self.uri + '/big/broken')
+
+        # Without accept_encoding the server doesn't compress.
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=1, accept_encoding=None)
+        resp, content = pool.request(self.uri + '/big/gzip')
+        self.failUnlessEqual(content, 'x' * 100000)
+        self.failUnlessEqual(resp['content-length'], '100000')
+
+    def test_dont_resend_posts(self):
+        pool = HTTPConnectionPool('127.0.0.1', self.port, maxsize=1)
+        pool.request(self.uri + '/a')
+        # The POST reached the server, so it mustn't be sent again...
+        self.failUnlessRaises(httplib.HTTPException, pool.request, self.uri + '/drop', 'POST', body='{}')
+        self.failUnlessEqual(self.server.dropped, [('POST', '/drop')])
+
+        # ...but a GET on a reused connection is tried once more.
+        pool.request(self.uri + '/a')
+        self.failUnlessRaises(httplib.HTTPException, pool.request, self.uri + '/drop')
+        self.failUnlessEqual(self.server.dropped, [('POST', '/drop'), ('GET', '/drop'), ('GET', '/drop')])
@@ -0,0 +1,124 @@
+import unittest
+from pyutil import jsonutil as json
+
+from decimal import Decimal as D
+
+import mock
+
+from simplegeo.places import Feature, APIError
+
+try:
+    from twisted.internet import defer, task
+    from twisted.python.failure import Failure
+    from twisted.web.client import ResponseDone
+    from twisted.web.http_headers import Headers
+    from simplegeo.places.txclient import AsyncClient
+except ImportError:
+    AsyncClient = None
+
+MY_OAUTH_KEY = 'MY_OAUTH_KEY'
+MY_OAUTH_SECRET = 'MY_SECRET_KEY'
+
+API_VERSION = '1.0'
+API_HOST = 'api.simplegeo.com'
+API_PORT = 80
+
+class FakeResponse(object):
+    def __init__(self, code, body):
+        self.code = code
+        self.phrase = 'OK'
+        self.headers = Headers({'Content-Type': ['application/json']})
+        self.body = body
+
+    def deliverBody(self, protocol):
+        protocol.dataReceived(self.body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+class AsyncClientTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.client = AsyncClient(MY_OAUTH_KEY, MY_OAUTH_SECRET, API_VERSION, API_HOST, API_PORT, reactor=self.clock)
+        self.client.agent = mock.Mock()
+
+    def _result(self, d):
+        res = []
+        d.addBoth(res.append)
+        for i in range(10):
+            self.clock.advance(1)
+        self.failUnlessEqual(len(res), 1, res)
+        if isinstance(res[0], Failure):
+            res[0].raiseException()
+        return res[0]
+
+    def test_search(self):
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys", 'category': "monkey dealership"})
+        body = json.dumps({'type': "FeatureColllection", 'features': [rec1.to_dict()]})
+        self.client.agent.request.return_value = defer.succeed(FakeResponse(200, body))
+
+        self.failUnlessRaises(AssertionError, self.client.search, -91, 100)
+
+        res = self._result(self.client.search(D('11.03'), D('10.04'), query='monkeys'))
+        self.failUnlessEqual(len(res), 1)
+        self.failUnless(isinstance(res[0], Feature), res)
+        self.failUnlessEqual(res[0].id, 'SG_abcdefghijkmlnopqrstuv')
+        args = self.client.agent.request.call_args[0]
+        self.failUnlessEqual(args[0], 'GET')
+        self.failUnlessEqual(args[1], 'http://api.simplegeo.com:80/%s/places/11.03,10.04.json?q=monkeys' % (API_VERSION,))
+        self.failUnless(args[2].hasHeader('Authorization'))
+
+    def test_search_error(self):
+        self.client.agent.request.return_value = defer.succeed(FakeResponse(500, '{"message": "help my web server is confuzzled"}'))
+        try:
+            self._result(self.client.search_by_ip('192.0.32.10'))
+        except APIError, e:
+            self.failUnlessEqual(e.code, 500)
+        else:
+            self.fail("APIError was not raised")
+
+    def test_get_feature(self):
+        rec1 = Feature((D('11.03'), D('10.04')), simplegeohandle='SG_abcdefghijkmlnopqrstuv', properties={'name': "Bob's House Of Monkeys"})
+        self.client.agent.request.return_value = defer.succeed(FakeResponse(200, json.dumps(rec1.to_dict())))
+        self.failUnlessRaises(TypeError, self.client.get_feature, 'bogus')
+        res = self._result(self.client.get_feature('SG_abcdefghijkmlnopqrstuv'))
+        self.failUnlessEqual(res.id, 'SG_abcdefghijkmlnopqrstuv')
+        self.failUnlessEqual(self.client.agent.request.call_args[0][0], 'GET')
+
+    def test_no_blocking_methods(self):
+        # The methods which only the blocking Client has aren't
+        # inherited in a form which would block the reactor.
+        for name in ['search_many', 'search_bbox', 'update_features', 'iter_search', 'iter_search_by_address', '_get_json', 'stats']:
+            self.failIf(hasattr(self.client, name), name)
+        # and the ones it does have return Deferreds.
+        handle = 'SG_abcdefghijkmlnopqrstuv'
+        self.client.agent.request.side_effect = lambda *args: defer.succeed(FakeResponse(200, '{"annotations": {}}'))
+        for d in [self.client.get_annotations(handle), self.client.annotate(handle, {'meta': {'note': 'x'}}, False)]:
+            self.failUnless(isinstance(d, defer.Deferred), d)
+            self._result(d)
+
+    def test_annotations(self):
+        handle = 'SG_abcdefghijkmlnopqrstuv'
+        annotations = {'annotations': [{'private': False, 'meta': {'note': 'monkeys'}}]}
+        self.client.agent.request.return_value = defer.succeed(FakeResponse(200, json.dumps(annotations)))
+        self.failUnlessRaises(TypeError, self.client.get_annotations, 'bogus')
+        self.failUnlessEqual(self._result(self.client.get_annotations(handle)), annotations)
+        self.failUnlessEqual(self.client.agent.request.call_args[0][1], 'http://api.simplegeo.com:80/%s/features/%s/annotations.json' % (API_VERSION, handle))
+
+        self.failUnlessRaises(ValueError, self.client.annotate, handle, {}, False)
+        self.failUnlessRaises(TypeError, self.client.annotate, handle, {'meta': {'note': 'x'}}, 'no')
+        self.client.agent.request.return_value = defer.succeed(FakeResponse(200, '{"status": "ok"}'))
+        self.failUnlessEqual(self._result(self.client.annotate(handle, {'meta': {'note': 'x'}}, True)), {'status': 'ok'})
+        self.failUnlessEqual(self.client.agent.request.call_args[0][0], 'POST')
+
+    def test_add_features(self):
+        handle = 'SG_abcdefghijklmnopqrstuv'
+        self.client.agent.request.return_value = defer.succeed(FakeResponse(202, json.dumps({'id': handle})))
+        features = [Feature((D('37.8016'), D('-122.4783'))), Feature((D('37.8016'), D('-122.4783')), simplegeohandle=handle)]
+        res = self._result(self.client.add_features(features, concurrency=2))
+        self.failUnlessEqual(len(res), 2)
+        res = dict((f.id, r) for (f, r) in res)
+        self.failUnlessEqual(res[None], handle)
+        self.failUnless(isinstance(res[handle], ValueError), res)
+
+if AsyncClient is None:
+    # Twisted is not installed. (unittest.skipIf is new in Python 2.7.)
+    del AsyncClientTest
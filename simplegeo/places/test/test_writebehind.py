@@ -0,0 +1,92 @@
+import threading, time, unittest
+
+from simplegeo.places import Feature
+from simplegeo.places.bulk import Outcome
+from simplegeo.places.writebehind import WriteBehind
+
+HANDLES = ['SG_%022d' % (i,) for i in range(10)]
+
+class FakeSender(object):
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.batches = []
+        self.sent = threading.Event()
+
+    def __call__(self, features, concurrency):
+        self.batches.append([(f.id, f.properties['n']) for f in features])
+        self.sent.set()
+        for f in features:
+            if f.id in self.fail:
+                yield Outcome(f.id, False, None, ValueError(f.id), 0.0)
+            else:
+                yield Outcome(f.id, True, '', None, 0.0)
+
+def _feature(handle, n):
+    return Feature((37.0, -122.0), simplegeohandle=handle, properties={'n': n})
+
+class WriteBehindTest(unittest.TestCase):
+    def test_coalesce_and_flush(self):
+        wb = WriteBehind(delay=60)
+        send = FakeSender()
+        wb.start(send)
+        for n in range(3):
+            wb.put(_feature(HANDLES[0], n))
+        wb.put(_feature(HANDLES[1], 0))
+        self.failUnlessEqual(send.batches, [])
+        self.failUnlessEqual(wb.stats(), {'updates': 4, 'writes': 0, 'failed': 0, 'pending': 2, 'saved': 2})
+
+        wb.flush()
+        self.failUnlessEqual(sorted(send.batches[0]), [(HANDLES[0], 2), (HANDLES[1], 0)])
+        self.failUnlessEqual(wb.stats(), {'updates': 4, 'writes': 2, 'failed': 0, 'pending': 0, 'saved': 2})
+
+        wb.put(_feature(HANDLES[0], 3))
+        wb.close()
+        self.failUnlessEqual(send.batches[1], [(HANDLES[0], 3)])
+        self.failUnlessRaises(AssertionError, wb.put, _feature(HANDLES[0], 4))
+
+    def test_delay(self):
+        wb = WriteBehind(delay=0.05)
+        send = FakeSender()
+        wb.start(send)
+        # Let the thread go to sleep on the empty buffer first.
+        time.sleep(0.1)
+        wb.put(_feature(HANDLES[0], 0))
+        wb.put(_feature(HANDLES[0], 1))
+        send.sent.wait(5)
+        self.failUnless(send.sent.isSet())
+        self.failUnlessEqual(send.batches, [[(HANDLES[0], 1)]])
+        wb.close()
+
+    def test_batch_size(self):
+        wb = WriteBehind(delay=60, batch_size=3)
+        send = FakeSender()
+        wb.start(send)
+        for handle in HANDLES[:3]:
+            wb.put(_feature(handle, 0))
+        send.sent.wait(5)
+        self.failUnless(send.sent.isSet())
+        self.failUnlessEqual(len(send.batches[0]), 3)
+        wb.close()
+
+    def test_errors(self):
+        errors = []
+        wb = WriteBehind(delay=60, on_error=errors.append)
+        wb.start(FakeSender(fail=[HANDLES[1]]))
+        wb.put(_feature(HANDLES[0], 0))
+        wb.put(_feature(HANDLES[1], 0))
+        wb.flush()
+        self.failUnlessEqual([o.handle for o in errors], [HANDLES[1]])
+        self.failUnlessEqual(wb.stats()['failed'], 1)
+        wb.close()
+
+    def test_on_error_raises(self):
+        def on_error(outcome):
+            raise ValueError("oops")
+        wb = WriteBehind(delay=60, on_error=on_error)
+        wb.start(FakeSender(fail=HANDLES[:2]))
+        for handle in HANDLES[:4]:
+            wb.put(_feature(handle, 0))
+        wb.flush()
+        self.failUnlessEqual(wb.stats()['writes'], 4)
+        self.failUnlessEqual(wb.stats()['failed'], 2)
+        wb.close()
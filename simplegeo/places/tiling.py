@@ -0,0 +1,106 @@
+"""
+Support for Client.search_bbox(), which finds everything in a
+latitude/longitude box by covering it with circular searches.
+"""
+from math import cos, radians, sqrt
+
+from simplegeo.places.geo import KM_PER_DEGREE
+
+class Tile(object):
+    """
+    A latitude/longitude rectangle, searched with the smallest circle
+    which contains it.
+    """
+    __slots__ = ('south', 'west', 'north', 'east', 'depth')
+
+    def __init__(self, south, west, north, east, depth=0):
+        self.south = south
+        self.west = west
+        self.north = north
+        self.east = east
+        self.depth = depth
+
+    def circle(self):
+        """ Return (lat, lon, radius) of the search circle. """
+        lat = (self.south + self.north) / 2.0
+        lon = (self.west + self.east) / 2.0
+        return (lat, lon, half_diagonal_km(self.south, self.west, self.north, self.east))
+
+    def split(self):
+        """ Return the four quarters of this tile. """
+        lat = (self.south + self.north) / 2.0
+        lon = (self.west + self.east) / 2.0
+        d = self.depth + 1
+        return [Tile(self.south, self.west, lat, lon, d), Tile(self.south, lon, lat, self.east, d),
+                Tile(lat, self.west, self.north, lon, d), Tile(lat, lon, self.north, self.east, d)]
+
+    def __repr__(self):
+        return '<Tile %s,%s %s,%s>' % (self.south, self.west, self.north, self.east)
+
+def half_diagonal_km(south, west, north, east):
+    """ Return half of the diagonal of the rectangle, measured at its
+    widest (the latitude nearest the equator), which is the radius of
+    a circle around its center that contains it. """
+    if south <= 0 <= north:
+        widest = 0.0
+    else:
+        widest = min(abs(south), abs(north))
+    height = (north - south) * KM_PER_DEGREE
+    width = (east - west) * KM_PER_DEGREE * cos(radians(widest))
+    return sqrt(height**2 + width**2) / 2.0
+
+def initial_tiles(south, west, north, east, max_radius):
+    """ Divide the box into a grid of equal tiles whose search circles
+    have radii of at most max_radius. """
+    (rows, cols) = (1, 1)
+    while half_diagonal_km(south, west, south + (north - south) / rows, west + (east - west) / cols) > max_radius:
+        # Halve whichever side is longer.
+        dlat = (north - south) / rows * KM_PER_DEGREE
+        dlon = (east - west) / cols * KM_PER_DEGREE
+        if dlat >= dlon:
+            rows *= 2
+        else:
+            cols *= 2
+    tiles = []
+    for i in range(rows):
+        for j in range(cols):
+            tiles.append(Tile(south + (north - south) * i / rows, west + (east - west) * j / cols,
+                              south + (north - south) * (i + 1) / rows, west + (east - west) * (j + 1) / cols))
+    return tiles
+
+class BboxSearchResult(list):
+    """
+    The features found by Client.search_bbox(): a list of the distinct
+    features (by simplegeohandle) within the box, in the order in which
+    they were found. Features which aren't Points are kept if they
+    were found at all, since they can't be clipped without their
+    area.
+
+    searched is the number of searches which were sent, subdivided is
+    the number of tiles which returned too many features and so were
+    split into four, and saturated is the number of tiles which did so
+    but were already as small as allowed, so that the result may be
+    missing features near them.
+    """
+    def __init__(self, south, west, north, east):
+        list.__init__(self)
+        self.south = south
+        self.west = west
+        self.north = north
+        self.east = east
+        self.searched = 0
+        self.subdivided = 0
+        self.saturated = 0
+        self._seen = set()
+
+    def add(self, features):
+        for f in features:
+            if f.id is not None:
+                if f.id in self._seen:
+                    continue
+                self._seen.add(f.id)
+            if f.geomtype == 'Point':
+                (lat, lon) = f.coordinates[:2]
+                if not (self.south <= lat <= self.north and self.west <= lon <= self.east):
+                    continue
+            self.append(f)
@@ -0,0 +1,310 @@
+import httplib, socket, threading, time, urlparse, zlib
+
+from pyutil.assertutil import precondition
+
+CHUNK_SIZE = 2**14
+
+# The Content-Encodings which the pool can decompress.
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# The methods which can safely be sent again if we can't tell whether
+# the server got them.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+class PoolTimeout(Exception):
+    """ No connection became free within the pool's wait_timeout. """
+
+class DecompressionError(httplib.HTTPException):
+    """ A compressed response body couldn't be decompressed. """
+
+class _Inflater(object):
+    """ Incrementally decompresses a body with Content-Encoding gzip
+    or deflate. """
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._obj = zlib.decompressobj(zlib.MAX_WBITS)
+        self._started = False
+
+    def decompress(self, data):
+        try:
+            if not self._started and self.encoding == 'deflate':
+                self._started = True
+                try:
+                    return self._obj.decompress(data)
+                except zlib.error:
+                    # Some servers send raw deflate data without the
+                    # zlib header which the spec calls for.
+                    self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._obj.decompress(data)
+        except zlib.error, e:
+            raise DecompressionError("Couldn't decompress the %s response body: %s" % (self.encoding, e))
+
+    def flush(self):
+        return self._obj.flush()
+
+def _inflater(headers):
+    """ Return an _Inflater for a response with the given headers, or
+    None if its body isn't compressed. """
+    encoding = headers.get('content-encoding', '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return _Inflater('gzip')
+    if encoding == 'deflate':
+        return _Inflater('deflate')
+    return None
+
+class HTTPConnectionPool(object):
+    """
+    A thread-safe, bounded pool of persistent (keep-alive) HTTP
+    connections to one host:port, with the same request() method as
+    httplib2.Http, so that one Client can be shared by many threads.
+
+    At most maxsize connections are open at once. A request which
+    finds them all in use waits for one to be returned to the pool,
+    for up to wait_timeout seconds (forever if wait_timeout is None)
+    before raising PoolTimeout. Idle connections which haven't been
+    used for idle_timeout seconds are closed. timeout is the socket
+    timeout, in seconds, of each connection.
+
+    If accept_encoding is not None, it is sent as the Accept-Encoding
+    header of requests which don't have one, and responses compressed
+    with gzip or deflate are decompressed as they are read. Their
+    headers say what the body was compressed with in
+    '-content-encoding' rather than 'content-encoding', as httplib2's
+    do.
+    """
+    def __init__(self, host, port=80, maxsize=10, idle_timeout=60, wait_timeout=None, timeout=None, accept_encoding=ACCEPT_ENCODING, clock=time.time):
+        precondition(isinstance(maxsize, (int, long)) and maxsize >= 1, maxsize)
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.timeout = timeout
+        self.accept_encoding = accept_encoding
+        self.clock = clock
+        self._idle = [] # (last used, connection), most recently used last
+        self._in_use = 0
+        self._cond = threading.Condition(threading.Lock())
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _new_connection(self):
+        self._cond.acquire()
+        try:
+            self.created += 1
+        finally:
+            self._cond.release()
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _checkout(self):
+        """ Return (connection, reused). """
+        self._cond.acquire()
+        try:
+            started = None
+            while True:
+                now = self.clock()
+                while self._idle:
+                    (lastused, conn) = self._idle.pop()
+                    if self.idle_timeout is not None and now - lastused > self.idle_timeout:
+                        conn.close()
+                        self.discarded += 1
+                        continue
+                    self._in_use += 1
+                    self.reused += 1
+                    return conn, True
+                if self._in_use < self.maxsize:
+                    self._in_use += 1
+                    break
+                if started is None:
+                    started = now
+                    self.waits += 1
+                if self.wait_timeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = started + self.wait_timeout - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout("all %d connections to %s:%s stayed in use for %s seconds" % (self.maxsize, self.host, self.port, self.wait_timeout))
+                    self._cond.wait(remaining)
+        finally:
+            if started is not None:
+                self.wait_seconds += self.clock() - started
+            self._cond.release()
+        # Connect outside of the lock.
+        return self._new_connection(), False
+
+    def _checkin(self, conn, reusable):
+        self._cond.acquire()
+        try:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((self.clock(), conn))
+            else:
+                conn.close()
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def _send(self, uri, method, body, headers):
+        """ Send the request and return (connection, response). """
+        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(uri)
+        if query:
+            path = path + '?' + query
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        headers = dict(headers or {})
+        if self.accept_encoding is not None and not [k for k in headers if k.lower() == 'accept-encoding']:
+            headers['Accept-Encoding'] = self.accept_encoding
+        conn, reused = self._checkout()
+        try:
+            sent = False
+            try:
+                conn.request(method, path, body, headers)
+                sent = True
+                response = conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                # The server probably closed the idle keep-alive
+                # connection, so try once more on a new one. But if the
+                # request was sent, the server may have acted on it, so
+                # only do that for requests which are safe to repeat.
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                conn = self._new_connection()
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+        except:
+            self._checkin(conn, False)
+            raise
+        return conn, response
+
+    def _headers(self, response):
+        """ Return a tuple of (headers as dict, _Inflater for the body
+        or None). """
+        resp = dict((k.lower(), v) for (k, v) in response.getheaders())
+        resp['status'] = str(response.status)
+        inflater = None
+        if self.accept_encoding is not None:
+            inflater = _inflater(resp)
+            if inflater is not None:
+                resp['-content-encoding'] = resp.pop('content-encoding')
+        return resp, inflater
+
+    def request(self, uri, method='GET', body=None, headers=None):
+        """ Return a tuple of (headers as dict, body as string). """
+        conn, response = self._send(uri, method, body, headers)
+        resp, inflater = self._headers(response)
+        try:
+            if inflater is not None:
+                # Inflate as it arrives, so that the compressed body
+                # isn't held in memory as well.
+                parts = []
+                while True:
+                    data = response.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    parts.append(inflater.decompress(data))
+                parts.append(inflater.flush())
+                content = ''.join(parts)
+            else:
+                content = response.read()
+        except:
+            self._checkin(conn, False)
+            raise
+        self._checkin(conn, not response.will_close)
+        return resp, content
+
+    def request_stream(self, uri, method='GET', body=None, headers=None, chunk_size=CHUNK_SIZE):
+        """
+        Like request(), but instead of reading the whole response body
+        it returns a tuple of (headers as dict, iterator of body
+        chunks). The connection is returned to the pool if the
+        iterator is run to the end, or closed if it is closed (or
+        garbage collected) before that. Compressed bodies are
+        decompressed chunk by chunk.
+        """
+        conn, response = self._send(uri, method, body, headers)
+        resp, inflater = self._headers(response)
+        return resp, _ResponseChunks(self, conn, response, chunk_size, inflater)
+
+    def close(self):
+        """ Close the idle connections. """
+        self._cond.acquire()
+        try:
+            for (lastused, conn) in self._idle:
+                conn.close()
+            self._idle = []
+        finally:
+            self._cond.release()
+
+    def stats(self):
+        """ Return a dict describing the use of the pool. """
+        self._cond.acquire()
+        try:
+            return {
+                'maxsize': self.maxsize,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'utilization': float(self._in_use) / self.maxsize,
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'timeouts': self.timeouts,
+                }
+        finally:
+            self._cond.release()
+
+class _ResponseChunks(object):
+    """ An iterator of the chunks of a response body, which gives the
+    connection back to the pool when it is finished or closed. """
+    def __init__(self, pool, conn, response, chunk_size, inflater=None):
+        self.pool = pool
+        self.conn = conn
+        self.response = response
+        self.chunk_size = chunk_size
+        self.inflater = inflater
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while self.conn is not None:
+            try:
+                data = self.response.read(self.chunk_size)
+                if self.inflater is not None:
+                    if not data:
+                        data = self.inflater.flush()
+                        self._release(not self.response.will_close)
+                    else:
+                        data = self.inflater.decompress(data)
+                        if not data:
+                            # Not enough compressed data yet to inflate any.
+                            continue
+            except:
+                self._release(False)
+                raise
+            if not data:
+                self._release(not self.response.will_close)
+                raise StopIteration
+            return data
+        raise StopIteration
+
+    def _release(self, reusable):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            self.pool._checkin(conn, reusable)
+
+    def close(self):
+        self._release(False)
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,186 @@
+"""
+A non-blocking Places client for use with Twisted.
+
+AsyncClient has the same basic methods (get_feature, add_feature(s),
+update_feature, delete_feature, get_annotations, annotate and the four
+searches), with the same
+arguments and the same argument checking, as simplegeo.places.Client,
+but instead of
+blocking until the server responds each method returns a Deferred
+which fires with the same result (or fails with the same exception)
+that the blocking method would have returned (or raised). Requests
+are sent by a twisted.web Agent over a pool of persistent HTTP
+connections, so a single reactor can keep many requests in flight at
+once.
+
+This module requires Twisted (pip install "simplegeo-places[async]").
+"""
+
+from StringIO import StringIO
+
+from pyutil import jsonutil as json
+from pyutil.assertutil import precondition
+
+from twisted.internet import defer, task
+from twisted.web.client import Agent, ContentDecoderAgent, GzipDecoder, HTTPConnectionPool, FileBodyProducer, readBody
+from twisted.web.http_headers import Headers
+
+from simplegeo.shared import APIError, Feature, SIMPLEGEOHANDLE_RSTR, is_simplegeohandle
+from simplegeo.places import API_VERSION, BaseClient, _full_features, _result_maker
+
+class AsyncClient(BaseClient):
+    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80, reactor=None, max_connections=10, idle_timeout=240, codec=None, compress_responses=True, compress_requests=None):
+        """
+        max_connections is the maximum number of idle persistent
+        connections to keep open to the server, and idle_timeout is
+        the number of seconds after which an idle connection is
+        closed. codec, compress_responses (which only asks for gzip)
+        and compress_requests are as for Client.
+        """
+        BaseClient.__init__(self, key, secret, api_version=api_version, host=host, port=port, codec=codec, compress_requests=compress_requests)
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = max_connections
+        self.pool.cachedConnectionTimeout = idle_timeout
+        self.agent = Agent(reactor, pool=self.pool)
+        if compress_responses:
+            self.agent = ContentDecoderAgent(self.agent, [('gzip', GzipDecoder)])
+
+    def close(self):
+        """ Close the pooled connections. Returns a Deferred which
+        fires when they are all closed. """
+        return self.pool.closeCachedConnections()
+
+    def get_feature(self, simplegeohandle):
+        """Return a Deferred which fires with the Feature."""
+        if not is_simplegeohandle(simplegeohandle):
+            raise TypeError("simplegeohandle is required to match the regex %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
+        endpoint = self._endpoint('feature', simplegeohandle=simplegeohandle)
+        d = self._request(endpoint, 'GET')
+        d.addCallback(lambda res: Feature.from_json(res[1]))
+        return d
+
+    def add_feature(self, feature):
+        """Create a new feature, returns a Deferred which fires with the simplegeohandle. """
+        endpoint, jsonrec = self._add_feature_request(feature)
+        d = self._request(endpoint, "POST", jsonrec)
+        d.addCallback(lambda res: self._add_feature_result(*res))
+        return d
+
+    def add_features(self, features, concurrency=8):
+        """
+        Like Client.add_features(), but returns a Deferred which fires
+        with the list of (feature, handle_or_error) tuples once every
+        feature has been tried.
+        """
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        it = iter(features)
+        results = []
+        def _add(feature):
+            d = defer.maybeDeferred(self.add_feature, feature)
+            d.addCallbacks(lambda handle: results.append((feature, handle)),
+                           lambda f: results.append((feature, f.value)))
+            return d
+        def _work():
+            for feature in it:
+                yield _add(feature)
+        coop = task.Cooperator(scheduler=lambda x: self.reactor.callLater(0, x))
+        d = defer.gatherResults([coop.coiterate(_work()) for i in range(concurrency)])
+        d.addCallback(lambda ign: results)
+        return d
+
+    def update_feature(self, feature):
+        """Update a Places feature."""
+        endpoint = self._endpoint('feature', simplegeohandle=feature.id)
+        d = self._request(endpoint, 'POST', self.codec.encode(feature.to_dict()))
+        d.addCallback(lambda res: res[1])
+        return d
+
+    def delete_feature(self, simplegeohandle):
+        """Delete a Places feature."""
+        endpoint = self._delete_feature_endpoint(simplegeohandle)
+        d = self._request(endpoint, 'DELETE')
+        d.addCallback(lambda res: res[1])
+        return d
+
+    def get_annotations(self, simplegeohandle):
+        """Return a Deferred which fires with the annotations of a feature."""
+        if not is_simplegeohandle(simplegeohandle):
+            raise TypeError("simplegeohandle is required to match the regex %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
+        endpoint = self._endpoint('annotations', simplegeohandle=simplegeohandle)
+        d = self._request(endpoint, 'GET')
+        d.addCallback(lambda res: json.loads(res[1]))
+        return d
+
+    def annotate(self, simplegeohandle, annotations, private):
+        """Annotate a feature, returns a Deferred which fires with the server's response."""
+        if not isinstance(annotations, dict):
+            raise TypeError('annotations must be of type dict')
+        if not len(annotations.keys()):
+            raise ValueError('annotations dict is empty')
+        for annotation_type in annotations.keys():
+            if not len(annotations[annotation_type].keys()):
+                raise ValueError('annotation type "%s" is empty' % annotation_type)
+        if not isinstance(private, bool):
+            raise TypeError('private must be of type bool')
+        data = {'annotations': annotations, 'private': private}
+        endpoint = self._endpoint('annotations', simplegeohandle=simplegeohandle)
+        d = self._request(endpoint, 'POST', json.dumps(data))
+        d.addCallback(lambda res: json.loads(res[1]))
+        return d
+
+    def search(self, lat, lon, radius=None, query=None, category=None, compact=False, as_arrays=False):
+        """Search for places near a lat/lon, within a radius (in kilometers)."""
+        return self._search(self._search_endpoint(lat, lon, radius, query, category), _result_maker(compact, as_arrays))
+
+    def search_by_ip(self, ipaddr, radius=None, query=None, category=None, compact=False, as_arrays=False):
+        """Search for places near an IP address, within a radius (in kilometers)."""
+        return self._search(self._search_by_ip_endpoint(ipaddr, radius, query, category), _result_maker(compact, as_arrays))
+
+    def search_by_my_ip(self, radius=None, query=None, category=None, compact=False, as_arrays=False):
+        """Search for places near your IP address, within a radius (in kilometers)."""
+        return self._search(self._search_by_my_ip_endpoint(radius, query, category), _result_maker(compact, as_arrays))
+
+    def search_by_address(self, address, radius=None, query=None, category=None, compact=False, as_arrays=False):
+        """Search for places near the given address, within a radius (in kilometers)."""
+        return self._search(self._search_by_address_endpoint(address, radius, query, category), _result_maker(compact, as_arrays))
+
+    def _search(self, endpoint, make=_full_features):
+        d = self._request(endpoint, 'GET')
+        d.addCallback(lambda res: self._features(res[1], make))
+        return d
+
+    def _request(self, endpoint, method, data=None):
+        """
+        Like Client._request(), but returns a Deferred which fires
+        with the tuple of (headers as dict, body as string).
+        """
+        bodyProducer = None
+        data, content_encoding = self._encode_body(data)
+        if data is not None:
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            bodyProducer = FileBodyProducer(StringIO(data))
+        headers = Headers()
+        for (k, v) in self._signed_headers(endpoint, method).iteritems():
+            headers.addRawHeader(str(k), str(v))
+        if content_encoding is not None:
+            headers.addRawHeader('Content-Encoding', content_encoding)
+        d = self.agent.request(method, str(endpoint), headers, bodyProducer)
+        def _got_response(response):
+            respheaders = dict((k.lower(), v[-1]) for (k, v) in response.headers.getAllRawHeaders())
+            respheaders['status'] = str(response.code)
+            d2 = readBody(response)
+            d2.addCallback(lambda content: (respheaders, content))
+            return d2
+        d.addCallback(_got_response)
+        def _check_status(res):
+            (resp, content) = res
+            self.headers = resp
+            if resp['status'][0] not in ('2', '3'):
+                raise APIError(int(resp['status']), content, resp)
+            return res
+        d.addCallback(_check_status)
+        return d
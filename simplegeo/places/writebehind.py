@@ -0,0 +1,167 @@
+import atexit, threading, time
+
+from pyutil.assertutil import precondition
+
+class WriteBehind(object):
+    """
+    Buffers the updates of a Client's update_feature(), keeping only
+    the latest version of each feature (by simplegeohandle), and sends
+    them from a background thread. An update is sent once it has been
+    buffered for delay seconds, or sooner if batch_size features are
+    waiting. Updates are sent concurrency at a time, and one batch at
+    a time, so that an older version of a feature is never sent after
+    a newer one.
+
+    flush() sends everything which is buffered and waits for it to be
+    sent. close() (which is also called when the interpreter exits)
+    flushes and stops the background thread.
+
+    An update which fails is not retried (beyond what the Client's
+    retry_policy does) but is counted, and if on_error is given it is
+    called with its simplegeo.places.bulk.Outcome.
+    """
+    def __init__(self, delay=1.0, batch_size=100, concurrency=8, on_error=None, clock=time.time):
+        precondition(delay >= 0, delay)
+        precondition(isinstance(batch_size, (int, long)) and batch_size >= 1, batch_size)
+        precondition(isinstance(concurrency, (int, long)) and concurrency >= 1, concurrency)
+        self.delay = delay
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.on_error = on_error
+        self.clock = clock
+        self._send = None
+        self._cond = threading.Condition(threading.Lock())
+        self._sending = threading.Lock()
+        self._pending = {} # simplegeohandle -> (first buffered, feature)
+        self._closed = False
+        self._thread = None
+        self.updates = 0
+        self.writes = 0
+        self.failed = 0
+        self.saved = 0
+
+    def start(self, send):
+        """ Start the background thread, which sends the updates by
+        calling send(features, concurrency), which returns an iterable
+        of Outcomes. Client does this. """
+        precondition(self._send is None, "A WriteBehind can only be used by one Client.")
+        self._send = send
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, feature):
+        """ Buffer an update of feature, replacing any buffered update
+        of the same feature. """
+        self._cond.acquire()
+        try:
+            precondition(not self._closed, "This WriteBehind has been closed.")
+            self.updates += 1
+            old = self._pending.get(feature.id)
+            if old is None:
+                self._pending[feature.id] = (self.clock(), feature)
+            else:
+                # It keeps its place in the queue.
+                self.saved += 1
+                self._pending[feature.id] = (old[0], feature)
+            # Wake the thread for a new handle, so that it works out
+            # when the new update is due.
+            if old is None or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        finally:
+            self._cond.release()
+
+    def _take(self, everything):
+        """ Remove and return the buffered features which are due to be
+        sent, or all of them if everything is True. """
+        self._cond.acquire()
+        try:
+            if everything or len(self._pending) >= self.batch_size:
+                due = self._pending.keys()
+            else:
+                cutoff = self.clock() - self.delay
+                due = [handle for (handle, (buffered, feature)) in self._pending.iteritems() if buffered <= cutoff]
+            return [self._pending.pop(handle)[1] for handle in due]
+        finally:
+            self._cond.release()
+
+    def _write(self, everything):
+        self._sending.acquire()
+        try:
+            features = self._take(everything)
+            if not features:
+                return
+            for outcome in self._send(features, self.concurrency):
+                self._cond.acquire()
+                try:
+                    self.writes += 1
+                    if not outcome.ok:
+                        self.failed += 1
+                finally:
+                    self._cond.release()
+                if not outcome.ok and self.on_error is not None:
+                    try:
+                        self.on_error(outcome)
+                    except Exception:
+                        # Don't let a bug in on_error lose the rest of
+                        # the batch.
+                        pass
+        finally:
+            self._sending.release()
+
+    def _run(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while not self._closed:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._pending:
+                        wait = min(buffered for (buffered, feature) in self._pending.itervalues()) + self.delay - self.clock()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            finally:
+                self._cond.release()
+            self._write(False)
+
+    def flush(self):
+        """ Send all of the buffered updates, and return when they have
+        been sent. """
+        self._write(True)
+
+    def close(self):
+        """ Flush, and stop the background thread. Further updates are
+        refused. """
+        self._cond.acquire()
+        try:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        finally:
+            self._cond.release()
+        if self._send is not None:
+            self.flush()
+
+    def stats(self):
+        """ Return a dict of the number of updates buffered, the number
+        of writes sent, how many of those failed, how many updates are
+        still buffered, and how many writes were saved by coalescing
+        updates of the same feature. """
+        self._cond.acquire()
+        try:
+            return {
+                'updates': self.updates,
+                'writes': self.writes,
+                'failed': self.failed,
+                'pending': len(self._pending),
+                'saved': self.saved,
+                }
+        finally:
+            self._cond.release()